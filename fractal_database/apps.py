@@ -14,19 +14,41 @@ class FractalDatabaseConfig(AppConfig):
     name = "fractal_database"
 
     def ready(self):
-        from fractal_database.models import Database, Device, ReplicatedModel
+        from fractal_database.models import (
+            Database,
+            DatabaseConfig,
+            Device,
+            InstanceTarget,
+            ReplicatedModel,
+            target_registry,
+        )
+        from fractal_database.replication.graph import compile_relationship_plans
         from fractal_database.signals import (
             create_database_and_matrix_replication_target,
             initialize_fractal_app_catalog,
             join_device_to_database,
             register_device_account,
+            remove_instance_target_index,
             schedule_replication_on_m2m_change,
+            update_instance_target_index,
             upload_exported_apps,
         )
 
         #   Assert that fractal_database is last in INSTALLED_APPS
         self._assert_installation_order()
 
+        # precompute the relationships of every replicated model and the order they load in
+        compile_relationship_plans()
+
+        # maintain the instance -> target index used by ReplicatedModel.replication_targets.
+        # connected first so that the replication signals below see an up to date index
+        for model in target_registry.target_types:
+            models.signals.m2m_changed.connect(
+                update_instance_target_index, sender=model.instances.through
+            )
+            models.signals.post_delete.connect(remove_instance_target_index, sender=model)
+        models.signals.post_migrate.connect(InstanceTarget.rebuild, sender=self)
+
         models.signals.m2m_changed.connect(
             join_device_to_database, sender=Database.devices.through
         )
@@ -47,6 +69,25 @@ class FractalDatabaseConfig(AppConfig):
 
         models.signals.post_migrate.connect(upload_exported_apps, sender=self)
 
+        # invalidate the cached DatabaseConfig whenever the objects it caches change.
+        # post_migrate covers flush, which deletes rows without sending signals
+        cached_models = [DatabaseConfig, Database, Device, *Device.get_subclasses()]
+        for model_name in ["MatrixReplicationTarget", "MatrixCredentials"]:
+            try:
+                cached_models.append(self.apps.get_model("fractal_database_matrix", model_name))
+            except LookupError:
+                pass
+        for model in cached_models:
+            models.signals.post_save.connect(DatabaseConfig.invalidate_cache, sender=model)
+            models.signals.post_delete.connect(DatabaseConfig.invalidate_cache, sender=model)
+        models.signals.post_migrate.connect(DatabaseConfig.invalidate_cache)
+
+        # same for the targets cached by the target registry
+        for model in [*target_registry.target_types, *cached_models]:
+            models.signals.post_save.connect(target_registry.invalidate, sender=model)
+            models.signals.post_delete.connect(target_registry.invalidate, sender=model)
+        models.signals.post_migrate.connect(target_registry.invalidate)
+
         # connect the signal to register the device account for the Device model and its subclasses
         models.signals.post_save.connect(register_device_account, sender=Device)
         for model in Device.get_subclasses():
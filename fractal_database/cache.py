@@ -0,0 +1,188 @@
+import copy
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+
+_MISSING = object()
+
+
+def copy_cached_instance(instance: Optional[Any]) -> Optional[Any]:
+    """
+    Returns a copy of a cached model instance that shares no mutable state with it, so that
+    changes made by the caller (ie to a JSON field) never leak into the cache. Related objects
+    loaded with select_related and prefetch_related are copied as well, and stay loaded.
+
+    Args:
+        instance: The cached model instance.
+    """
+    if instance is None:
+        return None
+    copied = copy.copy(instance)
+    for name, value in copied.__dict__.items():
+        if not name.startswith("_") and isinstance(value, (dict, list)):
+            copied.__dict__[name] = copy.deepcopy(value)
+    copied._state.fields_cache = {
+        name: copy_cached_instance(related)
+        for name, related in copied._state.fields_cache.items()
+    }
+    prefetched = copied.__dict__.get("_prefetched_objects_cache")
+    if prefetched:
+        copied._prefetched_objects_cache = {}
+        for name, queryset in prefetched.items():
+            clone = queryset._chain()
+            clone._result_cache = [copy_cached_instance(obj) for obj in queryset._result_cache]
+            clone._prefetch_done = True
+            copied._prefetched_objects_cache[name] = clone
+    return copied
+
+
+class CommittedCache:
+    """
+    Process wide, thread safe cache of values loaded from the database.
+
+    A value loaded outside of a transaction is cached right away. A value loaded inside of a
+    transaction is only shared with other threads once the transaction commits, so data from
+    a transaction that is rolled back is never served to them. Until then it is served to the
+    rest of the transaction from a cache of its own, which is dropped if the transaction (or
+    the savepoint that loaded the first value) is rolled back. invalidate() clears the cache
+    right away and again when the current transaction commits, so values loaded by other
+    threads before the commit aren't kept around either.
+
+    The cache is per process. Changes committed by other processes (ie the replication worker
+    applying replicated fixtures) are only seen once this process invalidates the cache, or
+    once the cached value expires if the cache has a ttl.
+    """
+
+    def __init__(self, ttl: Optional[Callable[[], Optional[float]]] = None):
+        """
+        Args:
+            ttl: Returns the number of seconds that a value is served for, or None to serve it
+                until the cache is invalidated. Values never expire if not provided.
+        """
+        self._lock = threading.Lock()
+        self._ttl = ttl
+        # key -> (value, time.monotonic() when it was stored)
+        self._values: Dict[Hashable, Tuple[Any, float]] = {}
+        # bumped on every invalidation so that stale loads aren't stored
+        self._generation = 0
+        # (values, on_commit handler, generation) of the current transaction of each thread
+        self._transaction = threading.local()
+        self.hits = 0
+        self.misses = 0
+
+    def _get(self, key: Hashable) -> Any:
+        ttl = self._ttl() if self._ttl is not None else None
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                return _MISSING
+            value, stored_at = entry
+            if ttl is not None and time.monotonic() - stored_at >= ttl:
+                del self._values[key]
+                return _MISSING
+            self.hits += 1
+            return value
+
+    def _get_transaction_values(self) -> Optional[Dict[Hashable, Any]]:
+        """
+        Returns the values loaded in the current transaction of this thread, creating them on
+        the first call in the transaction. Returns None outside of a transaction, and for the
+        rest of a transaction once it invalidates the cache.
+        """
+        connection = transaction.get_connection()
+        if not connection.in_atomic_block:
+            return None
+
+        state = getattr(self._transaction, "state", None)
+        if state is not None:
+            # the handler is dropped when the transaction or savepoint it was registered in
+            # is rolled back, and the values are stale once the cache is invalidated
+            if state[2] == self._generation and any(
+                handler[1] is state[1] for handler in connection.run_on_commit
+            ):
+                return state[0]
+            self._transaction.state = None
+
+        if any(handler[1] == self.clear for handler in connection.run_on_commit):
+            return None
+
+        values: Dict[Hashable, Any] = {}
+        generation = self._generation
+
+        def _store():
+            self._transaction.state = None
+            stored_at = time.monotonic()
+            with self._lock:
+                if generation == self._generation:
+                    self._values.update(
+                        (key, (value, stored_at)) for key, value in values.items()
+                    )
+
+        self._transaction.state = (values, _store, generation)
+        transaction.on_commit(_store)
+        return values
+
+    def get_or_load(self, key: Hashable, load: Callable[[], Any]) -> Any:
+        """
+        Returns the cached value for key, calling load to load it on a miss.
+
+        Args:
+            key: The key of the value.
+            load: Callable that loads the value from the database.
+        """
+        value = self._get(key)
+        if value is not _MISSING:
+            return value
+
+        values = self._get_transaction_values()
+        if values is not None and key in values:
+            with self._lock:
+                self.hits += 1
+            return values[key]
+
+        with self._lock:
+            self.misses += 1
+            generation = self._generation
+
+        value = load()
+
+        if values is not None:
+            values[key] = value
+        elif not transaction.get_connection().in_atomic_block:
+            with self._lock:
+                if generation == self._generation:
+                    self._values[key] = (value, time.monotonic())
+        return value
+
+    async def aget_or_load(self, key: Hashable, load: Callable[[], Any]) -> Any:
+        """
+        Async version of get_or_load. Cache hits are served without leaving the event loop.
+        """
+        value = self._get(key)
+        if value is not _MISSING:
+            return value
+        return await sync_to_async(self.get_or_load)(key, load)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+            self._generation += 1
+
+    def invalidate(self, *args, **kwargs) -> None:
+        """
+        Clears the cache now and once the current transaction commits. Accepts and ignores
+        any arguments so that it can be connected to signals directly.
+        """
+        self.clear()
+        if transaction.get_connection().in_atomic_block:
+            transaction.on_commit(self.clear)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns the number of cache hits and misses.
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
@@ -0,0 +1,76 @@
+import lzma
+import zlib
+from typing import Optional, Union
+
+from django.conf import settings
+
+# Stored values start with a header byte naming how they were compressed. Values without one
+# are plain JSON (ie stored while compression was disabled), which never starts with these bytes.
+ZLIB_V1 = b"\x01"
+LZMA = b"\x02"
+
+# Primes zlib with the strings that every serialized object repeats, most frequent last.
+# Values compressed with a dictionary can only be decompressed with the same dictionary,
+# so this must never change. Add a new version with its own header byte instead.
+ZLIB_DICTIONARY_V1 = (
+    b'"registration_token":"","homeserver":"http://","access_token":"","room_id":"!'
+    b'"url":"","sync_token":"","app_ids":[],"git_url":"https://","checksum":"","public":true,'
+    b'"display_name":"","owner_matrix_id":"@","target_state":"stopped","compose_file":"'
+    b'"current_device":"","app_instance_id":"","app":"","is_root":false,"description":null,'
+    b'"enabled":true,"filter":null,"primary":true,"metadata":{},"instances":[],"devices":[],'
+    b'"object_id":"","content_type":,"database":"","name":"",'
+    b"fractal_database_matrix.matrixreplicationtarget,fractal_database.appinstanceconfig,"
+    b"fractal_database.app,fractal_database.appcatalog,fractal_database.device,"
+    b"fractal_database.replicatedinstanceconfig,fractal_database.database,"
+    b'"base_version":,"object_version":,"deleted":false,'
+    b'"date_modified":"2024-01-01T00:00:00.000Z",'
+    b'{"model":"fractal_database.","pk":"00000000-0000-0000-0000-000000000000",'
+    b'"fields":{"date_created":"2024-01-01T00:00:00.000Z",'
+)
+
+_LZMA_FILTERS = [{"id": lzma.FILTER_LZMA2, "preset": 6}]
+
+
+def payload_compression() -> Optional[str]:
+    """
+    Returns how stored replication payloads and representation metadata are compressed:
+    "zlib", "lzma" or None to store plain JSON. Values are always readable no matter how
+    this is set. Set with settings.FRACTAL_DATABASE_PAYLOAD_COMPRESSION.
+    """
+    return getattr(settings, "FRACTAL_DATABASE_PAYLOAD_COMPRESSION", None)
+
+
+def compress(value: bytes, method: Optional[str] = None) -> bytes:
+    """
+    Compresses the provided JSON bytes with the configured compression.
+
+    Args:
+        value: The JSON bytes to compress.
+        method: "zlib", "lzma" or None. Defaults to payload_compression().
+    """
+    method = payload_compression() if method is None else method
+    if method is None:
+        return value
+    if method == "zlib":
+        compressor = zlib.compressobj(wbits=-zlib.MAX_WBITS, zdict=ZLIB_DICTIONARY_V1)
+        return ZLIB_V1 + compressor.compress(value) + compressor.flush()
+    if method == "lzma":
+        return LZMA + lzma.compress(value, format=lzma.FORMAT_RAW, filters=_LZMA_FILTERS)
+    raise ValueError(f"Unsupported payload compression: {method}")
+
+
+def decompress(value: Union[bytes, memoryview]) -> bytes:
+    """
+    Returns the JSON bytes of a value stored with compress.
+
+    Args:
+        value: The stored value.
+    """
+    value = bytes(value)
+    header, body = value[:1], value[1:]
+    if header == ZLIB_V1:
+        decompressor = zlib.decompressobj(wbits=-zlib.MAX_WBITS, zdict=ZLIB_DICTIONARY_V1)
+        return decompressor.decompress(body) + decompressor.flush()
+    if header == LZMA:
+        return lzma.decompress(body, format=lzma.FORMAT_RAW, filters=_LZMA_FILTERS)
+    return value
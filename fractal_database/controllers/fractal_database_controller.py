@@ -5,6 +5,7 @@ import os
 import socket
 import subprocess
 import sys
+import tempfile
 from functools import partial
 from sys import exit
 from typing import Any, Dict, Optional
@@ -25,15 +26,14 @@ from fractal.matrix import MatrixClient
 from fractal.matrix.utils import parse_matrix_id
 from fractal_database.utils import init_poetry_project, use_django
 from nio import (
+    DownloadError,
     InviteInfo,
     InviteMemberEvent,
     InviteNameEvent,
     RoomGetStateEventError,
+    RoomPutStateError,
     TransferMonitor,
 )
-from taskiq.receiver.receiver import Receiver
-from taskiq.result_backends.dummy import DummyResultBackend
-from taskiq_matrix.matrix_queue import Task
 
 GIT_ORG_PATH = "https://github.com/fractalnetworksco"
 DEFAULT_FRACTAL_SRC_DIR = os.path.join(data_dir, "src")
@@ -172,70 +172,110 @@ class FractalDatabaseController(AuthenticatedController):
 
         return None
 
-    async def _sync_data(self, room_id: str) -> None:
+    async def _sync_data(self, room_id: str, restart: bool = False) -> None:
         """
-        Syncs all replication tasks from the epoch of a given room_id.
+        Syncs all replication tasks of a given room_id. Resumes from where the
+        last sync of the room left off unless restart is True.
 
         NOTE: Ensure before calling this function that the appropriate
               MATRIX_ROOM_iD environment variable is set.
 
         Args:
             room_id: The room ID to sync from.
+            restart: Whether or not to sync from the beginning of the room.
         """
         os.environ["MATRIX_ROOM_ID"] = room_id
 
+        from fractal_database.models import SyncCheckpoint
+        from fractal_database.replication.bootstrap import RoomSync
         from fractal_database_matrix.broker import broker
 
-        # FIXME: create_filter should be moved onto the FractalAsyncClient
-        from taskiq_matrix.filters import create_room_message_filter
-
         # intialize a matrix broker in order to sync tasks.
         broker._init_queues()
 
-        # set the replication queue's checkpoint to None so that we can sync
-        # from the beginning of the room
-        broker.replication_queue.checkpoint.since_token = None
-        # dont need results for syncing tasks
-        broker.result_backend = DummyResultBackend()  # type: ignore
-        receiver = Receiver(broker=broker)
+        # new devices restore the newest snapshot and only replay the tasks after it
+        if restart or not await SyncCheckpoint.objects.filter(room_id=room_id).aexists():
+            if await self._restore_snapshot(room_id):
+                restart = False
 
-        while True:
-            task_filter = create_room_message_filter(
-                room_id, types=[broker.replication_queue.task_types.task]
-            )
-            tasks = await broker.replication_queue.get_tasks(timeout=0, task_filter=task_filter)
-            print(f"Got tasks: {len(tasks)}")
-            if not tasks:
-                print("No more tasks")
-                break
-
-            # merge all replicated tasks into a single "merged" task
-            # this prevents us from having to run each individual task
-            merged_task: Optional[Task] = None
-            fixture = []
+        synced = await RoomSync(room_id, broker.replication_queue).run(restart=restart)
+        print(f"Synced {synced} objects")
 
-            # FIXME: this assumes that all of the tasks received are the
-            # same task. Should probably handle specifically the replicate_fixture
-            # task.
-            for task in tasks:
-                if not merged_task:
-                    merged_task = task
+    async def _get_sync_token(self, room_id: str) -> str:
+        """
+        Returns the sync token up to which the replication tasks of the given room
+        have been applied to the local database. Only reads the room's SyncCheckpoint,
+        so that taking a snapshot never initializes the room's replication queue.
 
-                data = json.loads(task.data["args"][0])  # type: ignore
-                for item in data:
-                    fixture.append(item)
+        Args:
+            room_id: The room ID of the database.
+        """
+        from fractal_database.models import SyncCheckpoint
 
-            merged_task.data["args"][0] = json.dumps(fixture)  # type:ignore
+        checkpoint = await SyncCheckpoint.objects.filter(room_id=room_id).afirst()
+        if not checkpoint or not checkpoint.since_token:
+            raise Exception(
+                f"No sync checkpoint found for {room_id}. Run `fractal db sync` first so the "
+                "snapshot's sync token matches the data it contains"
+            )
+        return checkpoint.since_token
 
-            # keep syncing until we get no more tasks
-            print(f"Got {len(tasks)} tasks")
-            with open("tmp-fixture.json", "a") as f:
-                f.write(json.dumps(fixture, indent=4))
+    async def _put_snapshot_state(self, room_id: str, fixture: str) -> None:
+        from fractal_database.replication.snapshot import SNAPSHOT_STATE_TYPE
 
-            ackable_task = await broker.replication_queue.yield_task(
-                merged_task, ignore_acks=True, lock=False
+        async with MatrixClient(homeserver_url=self.homeserver_url, access_token=self.access_token) as client:  # type: ignore
+            res = await client.room_put_state(
+                room_id, SNAPSHOT_STATE_TYPE, content={"fixture": fixture}
             )
-            await receiver.callback(ackable_task)
+            if isinstance(res, RoomPutStateError):
+                raise Exception(res.message)
+
+    async def _restore_snapshot(self, room_id: str) -> bool:
+        """
+        Restores the newest snapshot of the database in the given room into the local
+        database and checkpoints the room at the snapshot's sync token.
+
+        Args:
+            room_id: The room ID to restore the snapshot of.
+
+        Returns:
+            True if a snapshot was restored, False if the database has no snapshot.
+        """
+        from fractal_database.models import SyncCheckpoint
+        from fractal_database.replication.snapshot import (
+            SNAPSHOT_STATE_TYPE,
+            restore_snapshot,
+        )
+        from fractal_database.replication.tasks import load_data_from_dicts
+
+        async with MatrixClient(homeserver_url=self.homeserver_url, access_token=self.access_token) as client:  # type: ignore
+            res = await client.room_get_state_event(room_id, SNAPSHOT_STATE_TYPE)
+            if isinstance(res, RoomGetStateEventError):
+                print(f"No snapshot found for {room_id}, replaying all tasks")
+                return False
+
+            fixture = res.content["fixture"]
+            try:
+                snapshot = json.loads(fixture)[0]["fields"]
+            except Exception as e:
+                raise Exception(f"Failed to parse snapshot fixture: {e}")
+
+            print(f"Restoring snapshot {snapshot['url']}...")
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                path = os.path.join(tmp_dir, "snapshot.jsonl.gz")
+                res = await client.download(mxc=snapshot["url"], save_to=path)  # type: ignore
+                if isinstance(res, DownloadError):
+                    raise Exception(f"Failed to download snapshot: {res.message}")
+                restored = await sync_to_async(restore_snapshot)(path)
+
+        # load the snapshot itself and continue syncing from where the snapshot left off
+        await sync_to_async(load_data_from_dicts)(fixture)
+        await SyncCheckpoint.objects.aupdate_or_create(
+            room_id=room_id,
+            defaults={"since_token": snapshot["sync_token"], "last_task_id": None},
+        )
+        print(f"Restored {restored} objects from snapshot")
+        return True
 
     # async def _download_file(
     #     self, mxc_uri: str, save_path: os.PathLike, monitor: Optional[TransferMonitor] = None
@@ -365,6 +405,9 @@ class FractalDatabaseController(AuthenticatedController):
         # sync primary replication target from room state
         asyncio.run(self._sync_database_metadata(room_id))
 
+        # restore the newest snapshot of the database and replay the tasks after it
+        self.sync(room_id)
+
         print(f"Successfully joined {room_id}")
 
     @cli_method
@@ -900,13 +943,14 @@ RUN fractal db init --app {name} --project-name {project_name}_app --no-migrate
     @use_django
     @auth_required
     @cli_method
-    def sync(self, room_id: str, **kwargs):
+    def sync(self, room_id: str, restart: bool = False, **kwargs):
         """
-        Syncs replication tasks from the epoch of a given room.
+        Syncs replication tasks of a given room. Resumes from the last sync of the room.
 
         ---
         Args:
             room_id: The room ID to sync from.
+            restart: Sync from the newest snapshot (or the epoch) of the room instead of resuming.
         """
         os.environ["MATRIX_ROOM_ID"] = room_id
 
@@ -914,7 +958,52 @@ RUN fractal db init --app {name} --project-name {project_name}_app --no-migrate
         # is aware of it when we start syncing tasks
         from fractal_database.replication.tasks import replicate_fixture
 
-        asyncio.run(self._sync_data(room_id))
+        asyncio.run(self._sync_data(room_id, restart=restart))
+
+    @use_django
+    @auth_required
+    @cli_method
+    def snapshot(self, **kwargs):
+        """
+        Dumps the current database into a compressed snapshot and uploads it. Devices that
+        sync the database restore the newest snapshot instead of replaying every task.
+        ---
+        Args:
+        """
+        from fractal_database.models import Database, Snapshot
+        from fractal_database.replication.snapshot import dump_snapshot
+
+        try:
+            database = Database.current_db()
+        except Database.DoesNotExist:
+            print("No current database configured. Have you applied migrations?")
+            exit(1)
+
+        primary_target = database.primary_target()
+        room_id = primary_target.metadata.get("room_id") if primary_target else None
+        if not room_id:
+            print(
+                f"Failed to find room_id for database {database.name} primary target: {primary_target}"
+            )
+            exit(1)
+
+        # the token is fetched before dumping so that the snapshot contains everything
+        # before it. Tasks after it that made it into the snapshot are skipped when replayed.
+        try:
+            sync_token = asyncio.run(self._get_sync_token(room_id))
+        except Exception as e:
+            print(e)
+            exit(1)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, f"{database.name}-snapshot.jsonl.gz")
+            num_objects = dump_snapshot(path, database)
+            url = self.upload(path, verbose=False)
+
+        snapshot = Snapshot.objects.create(url=url, sync_token=sync_token)
+        asyncio.run(self._put_snapshot_state(room_id, snapshot.to_fixture(json=True)))  # type: ignore
+
+        print(f"Created snapshot of {num_objects} objects at sync token {sync_token}")
 
     @use_django
     @auth_required
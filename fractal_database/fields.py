@@ -1,8 +1,12 @@
+import json
 import uuid
 
 from django.db import models
 from django.db.backends.base.operations import BaseDatabaseOperations
 from django.db.models import AutoField, UUIDField
+from django.db.models.query_utils import DeferredAttribute
+
+from .compression import compress, decompress
 
 
 class SingletonField(models.BooleanField):
@@ -18,6 +22,82 @@ class SingletonField(models.BooleanField):
         return value
 
 
+class CompressedJSONAttribute(DeferredAttribute):
+    """
+    Decodes the stored bytes of a CompressedJSONField the first time the attribute is read.
+    """
+
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        value = super().__get__(instance, cls)
+        if isinstance(value, (bytes, memoryview)):
+            value = instance.__dict__[self.field.attname] = self.field.decode(value)
+        return value
+
+    def __set__(self, instance, value):
+        # a data descriptor, so that reads of the stored bytes go through __get__
+        instance.__dict__[self.field.attname] = value
+
+
+class CompressedJSONField(models.BinaryField):
+    """
+    A JSON field that is stored as JSON bytes, compressed according to
+    settings.FRACTAL_DATABASE_PAYLOAD_COMPRESSION (see fractal_database.compression).
+
+    Values are decompressed and decoded lazily, the first time the attribute is read on an
+    instance.
+
+    Unlike JSONField, the column stores bytes even when compression is disabled, and only the
+    attribute decodes them. values() and values_list() therefore return the stored bytes
+    (decode them with decode), and JSON lookups and transforms (ie data__name) aren't
+    supported.
+    """
+
+    descriptor_class = CompressedJSONAttribute
+
+    def __init__(self, *args, encoder=None, **kwargs):
+        self.encoder = encoder
+        kwargs.setdefault("editable", True)
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.encoder is not None:
+            kwargs["encoder"] = self.encoder
+        if self.editable:
+            del kwargs["editable"]
+        else:
+            kwargs["editable"] = False
+        return name, path, args, kwargs
+
+    def decode(self, value):
+        """
+        Returns the JSON value of the provided stored bytes.
+        """
+        if not value:
+            return None
+        return json.loads(decompress(value))
+
+    def get_prep_value(self, value):
+        if value is None:
+            return None
+        return compress(json.dumps(value, cls=self.encoder, separators=(",", ":")).encode())
+
+    def get_default(self):
+        if self.has_default():
+            return models.Field.get_default(self)
+        return None
+
+    def to_python(self, value):
+        if isinstance(value, (bytes, memoryview)):
+            return self.decode(value)
+        return value
+
+    def value_to_string(self, obj):
+        return self.value_from_object(obj)
+
+
 BaseDatabaseOperations.integer_field_ranges["UUIDField"] = (0, 0)
 
 
@@ -0,0 +1,80 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+from fractal_database.replication.archive import LogArchive
+from fractal_database.replication.compaction import compact_replication_logs
+
+
+class Command(BaseCommand):
+    help = (
+        "Deletes delivered replication logs, applied representation logs and unused replication "
+        "payloads that are older than the retention window. The database is vacuumed when asked "
+        "to, or once its free pages pass settings.FRACTAL_DATABASE_LOG_COMPACTION_VACUUM_THRESHOLD."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--retention",
+            type=float,
+            default=None,
+            help="Number of seconds to keep delivered logs for. "
+            "Defaults to settings.FRACTAL_DATABASE_LOG_RETENTION (7 days).",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=None,
+            help="Number of rows to delete per transaction. "
+            "Defaults to settings.FRACTAL_DATABASE_LOG_COMPACTION_BATCH_SIZE (1000).",
+        )
+        vacuum = parser.add_mutually_exclusive_group()
+        vacuum.add_argument(
+            "--vacuum",
+            action="store_true",
+            help="VACUUM and ANALYZE the database after deleting (SQLite only).",
+        )
+        vacuum.add_argument(
+            "--no-vacuum",
+            action="store_true",
+            help="Don't VACUUM the database after deleting, even past the vacuum threshold.",
+        )
+        parser.add_argument(
+            "--archive-dir",
+            default=None,
+            help="Directory to archive the delivered logs to before they are deleted. "
+            "Defaults to settings.FRACTAL_DATABASE_LOG_ARCHIVE_DIR (no archiving if unset).",
+        )
+        parser.add_argument(
+            "--database",
+            default=DEFAULT_DB_ALIAS,
+            help='Nominates a database to compact. Defaults to the "default" database.',
+        )
+
+    def handle(self, *args, **options):
+        if options["retention"] is not None and options["retention"] < 0:
+            raise CommandError("--retention can't be negative.")
+        if options["batch_size"] is not None and options["batch_size"] < 1:
+            raise CommandError("--batch-size must be at least 1.")
+
+        archive = None
+        if options["archive_dir"]:
+            archive = LogArchive(options["archive_dir"]).append
+
+        vacuum = None
+        if options["vacuum"]:
+            vacuum = True
+        elif options["no_vacuum"]:
+            vacuum = False
+
+        report = compact_replication_logs(
+            retention=options["retention"],
+            batch_size=options["batch_size"],
+            vacuum=vacuum,
+            archive=archive,
+            using=options["database"],
+        )
+
+        self.stdout.write(f"Deleted {report['replication_logs']} replication logs")
+        self.stdout.write(f"Deleted {report['representation_logs']} representation logs")
+        self.stdout.write(f"Deleted {report['replication_payloads']} replication payloads")
+        if report["bytes_reclaimed"] is not None:
+            self.stdout.write(f"Reclaimed {report['bytes_reclaimed']} bytes")
@@ -0,0 +1,44 @@
+import django.core.serializers.json
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('fractal_database', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReplicationPayload',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+                ('date_modified', models.DateTimeField(auto_now=True)),
+                ('deleted', models.BooleanField(default=False)),
+                ('object_id', models.CharField(max_length=255)),
+                ('object_version', models.PositiveIntegerField(default=0)),
+                ('data', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='%(app_label)s_%(class)s_content_type', to='contenttypes.contenttype')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='replicationpayload',
+            constraint=models.UniqueConstraint(fields=('content_type', 'object_id', 'object_version'), name='unique_replication_payload_per_version'),
+        ),
+        migrations.AddField(
+            model_name='replicationlog',
+            name='shared_payload',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='replication_logs', to='fractal_database.replicationpayload'),
+        ),
+        # nullable so that reversing 0004_replicationlog_payload can add it back to existing logs
+        # before 0003_move_replication_payloads copies their payloads back onto them
+        migrations.AlterField(
+            model_name='replicationlog',
+            name='payload',
+            field=models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder, null=True),
+        ),
+    ]
@@ -0,0 +1,47 @@
+from django.db import migrations
+
+
+def move_payloads(apps, schema_editor):
+    """
+    Moves the payload stored on every ReplicationLog into a shared ReplicationPayload.
+    """
+    ReplicationLog = apps.get_model("fractal_database", "ReplicationLog")
+    ReplicationPayload = apps.get_model("fractal_database", "ReplicationPayload")
+
+    for log in ReplicationLog.objects.filter(content_type__isnull=False).iterator():
+        payload, _ = ReplicationPayload.objects.get_or_create(
+            content_type_id=log.content_type_id,
+            object_id=log.object_id,
+            object_version=log.instance_version,
+            defaults={"data": log.payload},
+        )
+        log.shared_payload = payload
+        log.save(update_fields=["shared_payload"])
+
+    # logs without an instance cannot be pushed anyways
+    ReplicationLog.objects.filter(shared_payload__isnull=True).delete()
+
+
+def restore_payloads(apps, schema_editor):
+    """
+    Copies the shared ReplicationPayload of every ReplicationLog back onto the log.
+    """
+    ReplicationLog = apps.get_model("fractal_database", "ReplicationLog")
+
+    logs = ReplicationLog.objects.filter(shared_payload__isnull=False).select_related(
+        "shared_payload"
+    )
+    for log in logs.iterator():
+        log.payload = log.shared_payload.data
+        log.save(update_fields=["payload"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("fractal_database", "0002_replicationpayload"),
+    ]
+
+    operations = [
+        migrations.RunPython(move_payloads, restore_payloads),
+    ]
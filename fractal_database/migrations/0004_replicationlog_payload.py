@@ -0,0 +1,26 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fractal_database', '0003_move_replication_payloads'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='replicationlog',
+            name='payload',
+        ),
+        migrations.RenameField(
+            model_name='replicationlog',
+            old_name='shared_payload',
+            new_name='payload',
+        ),
+        migrations.AlterField(
+            model_name='replicationlog',
+            name='payload',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='replication_logs', to='fractal_database.replicationpayload'),
+        ),
+    ]
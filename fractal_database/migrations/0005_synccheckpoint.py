@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:45
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("fractal_database", "0004_replicationlog_payload"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SyncCheckpoint",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                ("date_created", models.DateTimeField(auto_now_add=True)),
+                ("date_modified", models.DateTimeField(auto_now=True)),
+                ("deleted", models.BooleanField(default=False)),
+                ("room_id", models.CharField(max_length=255, unique=True)),
+                (
+                    "since_token",
+                    models.CharField(blank=True, max_length=255, null=True),
+                ),
+                (
+                    "last_task_id",
+                    models.CharField(blank=True, max_length=255, null=True),
+                ),
+            ],
+            options={
+                "abstract": False,
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("fractal_database", "0006_instancetarget"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="replicationlog",
+            name="payload",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="replication_logs",
+                to="fractal_database.replicationpayload",
+            ),
+        ),
+    ]
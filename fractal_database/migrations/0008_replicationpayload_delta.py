@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:16
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("fractal_database", "0007_replicationlog_deferred_payload"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="replicationpayload",
+            name="delta",
+            field=models.JSONField(
+                blank=True,
+                encoder=django.core.serializers.json.DjangoJSONEncoder,
+                null=True,
+            ),
+        ),
+    ]
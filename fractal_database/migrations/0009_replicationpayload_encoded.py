@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("fractal_database", "0008_replicationpayload_delta"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="replicationpayload",
+            name="encoded",
+            field=models.BinaryField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,90 @@
+import django.core.serializers.json
+from django.db import migrations, models
+
+import fractal_database.fields
+
+COMPRESSED_FIELDS = [
+    ("replicationpayload", "data"),
+    ("replicationpayload", "delta"),
+    ("representationlog", "metadata"),
+]
+
+
+def _copy_fields(apps, from_suffix: str, to_suffix: str) -> None:
+    for model_name, field in COMPRESSED_FIELDS:
+        model = apps.get_model("fractal_database", model_name)
+        batch = []
+        for obj in model.objects.iterator(chunk_size=1000):
+            setattr(obj, f"{field}{to_suffix}", getattr(obj, f"{field}{from_suffix}"))
+            batch.append(obj)
+            if len(batch) == 1000:
+                model.objects.bulk_update(batch, [f"{field}{to_suffix}"])
+                batch = []
+        if batch:
+            model.objects.bulk_update(batch, [f"{field}{to_suffix}"])
+
+
+def compress_fields(apps, schema_editor):
+    _copy_fields(apps, "_json", "")
+
+
+def decompress_fields(apps, schema_editor):
+    _copy_fields(apps, "", "_json")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("fractal_database", "0009_replicationpayload_encoded"),
+    ]
+
+    # the columns change type, so the values are copied to new columns rather than cast. They
+    # store bytes from here on, even with compression disabled, so values() and values_list()
+    # of these fields return bytes instead of JSON (see CompressedJSONField)
+    operations = [
+        *[
+            migrations.RenameField(model_name=model_name, old_name=field, new_name=f"{field}_json")
+            for model_name, field in COMPRESSED_FIELDS
+        ],
+        # lets the column be added back empty when the migration is reversed
+        migrations.AlterField(
+            model_name="replicationpayload",
+            name="data_json",
+            field=models.JSONField(
+                encoder=django.core.serializers.json.DjangoJSONEncoder, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="replicationpayload",
+            name="data",
+            field=fractal_database.fields.CompressedJSONField(
+                encoder=django.core.serializers.json.DjangoJSONEncoder, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="replicationpayload",
+            name="delta",
+            field=fractal_database.fields.CompressedJSONField(
+                blank=True, encoder=django.core.serializers.json.DjangoJSONEncoder, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="representationlog",
+            name="metadata",
+            field=fractal_database.fields.CompressedJSONField(
+                default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder
+            ),
+        ),
+        migrations.RunPython(compress_fields, decompress_fields),
+        *[
+            migrations.RemoveField(model_name=model_name, name=f"{field}_json")
+            for model_name, field in COMPRESSED_FIELDS
+        ],
+        migrations.AlterField(
+            model_name="replicationpayload",
+            name="data",
+            field=fractal_database.fields.CompressedJSONField(
+                encoder=django.core.serializers.json.DjangoJSONEncoder
+            ),
+        ),
+    ]
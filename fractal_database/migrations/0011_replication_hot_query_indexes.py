@@ -0,0 +1,63 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("contenttypes", "0002_remove_content_type_name"),
+        ("fractal_database", "0010_compressed_json_fields"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="replicationlog",
+            name="fractal_dat_content_59a6e8_idx",
+        ),
+        migrations.AddIndex(
+            model_name="replicatedinstanceconfig",
+            index=models.Index(
+                fields=["content_type", "object_id"],
+                name="fractal_dat_content_0c97b1_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="replicationlog",
+            index=models.Index(
+                fields=["content_type", "object_id", "target_id", "instance_version"],
+                name="fractal_dat_content_66bf54_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="replicationlog",
+            index=models.Index(
+                condition=models.Q(("deleted", False)),
+                fields=["target_type", "target_id", "txn_id", "date_created"],
+                name="replication_log_pending",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="replicationlog",
+            index=models.Index(
+                condition=models.Q(("deleted", True)),
+                fields=["date_created"],
+                name="replication_log_delivered",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="representationlog",
+            index=models.Index(
+                fields=["content_type", "object_id"],
+                name="fractal_dat_content_e93909_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="representationlog",
+            index=models.Index(
+                condition=models.Q(("deleted", True)),
+                fields=["date_created"],
+                name="representation_log_applied",
+            ),
+        ),
+    ]
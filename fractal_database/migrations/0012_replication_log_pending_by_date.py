@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("contenttypes", "0002_remove_content_type_name"),
+        ("fractal_database", "0011_replication_hot_query_indexes"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="replicationlog",
+            name="replication_log_pending",
+        ),
+        migrations.AddIndex(
+            model_name="replicationlog",
+            index=models.Index(
+                condition=models.Q(("deleted", False)),
+                fields=["target_type", "target_id", "date_created"],
+                name="replication_log_pending",
+            ),
+        ),
+    ]
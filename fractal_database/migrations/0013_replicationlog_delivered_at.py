@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("fractal_database", "0012_replication_log_pending_by_date"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="replicationlog",
+            name="delivered_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="replicationlog",
+            name="full",
+            field=models.BooleanField(default=False),
+        ),
+    ]
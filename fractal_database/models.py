@@ -1,9 +1,26 @@
+import copy
+import json
 import logging
+import threading
+from collections import defaultdict
+from datetime import timedelta
 from importlib import import_module
-from typing import TYPE_CHECKING, Any, Dict, List, Optional, Self, Union
+from itertools import groupby
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncIterator,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Self,
+    Tuple,
+    Union,
+)
 from uuid import uuid4
 
-from asgiref.sync import sync_to_async
+from asgiref.sync import async_to_sync, sync_to_async
 from django.apps import apps
 from django.conf import settings
 from django.contrib.contenttypes.fields import GenericForeignKey, GenericRelation
@@ -11,20 +28,43 @@ from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import ObjectDoesNotExist, ValidationError
 from django.core.serializers import serialize
 from django.core.serializers.json import DjangoJSONEncoder
-from django.db import models, transaction
+from django.db import connection, models, transaction
+from django.db.models import Max, Prefetch, Q
 from django.db.models.fields import Field
 from django.db.models.manager import BaseManager
+from django.utils import timezone
 from fractal_database.exceptions import (
     ReplicatedInstanceConfigAlreadyExists,
     StaleObjectException,
 )
+from fractal_database.replication.dispatcher import (
+    background_replication_enabled,
+    get_dispatcher,
+)
+from fractal_database.replication.fixtures import delta_payloads_enabled, encode_delta
+from fractal_database.replication.graph import (
+    get_relationship_plan,
+    replicated_closure,
+    replicated_models,
+)
 from fractal_database.representations import Representation
 
-from .fields import SingletonField
-from .signals import defer_replication
+from .cache import CommittedCache, copy_cached_instance
+from .compression import compress, decompress
+from .fields import CompressedJSONField, SingletonField
+from .signals import (
+    coalesce_replication_logs_enabled,
+    defer_replication,
+    get_transaction_id,
+    get_transaction_logs,
+)
 
 if TYPE_CHECKING:
-    from fractal_database.models import ReplicatedModel, ReplicationLog
+    from fractal_database.models import (
+        ReplicatedModel,
+        ReplicationLog,
+        ReplicationPayload,
+    )
     from fractal_database_matrix.models import (
         MatrixCredentials,
         MatrixReplicationTarget,
@@ -32,6 +72,10 @@ if TYPE_CHECKING:
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_REPLICATION_PAGE_SIZE = 100
+DEFAULT_REPLICATION_MAX_LATENCY = 10.0
+DEFAULT_TARGET_CACHE_TTL = 60.0
+
 
 class BaseModel(models.Model):
     if getattr(settings, "FRACTAL_DATABASE_UUID_PK", False):
@@ -68,6 +112,9 @@ class DatabaseConfig(BaseModel):
     current_db = models.ForeignKey("fractal_database.Database", on_delete=models.CASCADE)
     singleton = SingletonField(unique=True, default=True)
 
+    # process wide cache of the singleton, see get_cached
+    _config_cache = CommittedCache()
+
     class Meta:
         # enforce that only one root=True RootDatabase can exist per RootDatabase
         constraints = [
@@ -78,6 +125,68 @@ class DatabaseConfig(BaseModel):
             )
         ]
 
+    def update(self, **kwargs) -> None:
+        super().update(**kwargs)
+        # queryset updates dont send post_save
+        self.invalidate_cache()
+
+    @classmethod
+    def _load(cls) -> "DatabaseConfig":
+        return (
+            cls.objects.select_related("current_db", "current_device")
+            .prefetch_related(
+                "current_db__matrixreplicationtarget_set",
+                "current_device__matrixcredentials_set",
+            )
+            .get()
+        )
+
+    @classmethod
+    def get_cached(cls) -> "DatabaseConfig":
+        """
+        Returns the DatabaseConfig singleton with its current database and device. The database
+        is only queried the first time and after the cache is invalidated by a save or delete of
+        a DatabaseConfig, Database or Device (see invalidate_cache).
+
+        The cached instance is shared, callers should copy the objects they modify.
+        """
+        return cls._config_cache.get_or_load("config", cls._load)
+
+    @classmethod
+    async def aget_cached(cls) -> "DatabaseConfig":
+        return await cls._config_cache.aget_or_load("config", cls._load)
+
+    @classmethod
+    def invalidate_cache(cls, *args, **kwargs) -> None:
+        """
+        Clears the cached DatabaseConfig. Connected to post_save and post_delete of the models
+        that it caches in fractal_database.apps.FractalDatabaseConfig.ready.
+        """
+        cls._config_cache.invalidate()
+
+    @classmethod
+    def cache_stats(cls) -> Dict[str, int]:
+        """
+        Returns the number of cache hits and misses of get_cached.
+        """
+        return cls._config_cache.stats()
+
+
+class SyncCheckpoint(BaseModel):
+    """
+    Model for storing how far the replication tasks of a room have been synced into the
+    local database, so that an interrupted `fractal db sync` can resume.
+    """
+
+    room_id = models.CharField(max_length=255, unique=True)
+    # pagination token of the page of tasks that is being applied
+    since_token = models.CharField(max_length=255, null=True, blank=True)
+    # id of the last task applied from that page
+    last_task_id = models.CharField(max_length=255, null=True, blank=True)
+
+    def __str__(self) -> str:
+        return f"{self.room_id} (SyncCheckpoint)"
+
 
 class RepresentationLog(BaseModel):
     target = GenericForeignKey("target_type", "target_id")
@@ -95,7 +204,18 @@ class RepresentationLog(BaseModel):
         on_delete=models.CASCADE,
         related_name="%(app_label)s_%(class)s_content_type",
     )
-    metadata = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    metadata = CompressedJSONField(default=dict, encoder=DjangoJSONEncoder)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["content_type", "object_id"]),
+            # applied logs by age (see fractal_database.replication.compaction)
+            models.Index(
+                fields=["date_created"],
+                condition=Q(deleted=True),
+                name="representation_log_applied",
+            ),
+        ]
 
     @classmethod
     def _get_repr_instance(cls, module: str) -> Representation:
@@ -124,6 +244,9 @@ class ReplicatedModel(BaseModel):
     replication_configs = GenericRelation("fractal_database.ReplicatedInstanceConfig")
     replication_logs = GenericRelation("fractal_database.ReplicationLog")
     models = []
+    # number of seconds that the replication logs of this model wait for newer versions of the
+    # same object before they are pushed. Overrides ReplicationTarget.debounce_window
+    replication_debounce: Optional[float] = None
 
     class Meta:
         abstract = True
@@ -134,29 +257,200 @@ class ReplicatedModel(BaseModel):
     async def aget_content_type(self) -> ContentType:
         return await sync_to_async(self.get_content_type)()
 
-    def save(self, *args, **kwargs):
+    @classmethod
+    def single_statement_save(cls) -> bool:
+        """
+        Returns True if saves should bump the object version and guard against stale writes
+        in the same UPDATE statement. Enabled with settings.FRACTAL_DATABASE_SINGLE_STATEMENT_SAVE.
+        """
+        return getattr(settings, "FRACTAL_DATABASE_SINGLE_STATEMENT_SAVE", False)
+
+    @classmethod
+    def skip_unchanged_saves(cls) -> bool:
+        """
+        Returns True if saving an instance whose fields haven't changed since it was loaded should
+        be skipped, so that it doesn't bump the object version, send save signals or schedule
+        replication. Enabled with settings.FRACTAL_DATABASE_SKIP_UNCHANGED_SAVES.
+        """
+        return getattr(settings, "FRACTAL_DATABASE_SKIP_UNCHANGED_SAVES", False)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._snapshot_fields()
+        return instance
+
+    def refresh_from_db(self, *args, **kwargs) -> None:
+        # passed through as is, from_queryset is only accepted by Django 5.1+
+        super().refresh_from_db(*args, **kwargs)
+        self._snapshot_fields(kwargs.get("fields", args[1] if len(args) > 1 else None))
+
+    def _tracked_fields(self, fields: Optional[Iterable[str]] = None) -> List[Field]:
+        """
+        Returns the concrete fields that are compared to detect changes. Fields maintained by
+        fractal_database itself (object_version, date_created and date_modified) are excluded.
+
+        Args:
+            fields: Only return the fields with these names or attnames.
+        """
+        tracked = [
+            field
+            for field in self._meta.concrete_fields
+            if field.name not in {"object_version", "date_created", "date_modified"}
+        ]
+        if fields is None:
+            return tracked
+        fields = set(fields)
+        return [field for field in tracked if field.name in fields or field.attname in fields]
+
+    def _snapshot_fields(self, fields: Optional[Iterable[str]] = None) -> None:
+        """
+        Stores the current value of the tracked fields that are loaded on the instance
+        so they can be compared by get_changed_fields.
+
+        Args:
+            fields: Only snapshot the fields with these names or attnames.
+        """
+        snapshot = {
+            field.attname: copy.deepcopy(self.__dict__[field.attname])
+            for field in self._tracked_fields(fields)
+            if field.attname in self.__dict__
+        }
+        if fields is not None:
+            snapshot = {**self.__dict__.get("_field_snapshot", {}), **snapshot}
+        self._field_snapshot = snapshot
+
+    def get_changed_fields(self, fields: Optional[Iterable[str]] = None) -> set[str]:
+        """
+        Returns the names of the fields whose values differ from when the instance was loaded
+        or last saved. Every loaded field is considered changed if the instance wasn't loaded
+        from the database.
+
+        Args:
+            fields: Only consider the fields with these names or attnames (ie update_fields).
+        """
+        snapshot = None if self._state.adding else self.__dict__.get("_field_snapshot")
+        changed = set()
+        for field in self._tracked_fields(fields):
+            # deferred fields that were never loaded or set can't have changed
+            if field.attname not in self.__dict__:
+                continue
+            if snapshot is None or field.attname not in snapshot:
+                changed.add(field.name)
+            elif snapshot[field.attname] != self.__dict__[field.attname]:
+                changed.add(field.name)
+        return changed
+
+    def save(self, *args, force_replication: bool = False, **kwargs):
         """
         Guards on the object version to ensure that the object version is incremented monotonically
+
+        Saves of instances that haven't changed since they were loaded are skipped when
+        skip_unchanged_saves is enabled. When update_fields is provided, only those fields are
+        compared. Positional arguments are taken in the order of Model.save (force_insert,
+        force_update, using, update_fields).
+
+        Args:
+            force_replication: Save (and replicate) the instance even if none of its fields
+                changed. Used when only its many to many relations changed.
         """
+        # Model.save's positional arguments, so that update_fields is compared when passed
+        # positionally too
+        kwargs.update(zip(("force_insert", "force_update", "using", "update_fields"), args))
+        args = ()
+        if (
+            not force_replication
+            and not kwargs.get("force_insert")
+            and self.skip_unchanged_saves()
+            and not self.get_changed_fields(kwargs.get("update_fields"))
+        ):
+            logger.debug("Skipping save of %s. None of its fields changed" % self)
+            return None
+
         if not transaction.get_connection().in_atomic_block:
             with transaction.atomic():
-                return self.save(*args, **kwargs)
+                return self.save(*args, force_replication=True, **kwargs)
 
-        try:
-            current = type(self).objects.select_for_update().get(pk=self.pk)
-            if self.object_version + 1 <= current.object_version:
-                raise StaleObjectException()
-        except ObjectDoesNotExist:
-            pass
-        super().save(*args, **kwargs)  # Call the "real" save() method.
+        if self.single_statement_save():
+            self._single_statement_save(*args, **kwargs)
+        else:
+            try:
+                current = type(self).objects.select_for_update().get(pk=self.pk)
+                if self.object_version + 1 <= current.object_version:
+                    raise StaleObjectException()
+            except ObjectDoesNotExist:
+                pass
+            super().save(*args, **kwargs)  # Call the "real" save() method.
+        self._snapshot_fields(kwargs.get("update_fields"))
+
+    def _single_statement_save(self, *args, **kwargs) -> None:
+        """
+        Saves the instance with its object version already incremented.
 
-    def replication_targets(self) -> List["MatrixReplicationTarget"]:
-        configs = self.replication_configs.prefetch_related("matrixreplicationtarget_set").filter(
-            object_id=str(self.pk)
-        )
+        Existing rows are written with a single `UPDATE ... WHERE object_version = n` (see
+        _do_update) so the stale object check and the version bump happen in one round trip.
+        object_post_save skips increment_version for instances saved this way.
+        """
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            kwargs["update_fields"] = {*update_fields, "object_version"}
+
+        self._expected_version = None if self._state.adding else self.object_version
+        self._version_incremented = True
+        self.object_version += 1
+        try:
+            super().save(*args, **kwargs)
+        except Exception:
+            # leave the in memory version untouched if the save didn't make it to the database
+            self.object_version -= 1
+            raise
+        finally:
+            self._expected_version = None
+            self._version_incremented = False
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update) -> bool:
+        # private hook of Model._save_table, the Django dependency is pinned to the releases
+        # with this signature (see pyproject.toml)
+        expected_version = getattr(self, "_expected_version", None)
+        if expected_version is None:
+            return super()._do_update(base_qs, using, pk_val, values, update_fields, forced_update)
+
+        if base_qs.filter(pk=pk_val, object_version=expected_version)._update(values) > 0:
+            return True
+
+        # no rows matched. only check why on this (rare) path: if the row exists then it
+        # was updated by someone else, otherwise let Model.save() fall back to an insert
+        if base_qs.filter(pk=pk_val).exists():
+            raise StaleObjectException()
+        return False
+
+    def replication_targets(self) -> List["ReplicationTarget"]:
+        """
+        Returns the targets that this instance has been added to (see ReplicationTarget.add_instance).
+        """
+        keys = InstanceTarget.objects.filter(
+            content_type=self.get_content_type(), object_id=str(self.pk)
+        ).values_list("target_type_id", "target_id")
         targets = []
-        for config in configs:
-            targets.extend(config.matrixreplicationtarget_set.all().distinct())
+        for target_type_id, target_id in dict.fromkeys(keys):
+            target = target_registry.get_target(target_type_id, target_id)
+            if target is not None:
+                targets.append(target)
+        return targets
+
+    def get_replication_targets(self, database: "Database") -> List["ReplicationTarget"]:
+        """
+        Returns every target that this instance replicates to: the targets of the provided
+        database, the targets the instance has been added to and, if the instance is a target
+        itself, the instance.
+
+        Args:
+            database: The database the instance is replicated through.
+        """
+        targets = database.get_all_replication_targets()
+        targets.extend(self.replication_targets())
+        if isinstance(self, ReplicationTarget) and self not in targets:
+            targets.append(self)
         return targets
 
     @classmethod
@@ -184,19 +478,11 @@ class ReplicatedModel(BaseModel):
             models.signals.post_save.connect(update_target_state, sender=model_class)
 
     def _get_relationship_fields(self) -> List[Field]:
-        relationship_fields = []
-        for field in self._meta.get_fields():
-            if field.is_relation and isinstance(
-                field,
-                (
-                    models.ForeignKey,
-                    models.ManyToManyField,
-                    models.OneToOneField,
-                    GenericForeignKey,
-                ),
-            ):
-                relationship_fields.append(field)
-        return relationship_fields
+        """
+        Returns the ForeignKey, OneToOneField, ManyToManyField and GenericForeignKey fields of
+        this model. Computed once per model when the app is ready (see get_relationship_plan).
+        """
+        return get_relationship_plan(self.__class__).fields
 
     def _create_related_replication_log(
         self,
@@ -204,6 +490,7 @@ class ReplicatedModel(BaseModel):
         target: "ReplicationTarget",
         txn_id: str,
         repr_logs: Optional[list[RepresentationLog]] = None,
+        payloads: Optional[Dict[tuple, "ReplicationPayload"]] = None,
     ) -> Optional["ReplicationLog"]:
         from fractal_database.models import ReplicationLog
 
@@ -226,7 +513,7 @@ class ReplicatedModel(BaseModel):
         )
 
         repl_log = ReplicationLog.objects.create(
-            payload=related_object.to_fixture(),
+            payload=ReplicationPayload.for_instance(related_object, payloads),
             target=target,
             instance=related_object,
             txn_id=txn_id,
@@ -242,65 +529,112 @@ class ReplicatedModel(BaseModel):
         target: "ReplicationTarget",
         txn_id: str,
         repr_logs: Optional[list[RepresentationLog]] = None,
+        payloads: Optional[Dict[tuple, "ReplicationPayload"]] = None,
+        closure: Optional[List["ReplicatedModel"]] = None,
     ) -> None:
         """
-        Introspects the current object to create replication logs for all related objects before
-        creating replication logs for the current object. This ensures that all related objects are
-        replicated before the current object. Necessary when the current object has relationships to
-        other ReplicatedModels.
-        """
-        # first, create replication logs for related objects
-        for field in self._get_relationship_fields():
-            if (
-                isinstance(field, models.ForeignKey)
-                or isinstance(field, models.OneToOneField)
-                or isinstance(field, GenericForeignKey)
-            ):
-                # fetch related object
-                related_object = getattr(self, field.name, None)
-
-                # only create replication logs for related objects that are ReplicatedModels
-                if not related_object or not isinstance(related_object, ReplicatedModel):
-                    continue
-
-                # create new replication log for the related object and add any provided repr logs to it
-                # self._create_related_replication_log(related_object, target, txn_id, repr_logs)
-                # FIXME: Should keep track of IDs we've seen so that we dont end up in a loop
-                related_object._create_replication_logs(target, txn_id, repr_logs)
-
-            elif isinstance(field, models.ManyToManyField):
-                related_objects = getattr(self, field.name).all()
-                for related_object in related_objects:
-                    # only create replication logs for related objects that are ReplicatedModels
-                    if not isinstance(related_object, ReplicatedModel):
-                        continue
-                    related_object._create_replication_logs(target, txn_id, repr_logs)
-                    # self._create_related_replication_log(
-                    #     related_object, target, txn_id, repr_logs
-                    # )
-            else:
-                logger.error(
-                    "Error creating related replication log for %s: Got unsupported field type: %s"
-                    % (self, field)
-                )
+        Creates replication logs for all related objects before creating the replication log for
+        the current object. This ensures that all related objects are replicated before the
+        current object. Necessary when the current object has relationships to other
+        ReplicatedModels.
 
-        # create replication log for the current object
-        replication_log_exists = self.replication_logs.filter(
-            instance_version=self.object_version, target_id=target.pk
-        ).exists()
-        if not replication_log_exists:
-            logger.info(
-                "Creating ReplicationLog for ReplicatedModel (%s) on target %s" % (self, target)
+        Objects that already have a replication log on the target at their current version are
+        skipped. Existing logs are looked up with one query per model and the missing logs are
+        created in bulk.
+
+        Args:
+            target: The target to create the replication logs for.
+            txn_id: The id of the transaction the logs are created in.
+            repr_logs: Representation logs to add to every created replication log.
+            payloads: Cache of payloads that is shared between targets.
+            closure: The objects to create logs for, as returned by replicated_closure.
+                Computed from this object if not provided.
+        """
+        if closure is None:
+            closure = replicated_closure([self])
+
+        by_content_type: Dict[int, List[ReplicatedModel]] = {}
+        for obj in closure:
+            by_content_type.setdefault(obj.get_content_type().pk, []).append(obj)
+
+        existing = set()
+        for content_type_id, objs in by_content_type.items():
+            existing.update(
+                (content_type_id, object_id, version)
+                for object_id, version in ReplicationLog.objects.filter(
+                    content_type_id=content_type_id,
+                    object_id__in=[str(obj.pk) for obj in objs],
+                    target_id=target.pk,
+                ).values_list("object_id", "instance_version")
             )
-            repl_log = ReplicationLog.objects.create(
-                payload=self.to_fixture(),
-                target=target,
-                instance=self,
-                txn_id=txn_id,
-                instance_version=self.object_version,
+
+        missing = [
+            obj
+            for obj in closure
+            if (obj.get_content_type().pk, str(obj.pk), obj.object_version) not in existing
+        ]
+        if not missing:
+            return None
+
+        if not coalesce_replication_logs_enabled():
+            repl_logs = ReplicationLog.objects.bulk_create(
+                [
+                    ReplicationLog(
+                        payload=payload,
+                        target=target,
+                        instance=obj,
+                        txn_id=txn_id,
+                        instance_version=obj.object_version,
+                    )
+                    for obj, payload in zip(
+                        missing, ReplicationPayload.for_instances(missing, payloads)
+                    )
+                ]
             )
-            if repr_logs:
-                repl_log.repr_logs.add(*repr_logs)
+            logger.info("Created %s ReplicationLogs on target %s" % (len(repl_logs), target))
+            ReplicationLog.add_repr_logs(repl_logs, repr_logs)
+            return None
+
+        # objects that were already logged for this target earlier in the transaction have their
+        # log moved to the new version instead of getting another one. Payloads are stored once
+        # the transaction commits, so only the final version of each object is serialized
+        txn_logs = get_transaction_logs()
+        target_type_id = target.get_content_type().pk
+        keys = {
+            obj: (target_type_id, str(target.pk), obj.get_content_type().pk, str(obj.pk))
+            for obj in missing
+        }
+        logged = {txn_logs[key]: obj for obj, key in keys.items() if key in txn_logs}
+        # logs created in a savepoint that was rolled back are gone
+        alive = ReplicationLog.objects.filter(pk__in=logged, deleted=False, payload__isnull=True)
+        coalesced = list(alive.only("pk"))
+        for log in coalesced:
+            log.instance_version = logged[log.pk].object_version
+        ReplicationLog.objects.bulk_update(coalesced, ["instance_version"])
+
+        coalesced_objs = {logged[log.pk] for log in coalesced}
+        created = ReplicationLog.objects.bulk_create(
+            [
+                ReplicationLog(
+                    target=target,
+                    instance=obj,
+                    txn_id=txn_id,
+                    instance_version=obj.object_version,
+                )
+                for obj in missing
+                if obj not in coalesced_objs
+            ]
+        )
+        for log in created:
+            txn_logs[(target_type_id, str(target.pk), log.content_type_id, str(log.object_id))] = (
+                log.pk
+            )
+
+        logger.info(
+            "Created %s and coalesced %s ReplicationLogs on target %s"
+            % (len(created), len(coalesced), target)
+        )
+        ReplicationLog.add_repr_logs([*created, *coalesced], repr_logs)
 
     def schedule_replication(self, created: bool = False, database: Optional["Database"] = None):
         # must be in a txn for defer_replication to work properly
@@ -318,12 +652,18 @@ class ReplicatedModel(BaseModel):
                 )
                 return
 
-        targets = database.get_all_replication_targets()  # type: ignore
-        targets.extend(self.replication_targets())
-        if isinstance(self, ReplicationTarget) and self not in targets:
-            targets.append(self)
+        targets = self.get_replication_targets(database)
+        if not targets:
+            return None
+
+        # also registers the on_commit handler that stores the payloads before any replication
+        txn_id = get_transaction_id()
 
         repr_logs = None
+        # payloads are serialized once per object version and shared by every target
+        payloads: Dict[tuple, ReplicationPayload] = {}
+        # so are the related objects that are replicated along with this object
+        closure = replicated_closure([self])
         for target in targets:
             if created and not target.metadata:
                 # only allow targets to create representations for themselves,
@@ -334,9 +674,7 @@ class ReplicatedModel(BaseModel):
             else:
                 logger.debug("Not creating repr for object: %s" % self)
 
-            self._create_replication_logs(
-                target, transaction.savepoint().split("_")[0], repr_logs
-            )
+            self._create_replication_logs(target, txn_id, repr_logs, payloads, closure)
 
             defer_replication(target)
 
@@ -388,8 +726,225 @@ class ReplicatedModel(BaseModel):
         return None
 
 
+class ReplicationPayload(BaseModel):
+    """
+    Serialized fixture of a ReplicatedModel instance at a given object version.
+
+    Payloads are content addressed by (content_type, object_id, object_version) so an
+    instance is only serialized and stored once per version, no matter how many
+    targets it is replicated to. ReplicationLogs reference the payload they push.
+
+    When delta payloads are enabled (see delta_payloads_enabled), a payload also stores the
+    fields that changed since the previous stored version of the instance, which is what gets
+    pushed to targets instead of the full fixture.
+
+    The pushed form is also stored pre-encoded as JSON bytes, so pushing a batch of payloads
+    splices their bytes together instead of decoding and encoding them again (see
+    ReplicationTarget.push_encoded_replication_log).
+    """
+
+    instance = GenericForeignKey()
+    object_id = models.CharField(max_length=255)
+    content_type = models.ForeignKey(
+        ContentType,
+        on_delete=models.CASCADE,
+        related_name="%(app_label)s_%(class)s_content_type",
+    )
+    object_version = models.PositiveIntegerField(default=0)
+    data = CompressedJSONField(encoder=DjangoJSONEncoder)
+    delta = CompressedJSONField(encoder=DjangoJSONEncoder, null=True, blank=True)
+    # get_fixture() encoded as JSON, compressed like data (see compression.compress)
+    encoded = models.BinaryField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["content_type", "object_id", "object_version"],
+                name="unique_replication_payload_per_version",
+            )
+        ]
+
+    @classmethod
+    def for_instance(
+        cls,
+        instance: "ReplicatedModel",
+        payloads: Optional[Dict[tuple, "ReplicationPayload"]] = None,
+    ) -> "ReplicationPayload":
+        """
+        Returns the payload for the provided instance at its current version, serializing
+        the instance only if no payload has been stored for that version yet.
+
+        Args:
+            instance: The instance to get the payload for.
+            payloads: Optional cache of payloads that have already been fetched during the
+                current call to schedule_replication. Avoids hitting the database once per target.
+        """
+        if delta_payloads_enabled():
+            # deltas are computed against the previous payloads in bulk
+            return cls.for_instances([instance], payloads)[0]
+
+        content_type = instance.get_content_type()
+        key = (content_type.pk, str(instance.pk), instance.object_version)
+        if payloads is not None and key in payloads:
+            return payloads[key]
+
+        payload, _ = cls.objects.get_or_create(
+            content_type=content_type,
+            object_id=str(instance.pk),
+            object_version=instance.object_version,
+            defaults={"data": instance.to_fixture},
+        )
+        if payloads is not None:
+            payloads[key] = payload
+        return payload
+
+    @classmethod
+    def for_instances(
+        cls,
+        instances: List["ReplicatedModel"],
+        payloads: Optional[Dict[tuple, "ReplicationPayload"]] = None,
+    ) -> List["ReplicationPayload"]:
+        """
+        Bulk version of for_instance. Returns the payloads of the provided instances at their
+        current versions, with a few queries per model instead of a few per instance.
+
+        Args:
+            instances: The instances to get the payloads for.
+            payloads: Optional cache of payloads that have already been fetched during the
+                current call to schedule_replication.
+        """
+        payloads = {} if payloads is None else payloads
+        keys = []
+        missing: Dict[int, Dict[tuple, "ReplicatedModel"]] = {}
+        for instance in instances:
+            content_type = instance.get_content_type()
+            key = (content_type.pk, str(instance.pk), instance.object_version)
+            keys.append(key)
+            if key not in payloads:
+                missing.setdefault(content_type.pk, {})[key] = instance
+
+        def _fetch(content_type_id: int, keys: Dict[tuple, Any]) -> None:
+            for payload in cls.objects.filter(
+                content_type_id=content_type_id,
+                object_id__in={object_id for _, object_id, _ in keys},
+                object_version__in={version for _, _, version in keys},
+            ):
+                key = (content_type_id, payload.object_id, payload.object_version)
+                if key in keys:
+                    payloads[key] = payload
+
+        for content_type_id, instances_by_key in missing.items():
+            _fetch(content_type_id, instances_by_key)
+            to_create = [key for key in instances_by_key if key not in payloads]
+            if not to_create:
+                continue
+            new_payloads = [
+                cls(
+                    content_type_id=content_type_id,
+                    object_id=object_id,
+                    object_version=version,
+                    data=instances_by_key[(content_type_id, object_id, version)].to_fixture(),
+                )
+                for _, object_id, version in to_create
+            ]
+            if delta_payloads_enabled():
+                cls._encode_deltas(content_type_id, new_payloads)
+            for payload in new_payloads:
+                payload.encoded = compress(payload.encode())
+            # ignore_conflicts in case another transaction stored the same version first
+            cls.objects.bulk_create(new_payloads, ignore_conflicts=True)
+            _fetch(content_type_id, dict.fromkeys(to_create))
+
+        return [payloads[key] for key in keys]
+
+    @classmethod
+    def _encode_deltas(cls, content_type_id: int, new_payloads: List["ReplicationPayload"]) -> None:
+        """
+        Sets the delta of the provided unsaved payloads against the newest stored payload
+        of the same instance. Payloads of instances without a previous payload are left full.
+
+        Args:
+            content_type_id: The content type of the instances the payloads serialize.
+            new_payloads: The payloads that are about to be created.
+        """
+        object_ids = {payload.object_id for payload in new_payloads}
+        base_versions = dict(
+            cls.objects.filter(content_type_id=content_type_id, object_id__in=object_ids)
+            .values("object_id")
+            .annotate(version=Max("object_version"))
+            .values_list("object_id", "version")
+        )
+        if not base_versions:
+            return None
+
+        bases = {
+            payload.object_id: payload
+            for payload in cls.objects.filter(
+                content_type_id=content_type_id,
+                object_id__in=base_versions,
+                object_version__in=set(base_versions.values()),
+            )
+            if base_versions[payload.object_id] == payload.object_version
+        }
+        for payload in new_payloads:
+            base = bases.get(payload.object_id)
+            if base is not None and base.object_version < payload.object_version:
+                payload.delta = encode_delta(base.data[0], payload.data[0])
+
+    def get_fixture(self) -> Dict[str, Any]:
+        """
+        Returns the serialized instance that is pushed to targets: its delta if it has one,
+        otherwise the full fixture.
+        """
+        return self.delta if self.delta is not None else self.data[0]
+
+    def encode(self, full: bool = False) -> bytes:
+        """
+        Returns get_fixture() encoded as JSON.
+
+        Args:
+            full: Encode the full fixture even if the payload has a delta.
+        """
+        fixture = self.data[0] if full else self.get_fixture()
+        return json.dumps(fixture, cls=DjangoJSONEncoder, separators=(",", ":")).encode()
+
+    def get_encoded(self) -> bytes:
+        """
+        Returns the stored JSON encoding of get_fixture(), decompressing it if it was stored
+        compressed. Payloads stored before encodings were stored are encoded on the fly.
+        """
+        if self.encoded is None:
+            return self.encode()
+        return decompress(self.encoded)
+
+    @staticmethod
+    def get_base_version(encoded: bytes) -> Optional[int]:
+        """
+        Returns the version that the provided encoded payload is a delta against, or None if
+        it's a full fixture.
+
+        Args:
+            encoded: The payload encoded by get_encoded.
+        """
+        if b'"base_version"' not in encoded:
+            return None
+        return json.loads(encoded).get("base_version")
+
+    def save(self, *args, **kwargs):
+        if self.encoded is None:
+            self.encoded = compress(self.encode())
+        super().save(*args, **kwargs)
+
+
 class ReplicationLog(BaseModel):
-    payload = models.JSONField(encoder=DjangoJSONEncoder)
+    # null until the transaction that created the log commits (see materialize_payloads)
+    payload = models.ForeignKey(
+        "fractal_database.ReplicationPayload",
+        on_delete=models.CASCADE,
+        related_name="replication_logs",
+        null=True,
+        blank=True,
+    )
     object_version = models.PositiveIntegerField(default=0)
     target = GenericForeignKey("target_type", "target_id")
     target_type = models.ForeignKey(
@@ -412,12 +967,96 @@ class ReplicationLog(BaseModel):
     instance_version = models.PositiveIntegerField(default=0)
     repr_logs = models.ManyToManyField("fractal_database.RepresentationLog")
     txn_id = models.CharField(max_length=255, blank=True, null=True)
+    # set once the log has been pushed to its target. Logs are also marked deleted when they
+    # are dropped without being pushed (superseded or collapsed by debouncing)
+    delivered_at = models.DateTimeField(null=True, blank=True)
+    # push the full fixture even if the payload is a delta (see send_full_fixtures)
+    full = models.BooleanField(default=False)
 
     class Meta:
         indexes = [
-            models.Index(fields=["content_type", "object_id"]),
+            # the logs of an instance on a target, covering the versions that are already
+            # logged (see ReplicatedModel._create_replication_logs)
+            models.Index(fields=["content_type", "object_id", "target_id", "instance_version"]),
+            # the pending logs of a target, in the order they are pushed (see get_repl_log_pages)
+            models.Index(
+                fields=["target_type", "target_id", "date_created"],
+                condition=Q(deleted=False),
+                name="replication_log_pending",
+            ),
+            # delivered and dropped logs by age (see fractal_database.replication.compaction)
+            models.Index(
+                fields=["date_created"],
+                condition=Q(deleted=True),
+                name="replication_log_delivered",
+            ),
         ]
 
+    @classmethod
+    def add_repr_logs(
+        cls, logs: List["ReplicationLog"], repr_logs: Optional[List[RepresentationLog]]
+    ) -> None:
+        """
+        Adds the provided representation logs to every one of the provided logs in one query.
+        """
+        if not logs or not repr_logs:
+            return None
+        through = cls.repr_logs.through
+        through.objects.bulk_create(
+            [
+                through(replicationlog_id=log.pk, representationlog_id=repr_log.pk)
+                for log in logs
+                for repr_log in repr_logs
+            ],
+            ignore_conflicts=True,
+        )
+
+    @classmethod
+    def materialize_payloads(cls, logs: List["ReplicationLog"]) -> List["ReplicationLog"]:
+        """
+        Stores the payloads of the provided logs that don't have one yet. Payloads are
+        serialized from the current state of their objects, so a log whose object has moved
+        past the logged version since (or has been deleted) is superseded by a newer log and
+        is marked deleted instead.
+
+        Args:
+            logs: The logs to materialize the payloads of.
+
+        Returns:
+            The provided logs, minus the superseded ones.
+        """
+        pending = [log for log in logs if log.payload_id is None]
+        if not pending:
+            return logs
+
+        object_ids: Dict[int, List[str]] = {}
+        for log in pending:
+            object_ids.setdefault(log.content_type_id, []).append(log.object_id)  # type: ignore
+        objects: Dict[tuple, ReplicatedModel] = {}
+        for content_type_id, ids in object_ids.items():
+            model = ContentType.objects.get_for_id(content_type_id).model_class()
+            for obj in model._base_manager.filter(pk__in=ids):  # type: ignore
+                objects[(content_type_id, str(obj.pk))] = obj
+
+        current, superseded = [], []
+        for log in pending:
+            obj = objects.get((log.content_type_id, log.object_id))
+            if obj is not None and obj.object_version == log.instance_version:
+                current.append((log, obj))
+            else:
+                superseded.append(log.pk)
+
+        with transaction.atomic():
+            payloads = ReplicationPayload.for_instances([obj for _, obj in current])
+            for (log, _), payload in zip(current, payloads):
+                log.payload = payload
+            cls.objects.bulk_update([log for log, _ in current], ["payload"])
+            if superseded:
+                logger.info("Dropping %s superseded replication logs" % len(superseded))
+                cls.objects.filter(pk__in=superseded).update(deleted=True)
+
+        return [log for log in logs if log.pk not in superseded]
+
 
 class ReplicatedInstanceConfig(ReplicatedModel):
     """
@@ -434,6 +1073,88 @@ class ReplicatedInstanceConfig(ReplicatedModel):
         null=True,
     )
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["content_type", "object_id"]),
+        ]
+
+
+class InstanceTarget(BaseModel):
+    """
+    Local (not replicated) index of the targets that each instance is shared to, so that the
+    targets of an instance can be looked up with one indexed query. Denormalized from the
+    `instances` many to many field of the ReplicationTarget models and kept up to date by
+    fractal_database.signals.update_instance_target_index.
+    """
+
+    instance_config = models.ForeignKey(
+        "fractal_database.ReplicatedInstanceConfig", on_delete=models.CASCADE
+    )
+    object_id = models.CharField(max_length=255)
+    content_type = models.ForeignKey(
+        ContentType,
+        on_delete=models.CASCADE,
+        related_name="%(app_label)s_%(class)s_content_type",
+    )
+    target_id = models.CharField(max_length=255)
+    target_type = models.ForeignKey(
+        ContentType,
+        on_delete=models.CASCADE,
+        related_name="%(app_label)s_%(class)s_target_type",
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["content_type", "object_id"]),
+            models.Index(fields=["target_type", "target_id"]),
+        ]
+
+    @classmethod
+    def index_targets(cls, target_model: type, target_ids: List[Any]) -> None:
+        """
+        Rebuilds the index rows of the provided targets from their `instances` field.
+
+        Args:
+            target_model: The ReplicationTarget model of the targets.
+            target_ids: The primary keys of the targets to index.
+        """
+        target_type = ContentType.objects.get_for_model(target_model)
+        target_ids = [str(target_id) for target_id in target_ids]
+        field = target_model._meta.get_field("instances")
+        through = field.remote_field.through
+        source = through._meta.get_field(field.m2m_field_name()).attname
+        config = field.m2m_reverse_field_name()
+
+        rows = through._base_manager.filter(**{f"{source}__in": target_ids}).values_list(
+            source, f"{config}_id", f"{config}__content_type_id", f"{config}__object_id"
+        )
+        cls.objects.filter(target_type=target_type, target_id__in=target_ids).delete()
+        cls.objects.bulk_create(
+            [
+                cls(
+                    instance_config_id=config_id,
+                    content_type_id=content_type_id,
+                    object_id=object_id,
+                    target_type=target_type,
+                    target_id=str(target_id),
+                )
+                for target_id, config_id, content_type_id, object_id in rows
+            ]
+        )
+
+    @classmethod
+    def rebuild(cls, *args, **kwargs) -> None:
+        """
+        Rebuilds the whole index. Accepts and ignores any arguments so that it can be
+        connected to post_migrate.
+        """
+        with transaction.atomic():
+            cls.objects.all().delete()
+            for target_model in target_registry.target_types:
+                cls.index_targets(
+                    target_model, list(target_model._base_manager.values_list("pk", flat=True))
+                )
+
 
 class ReplicationTarget(ReplicatedModel):
     name = models.CharField(max_length=255)
@@ -447,6 +1168,8 @@ class ReplicationTarget(ReplicatedModel):
     # metadata is a map of properties that are specific to the target
     metadata = models.JSONField(default=dict)
     instances = models.ManyToManyField("fractal_database.ReplicatedInstanceConfig")
+    # debounce window of this target, see get_debounce_windows
+    debounce_window: Optional[float] = None
 
     class Meta:
         # enforce that only one primary=True ReplicationTarget can exist per Database
@@ -531,49 +1254,251 @@ class ReplicationTarget(ReplicatedModel):
         """
         raise NotImplementedError()
 
-    async def replicate(self) -> None:
+    async def push_encoded_replication_log(self, fixture: bytes) -> None:
         """
-        Get the pending replication logs and their associated representation logs.
+        Pushes a replication log that is already encoded as a JSON list of serialized objects.
+        Targets that send JSON should override this to send the bytes as is. By default the
+        fixture is decoded and pushed with push_replication_log.
+
+        Args:
+            fixture: The JSON encoded fixture to push.
+        """
+        await self.push_replication_log(json.loads(fixture))
 
-        Apply the representation logs then push the replication logs.
-        """
-        transaction_logs_querysets = await self.get_repl_logs_by_txn()
-
-        # collect all of the payloads from the replication logs into a single array
-        for queryset in transaction_logs_querysets:
-            fixture = []
-            logger.debug("Querying for representation logs...")
-            async for log in queryset:
-                async for repr_log in (
-                    log.repr_logs.select_related("content_type", "target_type")
-                    .filter(deleted=False)
-                    .order_by("date_created")
-                ):
-                    try:
-                        logger.debug("Calling apply for repr log: %s" % repr_log)
-                        await repr_log.apply()
-                        # after applying a representation for this target,
-                        # we need to refresh ourself to get any latest metadata
-                        # if repr_log.content_type.model_class() == self.__class__:
-                        logger.debug("Refreshing %s after applying representation" % self)
-                        await self.arefresh_from_db()
-                        # call replicate again since apply will create new
-                        # replication logs
-                        return await self.replicate()
-                    except Exception as e:
-                        logger.exception(
-                            "Error applying representation log for target %s: %s"
-                            % (repr_log.target_type, e)
-                        )
-                        continue
-                fixture.append(log.payload[0])
+    async def apply_representation_logs(self) -> int:
+        """
+        Applies every pending representation log attached to this target's pending
+        replication logs, oldest first.
 
+        Returns:
+            The number of representation logs that were applied successfully.
+        """
+        content_type = await self.aget_content_type()
+        repr_logs = (
+            RepresentationLog.objects.filter(
+                deleted=False,
+                replicationlog__target_id=self.pk,
+                replicationlog__target_type=content_type,
+                replicationlog__deleted=False,
+            )
+            .distinct()
+            .select_related("content_type", "target_type")
+            .order_by("date_created")
+        )
+
+        applied = 0
+        async for repr_log in repr_logs:
             try:
-                await self.push_replication_log(fixture)
-                # bulk update all of the logs in the queryset to deleted
-                await queryset.aupdate(deleted=True)
+                logger.debug("Calling apply for repr log: %s" % repr_log)
+                await repr_log.apply()
+                applied += 1
             except Exception as e:
-                logger.exception("Error pushing replication log: %s" % e)
+                logger.exception(
+                    "Error applying representation log for target %s: %s"
+                    % (repr_log.target_type, e)
+                )
+        return applied
+
+    async def replicate(self) -> None:
+        """
+        Get the pending replication logs and their associated representation logs.
+
+        Replication happens in two phases. First all of the pending representation logs
+        are applied and the target is refreshed once to get any metadata they stored.
+        Then the pending replication logs, including any created while applying the
+        representations, are pushed in the order they were created, consecutive logs of the
+        same transaction in one batch.
+
+        Logs of debounced models (see get_debounce_windows) are held back until their debounce
+        window closes, after which only the newest log of each object is pushed.
+        """
+        if await self.apply_representation_logs():
+            # after applying representations for this target,
+            # we need to refresh ourself to get any latest metadata
+            logger.debug("Refreshing %s after applying representations" % self)
+            await self.arefresh_from_db()
+
+        held, retry_in = await sync_to_async(self.debounce_pending_logs)()
+
+        async for page in self.get_repl_log_pages(prefetch_repr_logs=False):
+            if held:
+                page = [log for log in page if log.pk not in held]
+            # normally done when the transaction that created the logs commits
+            page = await sync_to_async(ReplicationLog.materialize_payloads)(page)
+            for _, txn_logs in groupby(page, key=lambda log: log.txn_id):
+                txn_logs = list(txn_logs)
+                encoded = await sync_to_async(self.encode_replication_logs)(txn_logs)
+                fixture = b"[" + b",".join(encoded) + b"]"
+                try:
+                    await self.push_encoded_replication_log(fixture)
+                    # bulk update all of the pushed logs to deleted
+                    await ReplicationLog.objects.filter(
+                        pk__in=[log.pk for log in txn_logs]
+                    ).aupdate(deleted=True, delivered_at=timezone.now())
+                except Exception as e:
+                    logger.exception("Error pushing replication log: %s" % e)
+
+        if retry_in is not None:
+            logger.debug("Replicating %s again in %.2fs for debounced logs" % (self, retry_in))
+            self.replicate_later(retry_in)
+
+    def replicate_later(self, delay: float) -> None:
+        """
+        Replicates this target again after delay seconds, without blocking the caller. Used to
+        push the logs that were held back for debouncing once their window closes.
+
+        When background replication is enabled the ReplicationDispatcher replicates the target.
+        Otherwise a timer thread does, so that the dispatcher isn't started alongside the
+        replication that runs when transactions commit.
+
+        Args:
+            delay: Number of seconds to wait before replicating.
+        """
+        if background_replication_enabled():
+            get_dispatcher().wake_later(self, delay)
+            return None
+
+        timer = threading.Timer(delay, self._replicate_in_thread)
+        timer.daemon = True
+        timer.start()
+
+    def _replicate_in_thread(self) -> None:
+        try:
+            async_to_sync(self.replicate)()
+        except Exception as e:
+            logger.exception("Error replicating %s: %s" % (self, e))
+        finally:
+            connection.close()
+
+    def encode_replication_logs(self, logs: List["ReplicationLog"]) -> List[bytes]:
+        """
+        Returns the encoded payloads of the provided logs. Payloads are deltas against the
+        newest payload stored when they were created, which this target may never have received
+        (ie it was added later, or debouncing dropped the version). Those are encoded as full
+        fixtures instead, so that the target never receives a delta it can't apply. So are the
+        logs that ask for the full fixture (see ReplicationLog.full).
+
+        Args:
+            logs: The logs to push, in the order they are pushed.
+        """
+        encoded = [log.payload.get_encoded() for log in logs]  # type: ignore
+        bases = {
+            i: base
+            for i, data in enumerate(encoded)
+            if (base := ReplicationPayload.get_base_version(data)) is not None
+        }
+        if not bases:
+            return encoded
+
+        delivered = set(
+            ReplicationLog.objects.filter(
+                target_type=self.get_content_type(),
+                target_id=self.pk,
+                object_id__in={logs[i].object_id for i in bases},
+                delivered_at__isnull=False,
+            ).values_list("content_type_id", "object_id", "instance_version")
+        )
+        full = []
+        for i, log in enumerate(logs):
+            key = (log.content_type_id, log.object_id)  # type: ignore
+            if i in bases and (log.full or (*key, bases[i]) not in delivered):
+                logger.debug("Pushing the full fixture of %s %s to %s" % (*key, self))
+                full.append(i)
+            # logs earlier in the batch are delivered before the logs after them
+            delivered.add((*key, log.instance_version))
+        if not full:
+            return encoded
+
+        # the payloads are loaded without their data (see get_repl_log_pages), load it for
+        # every full fixture in one query
+        data = ReplicationPayload.objects.only("data").in_bulk(
+            {logs[i].payload_id for i in full}  # type: ignore
+        )
+        for i in full:
+            payload = logs[i].payload
+            payload.data = data[payload.pk].data  # type: ignore
+            encoded[i] = payload.encode(full=True)  # type: ignore
+        return encoded
+
+    def get_debounce_windows(self) -> Dict[int, float]:
+        """
+        Returns the number of seconds that the replication logs of each debounced model wait for
+        newer versions of the same object before they are pushed to this target, keyed by the
+        content type id of the model. Set per model with ReplicatedModel.replication_debounce,
+        per target with ReplicationTarget.debounce_window or for every target with
+        settings.FRACTAL_DATABASE_REPLICATION_DEBOUNCE.
+        """
+        default = self.debounce_window
+        if default is None:
+            default = getattr(settings, "FRACTAL_DATABASE_REPLICATION_DEBOUNCE", None)
+
+        windows = {}
+        for model in replicated_models():
+            window = model.replication_debounce
+            if window is None:
+                window = default
+            if window:
+                windows[ContentType.objects.get_for_model(model).pk] = window
+        return windows
+
+    def debounce_pending_logs(self) -> Tuple[set, Optional[float]]:
+        """
+        Collapses the pending logs of debounced objects. Each object's logs are held back while
+        its newest log is younger than the debounce window, for at most
+        settings.FRACTAL_DATABASE_REPLICATION_MAX_LATENCY seconds after its oldest log. Once an
+        object is released, its older logs are marked deleted so only the newest one is pushed.
+
+        Returns:
+            The primary keys of the held logs, and the number of seconds until the first of them
+            is released (None if no logs are held).
+        """
+        windows = self.get_debounce_windows()
+        if not windows:
+            return set(), None
+
+        max_latency = getattr(
+            settings, "FRACTAL_DATABASE_REPLICATION_MAX_LATENCY", DEFAULT_REPLICATION_MAX_LATENCY
+        )
+        pending = (
+            ReplicationLog.objects.filter(
+                target_id=self.pk,
+                target_type=self.get_content_type(),
+                content_type_id__in=windows,
+                deleted=False,
+            )
+            .order_by("date_created", "pk")
+            .values_list("pk", "content_type_id", "object_id", "date_created", "instance_version")
+        )
+        logs_by_object = defaultdict(list)
+        for pk, content_type_id, object_id, date_created, version in pending:
+            logs_by_object[(content_type_id, object_id)].append((pk, date_created, version))
+
+        now = timezone.now()
+        held, collapsed, release_at = set(), [], None
+        for (content_type_id, _), logs in logs_by_object.items():
+            # the newest log waits out the window, but never past the max latency of the oldest
+            release = min(
+                logs[-1][1] + timedelta(seconds=windows[content_type_id]),
+                logs[0][1] + timedelta(seconds=max_latency),
+            )
+            if release > now:
+                held.update(log[0] for log in logs)
+                release_at = release if release_at is None else min(release_at, release)
+            else:
+                newest = max(logs, key=lambda log: log[2])
+                collapsed.extend(log[0] for log in logs if log is not newest)
+
+        if collapsed:
+            logger.info("Collapsed %s debounced replication logs on %s" % (len(collapsed), self))
+            ReplicationLog.objects.filter(pk__in=collapsed).update(deleted=True)
+        if release_at is None:
+            return held, None
+        return held, (release_at - now).total_seconds()
+
+    def update(self, **kwargs) -> None:
+        super().update(**kwargs)
+        # queryset updates dont send post_save
+        target_registry.invalidate()
 
     async def store_metadata(self, metadata: dict) -> None:
         """
@@ -608,28 +1533,72 @@ class ReplicationTarget(ReplicatedModel):
             self.content_type = ContentType.objects.get_for_model(self.__class__)
         super().save(*args, **kwargs)
 
-    async def get_repl_logs_by_txn(self) -> List[BaseManager[ReplicationLog]]:
-        txn_ids = (
-            ReplicationLog.objects.filter(
-                target_id=self.pk, target_type=self.get_content_type(), deleted=False
+    async def get_repl_log_pages(
+        self, page_size: Optional[int] = None, prefetch_repr_logs: bool = True
+    ) -> AsyncIterator[List[ReplicationLog]]:
+        """
+        Yields the pending replication logs for this target in the order they were created,
+        page_size logs at a time.
+
+        Pages are read with a (date_created, pk) keyset cursor so each page costs one query for
+        the logs and one for their pending representation logs, no matter how many logs are
+        pending.
+        Logs that are still pending after being yielded (ie failed to push) are not yielded
+        again until the next call.
+
+        Args:
+            page_size: Number of logs per page. Defaults to
+                settings.FRACTAL_DATABASE_REPLICATION_PAGE_SIZE.
+            prefetch_repr_logs: Whether to prefetch the pending representation logs of each page.
+        """
+        if page_size is None:
+            page_size = getattr(
+                settings, "FRACTAL_DATABASE_REPLICATION_PAGE_SIZE", DEFAULT_REPLICATION_PAGE_SIZE
             )
-            .values_list("txn_id", flat=True)
-            .distinct()
-        )
 
         content_type = await self.aget_content_type()
-
-        return [
+        pending_logs = (
             ReplicationLog.objects.filter(
-                txn_id=txn_id,
-                deleted=False,
-                target_id=self.pk,
-                target_type=content_type,
+                target_id=self.pk, target_type=content_type, deleted=False
             )
-            .order_by("date_created")
-            .select_related("target_type")
-            async for txn_id in txn_ids
-        ]
+            .order_by("date_created", "pk")
+            # the target type is set from content_type below. Joining it makes SQLite look the
+            # logs up by the target_type index instead of the replication_log_pending index
+            .select_related("payload")
+            # pushed from the payload's pre-encoded bytes
+            .defer("payload__data", "payload__delta")
+        )
+        if prefetch_repr_logs:
+            pending_logs = pending_logs.prefetch_related(
+                Prefetch(
+                    "repr_logs",
+                    queryset=RepresentationLog.objects.filter(deleted=False)
+                    .select_related("content_type", "target_type")
+                    .order_by("date_created"),
+                )
+            )
+
+        cursor = None
+        while True:
+            page_qs = pending_logs
+            if cursor:
+                date_created, pk = cursor
+                page_qs = page_qs.filter(
+                    Q(date_created__gt=date_created) | Q(date_created=date_created, pk__gt=pk)
+                )
+
+            page = [log async for log in page_qs[:page_size]]
+            if not page:
+                return
+            for log in page:
+                log.target_type = content_type
+
+            last = page[-1]
+            cursor = (last.date_created, last.pk)
+            yield page
+
+            if len(page) < page_size:
+                return
 
     def __str__(self) -> str:
         return f"{self.name} ({self.__class__.__name__})"
@@ -643,6 +1612,115 @@ class DummyReplicationTarget(ReplicationTarget):
         pass
 
 
+def target_cache_ttl() -> Optional[float]:
+    """
+    Returns the number of seconds that TargetRegistry serves cached targets for before loading
+    them again, or None to serve them until they are saved or deleted in this process.
+    Set with settings.FRACTAL_DATABASE_TARGET_CACHE_TTL.
+    """
+    return getattr(settings, "FRACTAL_DATABASE_TARGET_CACHE_TTL", DEFAULT_TARGET_CACHE_TTL)
+
+
+class TargetRegistry:
+    """
+    Registry of the concrete ReplicationTarget models that caches the targets of each
+    database, so that looking up a database's targets doesn't cost a query per target model
+    on every save. The cache is invalidated on save and delete of targets (see
+    fractal_database.apps.FractalDatabaseConfig.ready). Targets saved by other processes
+    (ie the replication worker storing a target's metadata) aren't seen until the cached
+    targets expire (see target_cache_ttl).
+    """
+
+    def __init__(self):
+        self._target_types: Optional[List[type]] = None
+        self._cache = CommittedCache(ttl=target_cache_ttl)
+
+    @property
+    def target_types(self) -> List[type]:
+        """
+        Returns the concrete ReplicationTarget models.
+        """
+        if self._target_types is None:
+            self._target_types = [
+                model
+                for model in ReplicatedModel.models
+                if issubclass(model, ReplicationTarget)
+                and not model._meta.abstract
+                and not model._meta.proxy
+            ]
+        return self._target_types
+
+    def _load(self, database_id: Any) -> List[ReplicationTarget]:
+        targets = []
+        for target_type in self.target_types:
+            queryset = target_type.objects.filter(database_id=database_id).select_related(
+                "database"
+            )
+            if hasattr(target_type, "matrixcredentials_set"):
+                queryset = queryset.prefetch_related("matrixcredentials_set")
+            targets.extend(queryset)
+        return targets
+
+    def get_targets(self, database: "Database") -> List[ReplicationTarget]:
+        """
+        Returns all of the replication targets of the given database.
+
+        Args:
+            database: The database to get the targets of.
+        """
+        targets = self._cache.get_or_load(database.pk, lambda: self._load(database.pk))
+        # the cached targets are shared between threads, hand out copies
+        return [copy_cached_instance(target) for target in targets]
+
+    async def aget_targets(self, database: "Database") -> List[ReplicationTarget]:
+        targets = await self._cache.aget_or_load(database.pk, lambda: self._load(database.pk))
+        return [copy_cached_instance(target) for target in targets]
+
+    def get_primary_target(self, database: "Database") -> Optional[ReplicationTarget]:
+        """
+        Returns the primary replication target of the given database.
+
+        Args:
+            database: The database to get the primary target of.
+        """
+        for target in self.get_targets(database):
+            if target.primary:
+                return target
+        return None
+
+    async def aget_primary_target(self, database: "Database") -> Optional[ReplicationTarget]:
+        for target in await self.aget_targets(database):
+            if target.primary:
+                return target
+        return None
+
+    def get_target(self, target_type_id: int, target_id: Any) -> Optional[ReplicationTarget]:
+        """
+        Returns the target with the given content type and primary key, or None if it
+        doesn't exist.
+
+        Args:
+            target_type_id: The id of the content type of the target model.
+            target_id: The primary key of the target.
+        """
+
+        def _load() -> Optional[ReplicationTarget]:
+            model = ContentType.objects.get_for_id(target_type_id).model_class()
+            return model.objects.filter(pk=target_id).select_related("database").first()
+
+        target = self._cache.get_or_load(("target", target_type_id, str(target_id)), _load)
+        return copy_cached_instance(target)
+
+    def invalidate(self, *args, **kwargs) -> None:
+        self._cache.invalidate()
+
+    def stats(self) -> Dict[str, int]:
+        return self._cache.stats()
+
+
+target_registry = TargetRegistry()
+
+
 class Database(ReplicatedModel):
     name = models.CharField(max_length=255)
     description = models.TextField(blank=True, null=True)
@@ -656,29 +1734,16 @@ class Database(ReplicatedModel):
         """
         Returns the primary replication target for this database.
         """
-        for subclass in ReplicationTarget.__subclasses__():
-            target = subclass.objects.filter(database=self, primary=True).prefetch_related(
-                "matrixcredentials_set"
-            )
-            if target.exists():
-                return target[0]
+        return target_registry.get_primary_target(self)
 
     async def aprimary_target(self) -> Optional[ReplicationTarget]:
-        return await sync_to_async(self.primary_target)()
+        return await target_registry.aget_primary_target(self)
 
     def get_all_replication_targets(self) -> List[ReplicationTarget]:
-        targets = []
-        # this is a hack, for some reason we arent able to set abstract = True on a subclass of an already abstract model
-        for subclass in ReplicationTarget.__subclasses__():
-            targets.extend(subclass.objects.filter(database=self).select_related("database"))
-        return targets
+        return target_registry.get_targets(self)
 
     async def aget_all_replication_targets(self) -> List[ReplicationTarget]:
-        targets = []
-        for subclass in ReplicationTarget.__subclasses__():
-            async for t in subclass.objects.filter(database=self).select_related("database"):
-                targets.append(t)
-        return targets
+        return await target_registry.aget_targets(self)
 
     @classmethod
     def current_db(cls) -> "Database":
@@ -686,12 +1751,7 @@ class Database(ReplicatedModel):
         Returns the current database.
         """
         try:
-            return (
-                DatabaseConfig.objects.select_related("current_db")
-                .prefetch_related("current_db__matrixreplicationtarget_set")
-                .get()
-                .current_db
-            )
+            return copy_cached_instance(DatabaseConfig.get_cached().current_db)
         except DatabaseConfig.DoesNotExist:
             raise Database.DoesNotExist()
 
@@ -700,7 +1760,10 @@ class Database(ReplicatedModel):
         """
         Returns the current database.
         """
-        return await sync_to_async(cls.current_db)()
+        try:
+            return copy_cached_instance((await DatabaseConfig.aget_cached()).current_db)
+        except DatabaseConfig.DoesNotExist:
+            raise Database.DoesNotExist()
 
 
 class AppCatalog(ReplicatedModel):
@@ -791,12 +1854,7 @@ class Device(ReplicatedModel):
         Returns the current device.
         """
         try:
-            return (
-                DatabaseConfig.objects.select_related("current_device")
-                .prefetch_related("current_device__matrixcredentials_set")
-                .get()
-                .current_device
-            )  # type: ignore
+            return copy_cached_instance(DatabaseConfig.get_cached().current_device)  # type: ignore
         except DatabaseConfig.DoesNotExist:
             raise Device.DoesNotExist()
 
@@ -805,7 +1863,11 @@ class Device(ReplicatedModel):
         """
         Returns the current device.
         """
-        return await sync_to_async(cls.current_device)()
+        try:
+            config = await DatabaseConfig.aget_cached()
+            return copy_cached_instance(config.current_device)  # type: ignore
+        except DatabaseConfig.DoesNotExist:
+            raise Device.DoesNotExist()
 
 
 class Snapshot(ReplicatedModel):
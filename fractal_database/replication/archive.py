@@ -0,0 +1,253 @@
+import json
+import logging
+import mmap
+import os
+import threading
+from collections import defaultdict
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.serializers.json import DjangoJSONEncoder
+from fractal_database.compression import compress, decompress
+
+if TYPE_CHECKING:  # pragma:no cover
+    from fractal_database.models import ReplicationLog
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SEGMENT_SIZE = 64 * 1024 * 1024
+
+SEGMENT_SUFFIX = ".seg"
+INDEX_SUFFIX = ".idx"
+
+
+def log_archive_dir() -> Optional[str]:
+    """
+    Returns the directory that compaction archives delivered replication logs to before deleting
+    them, or None to delete them without archiving. Set with
+    settings.FRACTAL_DATABASE_LOG_ARCHIVE_DIR.
+    """
+    return getattr(settings, "FRACTAL_DATABASE_LOG_ARCHIVE_DIR", None)
+
+
+def archive_segment_size() -> int:
+    """
+    Returns the size in bytes after which the archive starts a new segment file.
+    Set with settings.FRACTAL_DATABASE_LOG_ARCHIVE_SEGMENT_SIZE.
+    """
+    return getattr(settings, "FRACTAL_DATABASE_LOG_ARCHIVE_SEGMENT_SIZE", DEFAULT_SEGMENT_SIZE)
+
+
+class LogArchive:
+    """
+    Append-only archive of delivered ReplicationLogs, kept on local disk outside of the database.
+
+    Logs are appended to numbered segment files as records of the pushed instance's fixture
+    and where it was pushed to. Every record is compressed on its own (see
+    fractal_database.compression) so it can be read without decompressing the rest of its
+    segment. Segments are read through memory maps.
+
+    Every segment has an index file next to it with one line per record:
+    [model label, object_id, version, offset, length]. The index is what makes a record
+    visible. A record written to a segment without its index line (ie the process died in
+    between) is never read, and the space it takes is never reused. Appending only writes the
+    index lines of the new records. The index of every segment is loaded on the first read.
+
+    Only one process should append to an archive at a time.
+    """
+
+    def __init__(self, directory: str, segment_size: Optional[int] = None):
+        """
+        Args:
+            directory: The directory the segment files are stored in. Created if it doesn't exist.
+            segment_size: Size in bytes after which a new segment is started.
+                Defaults to archive_segment_size().
+        """
+        self.directory = directory
+        self.segment_size = archive_segment_size() if segment_size is None else segment_size
+        self._lock = threading.Lock()
+        # (model label, object_id) -> version -> (segment number, offset, length)
+        self._index: Optional[Dict[Tuple[str, str], Dict[int, Tuple[int, int, int]]]] = None
+        self._maps: Dict[int, mmap.mmap] = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, segment: int, suffix: str) -> str:
+        return os.path.join(self.directory, f"segment-{segment:06d}{suffix}")
+
+    def segments(self) -> List[int]:
+        """
+        Returns the numbers of the archive's segments in the order they were written.
+        """
+        return sorted(
+            int(name[len("segment-") : -len(SEGMENT_SUFFIX)])
+            for name in os.listdir(self.directory)
+            if name.startswith("segment-") and name.endswith(SEGMENT_SUFFIX)
+        )
+
+    def _load_index(self) -> Dict[Tuple[str, str], Dict[int, Tuple[int, int, int]]]:
+        if self._index is not None:
+            return self._index
+
+        index: Dict[Tuple[str, str], Dict[int, Tuple[int, int, int]]] = defaultdict(dict)
+        for segment in self.segments():
+            try:
+                with open(self._path(segment, INDEX_SUFFIX)) as f:
+                    for line in f:
+                        try:
+                            label, object_id, version, offset, length = json.loads(line)
+                        except ValueError:
+                            # a line cut short by a crash while it was being written
+                            logger.warning("Skipping invalid index entry in segment %s" % segment)
+                            continue
+                        # the first record of a version wins, later ones are duplicates
+                        index[(label, object_id)].setdefault(version, (segment, offset, length))
+            except FileNotFoundError:
+                continue
+        self._index = index
+        return index
+
+    def _current_segment(self) -> int:
+        segments = self.segments()
+        if not segments:
+            return 1
+        segment = segments[-1]
+        if os.path.getsize(self._path(segment, SEGMENT_SUFFIX)) >= self.segment_size:
+            return segment + 1
+        return segment
+
+    @staticmethod
+    def _record(log: "ReplicationLog") -> Tuple[str, Dict[str, Any]]:
+        content_type = ContentType.objects.get_for_id(log.content_type_id)  # type: ignore
+        label = f"{content_type.app_label}.{content_type.model}"
+        target = None
+        if log.target_type_id is not None:  # type: ignore
+            target_type = ContentType.objects.get_for_id(log.target_type_id)  # type: ignore
+            target = f"{target_type.app_label}.{target_type.model}:{log.target_id}"
+        return label, {
+            "id": str(log.pk),
+            "model": label,
+            "object_id": log.object_id,
+            "version": log.instance_version,
+            "target": target,
+            "txn_id": log.txn_id,
+            "date_created": log.date_created,
+            "fixture": log.payload.data,  # type: ignore
+        }
+
+    def append(self, logs: List["ReplicationLog"]) -> None:
+        """
+        Appends the provided logs to the archive. Returns once they are flushed to disk, so
+        that the logs can be deleted from the database. Can be passed to
+        compact_replication_logs as its archive callback.
+
+        Only logs that were pushed (see ReplicationLog.delivered_at) with a payload are
+        archived. The rest never reached their target, so they have no version to travel to.
+
+        Args:
+            logs: The ReplicationLogs to archive. Their payloads are read if they aren't
+                already loaded, so select_related("payload") them.
+        """
+        delivered = [
+            log for log in logs if log.delivered_at is not None and log.payload_id is not None
+        ]
+        if len(delivered) < len(logs):
+            logger.debug(
+                "Not archiving %s undelivered replication logs" % (len(logs) - len(delivered))
+            )
+        logs = delivered
+        if not logs:
+            return None
+
+        with self._lock:
+            segment = self._current_segment()
+            entries = []
+            with open(self._path(segment, SEGMENT_SUFFIX), "ab") as f:
+                offset = f.tell()
+                for log in logs:
+                    label, record = self._record(log)
+                    data = compress(
+                        json.dumps(record, cls=DjangoJSONEncoder, separators=(",", ":")).encode(),
+                        "zlib",
+                    )
+                    f.write(data)
+                    entries.append((label, log.object_id, log.instance_version, offset, len(data)))
+                    offset += len(data)
+                f.flush()
+                os.fsync(f.fileno())
+
+            with open(self._path(segment, INDEX_SUFFIX), "ab+") as f:
+                lines = "".join(json.dumps(entry) + "\n" for entry in entries).encode()
+                if f.tell():
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b"\n":
+                        # don't append to a line cut short by a crash
+                        lines = b"\n" + lines
+                f.write(lines)
+                f.flush()
+                os.fsync(f.fileno())
+
+            # the index is loaded by the first read. Until then the new entries are read from
+            # the index file along with the rest
+            if self._index is not None:
+                for label, object_id, version, offset, length in entries:
+                    self._index[(label, object_id)].setdefault(version, (segment, offset, length))
+
+        logger.info("Archived %s replication logs to segment %s" % (len(logs), segment))
+
+    def _read(self, segment: int, offset: int, length: int) -> Dict[str, Any]:
+        segment_map = self._maps.get(segment)
+        if segment_map is None or offset + length > len(segment_map):
+            # the segment grew since it was mapped
+            if segment_map is not None:
+                segment_map.close()
+            with open(self._path(segment, SEGMENT_SUFFIX), "rb") as f:
+                segment_map = self._maps[segment] = mmap.mmap(
+                    f.fileno(), 0, access=mmap.ACCESS_READ
+                )
+        return json.loads(decompress(segment_map[offset : offset + length]))
+
+    def versions(self, model: str, object_id: Any) -> List[int]:
+        """
+        Returns the archived versions of the provided instance, oldest first.
+
+        Args:
+            model: The instance's model label, ie "fractal_database.database".
+            object_id: The instance's primary key.
+        """
+        with self._lock:
+            return sorted(self._load_index().get((model.lower(), str(object_id)), {}))
+
+    def get(
+        self, model: str, object_id: Any, version: Optional[int] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Returns the archived record of the provided instance at the provided version.
+
+        Args:
+            model: The instance's model label, ie "fractal_database.database".
+            object_id: The instance's primary key.
+            version: The version to return. Defaults to the newest archived version. Returns the
+                newest version older than version if version itself isn't archived.
+
+        Returns:
+            The record, whose "fixture" is the instance's serialized fixture at that version,
+            or None if no version of the instance is archived that old.
+        """
+        with self._lock:
+            versions = self._load_index().get((model.lower(), str(object_id)))
+            if not versions:
+                return None
+            candidates = [v for v in versions if version is None or v <= version]
+            if not candidates:
+                return None
+            return self._read(*versions[max(candidates)])
+
+    def close(self) -> None:
+        """
+        Closes the archive's memory maps.
+        """
+        with self._lock:
+            for segment_map in self._maps.values():
+                segment_map.close()
+            self._maps.clear()
@@ -0,0 +1,143 @@
+import json
+import logging
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from fractal_database.models import SyncCheckpoint
+from fractal_database.replication.tasks import load_data_from_dicts, replicate_fixture
+from taskiq_matrix.filters import create_room_message_filter
+
+if TYPE_CHECKING:  # pragma:no cover
+    from taskiq_matrix.matrix_queue import MatrixQueue, Task
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SYNC_BATCH_SIZE = 1000
+DEFAULT_SYNC_MEMORY_LIMIT = 32 * 1024 * 1024
+
+
+class RoomSync:
+    """
+    Streams the replication tasks of a room into the local database.
+
+    Tasks are fetched one page at a time and their fixtures are decoded one task at a time.
+    Decoded objects are applied in transactions of at most batch_size objects, or sooner once
+    the fixtures decoded for the transaction and the raw tasks of the page being synced reach
+    memory_limit bytes together. Pages are as large as the homeserver makes them, so a page
+    whose raw tasks alone reach memory_limit is applied one task at a time. Every transaction also
+    saves the room's SyncCheckpoint (the page's token and the last task applied from it), so
+    an interrupted sync resumes after the last applied task instead of from the start of the room.
+    """
+
+    def __init__(
+        self,
+        room_id: str,
+        queue: "MatrixQueue",
+        batch_size: Optional[int] = None,
+        memory_limit: Optional[int] = None,
+    ):
+        self.room_id = room_id
+        self.queue = queue
+        self.batch_size = batch_size or getattr(
+            settings, "FRACTAL_DATABASE_SYNC_BATCH_SIZE", DEFAULT_SYNC_BATCH_SIZE
+        )
+        self.memory_limit = memory_limit or getattr(
+            settings, "FRACTAL_DATABASE_SYNC_MEMORY_LIMIT", DEFAULT_SYNC_MEMORY_LIMIT
+        )
+        self._objects: List[Dict[str, Any]] = []
+        self._size = 0
+
+    def _apply(self, since_token: Optional[str], last_task_id: Optional[str]) -> None:
+        with transaction.atomic():
+            if self._objects:
+                load_data_from_dicts(self._objects)
+            SyncCheckpoint.objects.update_or_create(
+                room_id=self.room_id,
+                defaults={"since_token": since_token, "last_task_id": last_task_id},
+            )
+
+    async def _flush(self, since_token: Optional[str], last_task_id: Optional[str]) -> None:
+        await sync_to_async(self._apply)(since_token, last_task_id)
+        logger.info("Applied %s objects synced from %s" % (len(self._objects), self.room_id))
+        self._objects = []
+        self._size = 0
+
+    @staticmethod
+    def _task_size(task: "Task") -> int:
+        """
+        Returns the approximate size in bytes of the provided task's raw event, which is
+        mostly made up of its encoded arguments (ie the fixture).
+        """
+        args = task.data.get("args") or []  # type: ignore
+        return sum(len(arg) for arg in args if isinstance(arg, (str, bytes)))
+
+    def _decode(self, task: "Task") -> int:
+        # other tasks share the replication queue (ie send_full_fixtures)
+        if task.data.get("task_name") != replicate_fixture.task_name:  # type: ignore
+            logger.debug("Skipping task %s that doesn't replicate a fixture" % task.id)
+            return 0
+        try:
+            fixture = task.data["args"][0]  # type: ignore
+            objects = json.loads(fixture)
+        except (KeyError, IndexError, TypeError, ValueError):
+            logger.warning("Skipping task %s without a fixture" % task.id)
+            return 0
+        self._objects.extend(objects)
+        self._size += len(fixture)
+        return len(objects)
+
+    async def run(self, restart: bool = False) -> int:
+        """
+        Syncs the room's replication tasks into the local database.
+
+        Args:
+            restart: Sync from the start of the room instead of from the last checkpoint.
+
+        Returns:
+            The number of objects synced.
+        """
+        checkpoint = await SyncCheckpoint.objects.filter(room_id=self.room_id).afirst()
+        since_token = None if restart or not checkpoint else checkpoint.since_token
+        last_task_id = None if restart or not checkpoint else checkpoint.last_task_id
+        task_filter = create_room_message_filter(self.room_id, types=[self.queue.task_types.task])
+        synced = 0
+
+        while True:
+            tasks, next_token = await self.queue.get_tasks_from_room(
+                self.room_id, task_filter=task_filter, start=since_token or ""
+            )
+            task_ids = [task.id for task in tasks]
+            if last_task_id in task_ids:
+                # these tasks were applied before the previous sync was interrupted
+                tasks = tasks[task_ids.index(last_task_id) + 1 :]
+
+            # the raw tasks of the page stay in memory until the whole page is synced
+            page_size = sum(self._task_size(task) for task in tasks)
+            if page_size >= self.memory_limit:
+                logger.warning(
+                    "Page of %s tasks from %s takes %s bytes, more than the sync memory limit"
+                    % (len(tasks), self.room_id, page_size)
+                )
+
+            for task in tasks:
+                synced += self._decode(task)
+                last_task_id = task.id
+                if (
+                    len(self._objects) >= self.batch_size
+                    or page_size + self._size >= self.memory_limit
+                ):
+                    await self._flush(since_token, last_task_id)
+
+            if not task_ids or not next_token or next_token == since_token:
+                # reached the end of the room
+                await self._flush(since_token, last_task_id)
+                break
+
+            # the whole page is applied, the next sync can start from the next page
+            since_token, last_task_id = next_token, None
+            await self._flush(since_token, last_task_id)
+
+        logger.info("Synced %s objects from %s" % (synced, self.room_id))
+        return synced
@@ -0,0 +1,253 @@
+import logging
+from datetime import timedelta
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Max, OuterRef, Q, QuerySet, Subquery
+from django.utils import timezone
+
+if TYPE_CHECKING:  # pragma:no cover
+    from fractal_database.models import ReplicationLog
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LOG_RETENTION = 7 * 24 * 60 * 60
+DEFAULT_COMPACTION_BATCH_SIZE = 1000
+DEFAULT_VACUUM_THRESHOLD = 64 * 1024 * 1024
+
+
+def log_retention() -> float:
+    """
+    Returns the number of seconds that delivered replication logs, applied representation logs
+    and unused replication payloads are kept before compaction removes them.
+    Set with settings.FRACTAL_DATABASE_LOG_RETENTION.
+    """
+    return getattr(settings, "FRACTAL_DATABASE_LOG_RETENTION", DEFAULT_LOG_RETENTION)
+
+
+def compaction_batch_size() -> int:
+    """
+    Returns the number of rows that compaction deletes per transaction. Smaller batches hold
+    the write lock for less time. Set with settings.FRACTAL_DATABASE_LOG_COMPACTION_BATCH_SIZE.
+    """
+    return getattr(
+        settings, "FRACTAL_DATABASE_LOG_COMPACTION_BATCH_SIZE", DEFAULT_COMPACTION_BATCH_SIZE
+    )
+
+
+def compaction_interval() -> Optional[float]:
+    """
+    Returns the number of seconds between the compactions that the ReplicationDispatcher runs
+    in the background, or None to only compact with the compact_replication_logs command.
+    Set with settings.FRACTAL_DATABASE_LOG_COMPACTION_INTERVAL.
+    """
+    return getattr(settings, "FRACTAL_DATABASE_LOG_COMPACTION_INTERVAL", None)
+
+
+def vacuum_threshold() -> Optional[int]:
+    """
+    Returns the number of bytes of free pages after which compaction vacuums the database
+    (SQLite only) without being asked to, or None to only vacuum when asked.
+    Set with settings.FRACTAL_DATABASE_LOG_COMPACTION_VACUUM_THRESHOLD.
+    """
+    return getattr(
+        settings, "FRACTAL_DATABASE_LOG_COMPACTION_VACUUM_THRESHOLD", DEFAULT_VACUUM_THRESHOLD
+    )
+
+
+def _free_bytes(using: str) -> Optional[int]:
+    """
+    Returns the number of bytes taken by the free pages of the database file, which is what
+    VACUUM would give back to the filesystem, or None if the database isn't SQLite.
+    """
+    connection = connections[using]
+    if connection.vendor != "sqlite":
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute("PRAGMA freelist_count")
+        freelist_count = cursor.fetchone()[0]
+        cursor.execute("PRAGMA page_size")
+        return freelist_count * cursor.fetchone()[0]
+
+
+def _database_size(using: str) -> Optional[int]:
+    """
+    Returns the size of the database file in bytes, or None if the database isn't SQLite.
+    """
+    connection = connections[using]
+    if connection.vendor != "sqlite":
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute("PRAGMA page_count")
+        page_count = cursor.fetchone()[0]
+        cursor.execute("PRAGMA page_size")
+        return page_count * cursor.fetchone()[0]
+
+
+def _delete_in_batches(
+    queryset: QuerySet,
+    batch_size: int,
+    using: str,
+    archive: Optional[Callable[[List["ReplicationLog"]], None]] = None,
+) -> int:
+    """
+    Deletes the rows of the provided queryset batch_size rows per transaction.
+
+    Args:
+        queryset: The rows to delete.
+        batch_size: The number of rows to delete per transaction.
+        using: The database to delete from.
+        archive: Called with every batch of rows before they are deleted, in the same
+            transaction. A batch is not deleted if it raises.
+
+    Returns:
+        The number of rows deleted.
+    """
+    deleted = 0
+    while True:
+        with transaction.atomic(using=using):
+            # oldest first, which the partial date_created indexes of the logs return in order
+            batch = queryset.order_by("date_created")[:batch_size]
+            if archive is not None:
+                rows = list(batch)
+                pks = [row.pk for row in rows]
+            else:
+                pks = list(batch.values_list("pk", flat=True))
+            if not pks:
+                return deleted
+            if archive is not None:
+                archive(rows)
+            queryset.model.objects.using(using).filter(pk__in=pks).delete()
+        deleted += len(pks)
+        if len(pks) < batch_size:
+            return deleted
+
+
+def compact_replication_logs(
+    retention: Optional[float] = None,
+    batch_size: Optional[int] = None,
+    vacuum: Optional[bool] = None,
+    archive: Optional[Callable[[List["ReplicationLog"]], None]] = None,
+    using: str = DEFAULT_DB_ALIAS,
+) -> Dict[str, Optional[int]]:
+    """
+    Removes the rows that replication no longer needs once they are older than the retention
+    window:
+
+    - ReplicationLogs that have been pushed (see ReplicationLog.delivered_at), except the
+      newest pushed version of every instance on every target.
+    - ReplicationLogs that were dropped without being pushed, once a newer version of their
+      instance has been pushed to their target.
+    - RepresentationLogs that have been applied and that no pending ReplicationLog references.
+    - ReplicationPayloads that no ReplicationLog references, except the newest payload of every
+      instance which the next delta payload of the instance is encoded against.
+
+    Rows are deleted in batches, each in its own transaction, so that replication isn't blocked
+    on the write lock for long. On SQLite the database can then be vacuumed and analyzed to give
+    the freed pages back to the filesystem and refresh the query planner's statistics. VACUUM
+    rewrites the whole database file, so by default it only runs once the free pages pass
+    vacuum_threshold().
+
+    Args:
+        retention: Number of seconds to keep rows for. Defaults to log_retention().
+        batch_size: Number of rows deleted per transaction. Defaults to compaction_batch_size().
+        vacuum: Whether to VACUUM and ANALYZE the database (SQLite only) after deleting.
+            Defaults to doing so only if its free pages take more than vacuum_threshold() bytes.
+        archive: Called with every batch of pushed ReplicationLogs before they are deleted.
+            Defaults to appending them to the LogArchive in log_archive_dir(), if it's set.
+        using: The database to compact.
+
+    Returns:
+        The number of rows deleted from each table, and the number of bytes the database file
+        shrank by (None if the database isn't SQLite).
+    """
+    from fractal_database.models import ReplicationLog, ReplicationPayload, RepresentationLog
+    from fractal_database.replication.archive import LogArchive, log_archive_dir
+
+    if archive is None and log_archive_dir():
+        archive = LogArchive(log_archive_dir()).append  # type: ignore
+
+    retention = log_retention() if retention is None else retention
+    batch_size = compaction_batch_size() if batch_size is None else batch_size
+    cutoff = timezone.now() - timedelta(seconds=retention)
+    size_before = _database_size(using)
+
+    # the newest delivered version of every instance on every target is kept, since the next
+    # delta payload of the instance is encoded against it and it stops related objects from
+    # logging the version again (see ReplicatedModel._create_replication_logs)
+    newest_delivered = (
+        ReplicationLog.objects.using(using)
+        .filter(
+            content_type_id=OuterRef("content_type_id"),
+            object_id=OuterRef("object_id"),
+            target_type_id=OuterRef("target_type_id"),
+            target_id=OuterRef("target_id"),
+            delivered_at__isnull=False,
+        )
+        .values("content_type_id", "object_id", "target_type_id", "target_id")
+        .annotate(version=Max("instance_version"))
+        .values("version")
+    )
+    superseded = ReplicationLog.objects.using(using).filter(
+        deleted=True, date_created__lt=cutoff, instance_version__lt=Subquery(newest_delivered)
+    )
+
+    report: Dict[str, Optional[int]] = {}
+    report["replication_logs"] = _delete_in_batches(
+        superseded.filter(delivered_at__isnull=False).select_related("payload"),
+        batch_size,
+        using,
+        archive=archive,
+    )
+    # logs that were dropped without being pushed (superseded or collapsed by debouncing) are
+    # deleted without being archived
+    report["replication_logs"] += _delete_in_batches(
+        superseded.filter(delivered_at__isnull=True), batch_size, using
+    )
+    report["representation_logs"] = _delete_in_batches(
+        RepresentationLog.objects.using(using)
+        .filter(deleted=True, date_created__lt=cutoff)
+        .exclude(replicationlog__deleted=False),
+        batch_size,
+        using,
+    )
+    newest_versions = (
+        ReplicationPayload.objects.using(using)
+        .filter(content_type_id=OuterRef("content_type_id"), object_id=OuterRef("object_id"))
+        .values("content_type_id", "object_id")
+        .annotate(version=Max("object_version"))
+        .values("version")
+    )
+    report["replication_payloads"] = _delete_in_batches(
+        ReplicationPayload.objects.using(using)
+        .filter(date_created__lt=cutoff, replication_logs__isnull=True)
+        .filter(~Q(object_version=Subquery(newest_versions))),
+        batch_size,
+        using,
+    )
+
+    if vacuum is None:
+        threshold = vacuum_threshold()
+        free_bytes = _free_bytes(using)
+        vacuum = threshold is not None and free_bytes is not None and free_bytes >= threshold
+
+    connection = connections[using]
+    if vacuum and connection.vendor == "sqlite":
+        with connection.cursor() as cursor:
+            cursor.execute("VACUUM")
+            cursor.execute("ANALYZE")
+
+    size_after = _database_size(using)
+    report["bytes_reclaimed"] = (
+        size_before - size_after if size_before is not None and size_after is not None else None
+    )
+    logger.info(
+        "Compacted %s replication logs, %s representation logs and %s replication payloads"
+        % (
+            report["replication_logs"],
+            report["representation_logs"],
+            report["replication_payloads"],
+        )
+    )
+    return report
@@ -0,0 +1,342 @@
+import asyncio
+import atexit
+import concurrent.futures
+import logging
+import queue
+import threading
+from typing import TYPE_CHECKING, Any, Dict, Optional, Set, Tuple
+
+from asgiref.sync import SyncToAsync, sync_to_async
+from django.conf import settings
+from fractal_database.replication.compaction import compaction_interval
+
+if TYPE_CHECKING:  # pragma:no cover
+    from fractal_database.models import ReplicationTarget
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_QUEUE_SIZE = 1000
+DEFAULT_MAX_CONCURRENCY = 4
+
+
+def background_replication_enabled() -> bool:
+    """
+    Returns True if committed transactions should hand replication off to the
+    ReplicationDispatcher instead of replicating in the committing thread.
+    Enabled with settings.FRACTAL_DATABASE_BACKGROUND_REPLICATION.
+    """
+    return getattr(settings, "FRACTAL_DATABASE_BACKGROUND_REPLICATION", False)
+
+
+class SyncExecutor(concurrent.futures.Executor):
+    """
+    Runs the sync calls of the dispatcher's event loop on a single thread of its own.
+
+    Unlike ThreadPoolExecutor, it keeps accepting work once the interpreter starts shutting
+    down. concurrent.futures refuses new work before atexit hooks run, so without it the
+    dispatcher couldn't finish the replication that is queued when the process exits.
+    """
+
+    def __init__(self, name: str):
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            future, fn, args, kwargs = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+
+    def submit(self, fn, /, *args, **kwargs) -> concurrent.futures.Future:
+        future: concurrent.futures.Future = concurrent.futures.Future()
+        self._queue.put((future, fn, args, kwargs))
+        return future
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False) -> None:
+        self._queue.put(None)
+        if wait:
+            self._thread.join()
+
+
+class DispatcherEventLoop(asyncio.SelectorEventLoop):
+    """
+    Event loop of the dispatcher thread. Runs the work that would go to the default executor
+    or to asgiref's single thread executor (ie sync_to_async) on a SyncExecutor instead.
+    """
+
+    def __init__(self, executor: SyncExecutor):
+        super().__init__()
+        self.sync_executor = executor
+
+    def run_in_executor(self, executor, func, *args):
+        if executor is None or executor is SyncToAsync.single_thread_executor:
+            executor = self.sync_executor
+        return super().run_in_executor(executor, func, *args)
+
+
+class ReplicationDispatcher:
+    """
+    Replicates ReplicationTargets from a long-lived background thread that runs its own event loop.
+
+    ReplicationLogs are the outbox: they are written in the same transaction as the change they
+    replicate, so the transaction.on_commit handler only has to wake the dispatcher up for a
+    target. A target is queued at most once at a time since ReplicationTarget.replicate() drains
+    every pending log for the target.
+
+    Up to max_concurrency different targets replicate concurrently, so a slow target doesn't
+    hold up the others. A target never replicates concurrently with itself, which keeps its
+    logs pushed in transaction order.
+    """
+
+    def __init__(
+        self,
+        max_queue_size: int = DEFAULT_MAX_QUEUE_SIZE,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    ):
+        self.max_queue_size = max_queue_size
+        self.max_concurrency = max_concurrency
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._thread: Optional[threading.Thread] = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        # targets that are waiting to replicate (queued or waiting for their current run to finish)
+        self._pending: Dict[Tuple[type, Any], "ReplicationTarget"] = {}
+        # targets that are currently replicating
+        self._active: Set[Tuple[type, Any]] = set()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        """
+        Starts the dispatcher thread if it isn't already running.
+        """
+        with self._lock:
+            if self.running:
+                return
+            self._ready.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="fractal-replication-dispatcher", daemon=True
+            )
+            self._thread.start()
+        self._ready.wait()
+
+    def _run(self) -> None:
+        executor = SyncExecutor(name="fractal-replication-dispatcher-sync")
+        self._loop = DispatcherEventLoop(executor)
+        asyncio.set_event_loop(self._loop)
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        workers = [self._loop.create_task(self._worker()) for _ in range(self.max_concurrency)]
+        self._ready.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            self._loop.run_until_complete(asyncio.gather(*workers, return_exceptions=True))
+            self._loop.close()
+            executor.shutdown()
+
+    def wake(self, target: "ReplicationTarget") -> None:
+        """
+        Queues the provided target for replication. Never blocks the caller.
+
+        Args:
+            target: The ReplicationTarget that has pending ReplicationLogs.
+        """
+        self.start()
+        key = (target.__class__, target.pk)
+        with self._lock:
+            if key in self._pending:
+                logger.debug("Replication of %s is already queued" % target)
+                return
+            if len(self._pending) >= self.max_queue_size:
+                # the logs stay in the outbox and are drained the next time the target is woken up
+                logger.warning("Replication queue is full. Not queueing replication of %s" % target)
+                return
+            self._pending[key] = target
+            if key in self._active:
+                # queued again by the worker once the current run finishes
+                return
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, key)  # type: ignore
+
+    def wake_later(self, target: "ReplicationTarget", delay: float) -> None:
+        """
+        Queues the provided target for replication after delay seconds. Used to push the
+        replication logs that a target held back for debouncing once their window closes.
+
+        Args:
+            target: The ReplicationTarget that has held back ReplicationLogs.
+            delay: Number of seconds to wait before queueing the target.
+        """
+        self.start()
+        self._loop.call_soon_threadsafe(self._loop.call_later, delay, self.wake, target)  # type: ignore
+
+    def schedule_compaction(self, interval: float) -> None:
+        """
+        Compacts the replication logs every interval seconds in the background
+        (see fractal_database.replication.compaction).
+
+        Args:
+            interval: Number of seconds between compactions.
+        """
+        self.start()
+        self._loop.call_soon_threadsafe(self._loop.call_later, interval, self._compact, interval)  # type: ignore
+
+    def _compact(self, interval: float) -> None:
+        self._loop.create_task(self._run_compaction(interval))  # type: ignore
+
+    async def _run_compaction(self, interval: float) -> None:
+        from fractal_database.replication.compaction import compact_replication_logs
+
+        try:
+            await sync_to_async(compact_replication_logs)()
+        except Exception as e:
+            logger.exception("Error compacting replication logs: %s" % e)
+        finally:
+            self._loop.call_later(interval, self._compact, interval)  # type: ignore
+
+    def queue_depths(self) -> Dict[str, int]:
+        """
+        Returns the number of undelivered ReplicationLogs for every target that has any.
+
+        Returns:
+            A dict of "<app_label>.<model>:<target_id>" to the target's number of pending logs.
+        """
+        from django.contrib.contenttypes.models import ContentType
+        from django.db.models import Count
+        from fractal_database.models import ReplicationLog
+
+        depths = (
+            ReplicationLog.objects.filter(deleted=False, target_type__isnull=False)
+            .values_list("target_type", "target_id")
+            .annotate(depth=Count("id"))
+            .order_by()
+        )
+        depths_by_target = {}
+        for target_type_id, target_id, depth in depths:
+            content_type = ContentType.objects.get_for_id(target_type_id)
+            depths_by_target[f"{content_type.app_label}.{content_type.model}:{target_id}"] = depth
+        return depths_by_target
+
+    def status(self) -> Dict[str, Dict[str, bool]]:
+        """
+        Returns whether each target known to the dispatcher is queued and/or replicating,
+        keyed the same way as queue_depths.
+        """
+        with self._lock:
+            keys = {*self._pending, *self._active}
+            return {
+                f"{model._meta.label_lower}:{pk}": {
+                    "queued": (model, pk) in self._pending,
+                    "replicating": (model, pk) in self._active,
+                }
+                for model, pk in keys
+            }
+
+    def wake_pending(self) -> None:
+        """
+        Queues every target that has undelivered ReplicationLogs. Used to resume replication
+        that was interrupted before it could complete (ie the process exited).
+        """
+        self.start()
+        asyncio.run_coroutine_threadsafe(self._wake_pending(), self._loop)  # type: ignore
+
+    async def _wake_pending(self) -> None:
+        from django.contrib.contenttypes.models import ContentType
+        from fractal_database.models import ReplicationLog
+
+        pending = (
+            ReplicationLog.objects.filter(deleted=False, target_type__isnull=False)
+            .values_list("target_type", "target_id")
+            .distinct()
+        )
+        async for target_type_id, target_id in pending:
+            content_type = await sync_to_async(ContentType.objects.get_for_id)(target_type_id)
+            try:
+                target = await content_type.model_class().objects.aget(pk=target_id)  # type: ignore
+            except Exception as e:
+                logger.warning(
+                    "Failed to load target %s for pending replication: %s" % (target_id, e)
+                )
+                continue
+            self.wake(target)
+
+    async def _worker(self) -> None:
+        while True:
+            key = await self._queue.get()  # type: ignore
+            with self._lock:
+                target = self._pending.pop(key)
+                self._active.add(key)
+            try:
+                logger.info("Dispatcher calling %s.replicate()" % target)
+                await target.replicate()
+            except Exception as e:
+                logger.exception("Error replicating %s: %s" % (target, e))
+            finally:
+                with self._lock:
+                    self._active.discard(key)
+                    # a wake up that arrived while the target was replicating queues it again,
+                    # so logs committed during replicate() are not missed
+                    if key in self._pending:
+                        self._queue.put_nowait(key)  # type: ignore
+                self._queue.task_done()  # type: ignore
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """
+        Waits for the queued targets to finish replicating, then stops the dispatcher thread.
+
+        Args:
+            timeout: Maximum number of seconds to wait for queued replication to finish.
+        """
+        if not self.running:
+            return
+
+        try:
+            asyncio.run_coroutine_threadsafe(self._queue.join(), self._loop).result(timeout)  # type: ignore
+        except concurrent.futures.TimeoutError:
+            logger.warning("Timed out waiting for queued replication to finish")
+
+        self._loop.call_soon_threadsafe(self._loop.stop)  # type: ignore
+        self._thread.join(timeout)  # type: ignore
+
+
+_dispatcher: Optional[ReplicationDispatcher] = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher() -> ReplicationDispatcher:
+    """
+    Returns the process wide ReplicationDispatcher, starting it on first use.
+    """
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = ReplicationDispatcher(
+                max_queue_size=getattr(
+                    settings, "FRACTAL_DATABASE_REPLICATION_QUEUE_SIZE", DEFAULT_MAX_QUEUE_SIZE
+                ),
+                max_concurrency=getattr(
+                    settings, "FRACTAL_DATABASE_REPLICATION_CONCURRENCY", DEFAULT_MAX_CONCURRENCY
+                ),
+            )
+            # lets queued replication finish before the interpreter exits. The dispatcher runs
+            # its sync calls on its own SyncExecutor, which still accepts work at that point
+            atexit.register(_dispatcher.stop)
+            _dispatcher.wake_pending()
+            interval = compaction_interval()
+            if interval:
+                _dispatcher.schedule_compaction(interval)
+    return _dispatcher
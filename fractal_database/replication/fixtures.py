@@ -0,0 +1,364 @@
+import json
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Type, Union
+
+from django.apps import apps
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.core import serializers
+from django.core.serializers.base import DEFER_FIELD, DeserializedObject
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DEFAULT_DB_ALIAS, connections, models, transaction
+from django.db.models.constants import OnConflict
+from django.db.models.signals import post_save, pre_save
+
+logger = logging.getLogger(__name__)
+
+
+def bulk_apply_enabled() -> bool:
+    """
+    Returns True if incoming fixtures should be loaded with apply_fixture instead of loaddata.
+    Enabled with settings.FRACTAL_DATABASE_BULK_APPLY_FIXTURES.
+    """
+    return getattr(settings, "FRACTAL_DATABASE_BULK_APPLY_FIXTURES", False)
+
+
+def skip_stale_fixtures_enabled() -> bool:
+    """
+    Returns True if incoming objects that aren't newer than their local copy should be
+    dropped before loading them. Disabled with settings.FRACTAL_DATABASE_SKIP_STALE_FIXTURES.
+    """
+    return getattr(settings, "FRACTAL_DATABASE_SKIP_STALE_FIXTURES", True)
+
+
+def drop_stale_objects(
+    fixture: List[Dict[str, Any]], using: str = DEFAULT_DB_ALIAS
+) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Drops the serialized objects whose object_version isn't newer than the version of their
+    local copy. The local versions are fetched with one query per model in the fixture.
+
+    Args:
+        fixture: A deserialized Django fixture.
+        using: The database alias to compare versions against.
+
+    Returns:
+        A tuple of the objects that should be loaded and the number of objects that were dropped.
+    """
+    pks_by_model: Dict[str, List[Any]] = {}
+    for obj in fixture:
+        if obj.get("pk") is not None and "object_version" in obj.get("fields", {}):
+            pks_by_model.setdefault(obj["model"].lower(), []).append(obj["pk"])
+
+    local_versions: Dict[str, Dict[Any, int]] = {}
+    for label, pks in pks_by_model.items():
+        try:
+            model = apps.get_model(label)
+            model._meta.get_field("object_version")
+        except (LookupError, FieldDoesNotExist):
+            continue
+        to_pk = model._meta.pk.to_python
+        # keyed by the string form of the pk, which is how the fixture serializes it
+        local_versions[label] = {
+            str(pk): version
+            for pk, version in model._base_manager.using(using)
+            .filter(pk__in=[to_pk(pk) for pk in pks])
+            .values_list("pk", "object_version")
+        }
+
+    fresh = []
+    for obj in fixture:
+        local_version = local_versions.get(obj["model"].lower(), {}).get(str(obj.get("pk")))
+        if local_version is not None and obj["fields"]["object_version"] <= local_version:
+            continue
+        fresh.append(obj)
+
+    return fresh, len(fixture) - len(fresh)
+
+
+def delta_payloads_enabled() -> bool:
+    """
+    Returns True if replication logs should push only the fields of an object that changed since
+    its previous version (see encode_delta). Every device that receives the logs must be able to
+    expand deltas. Enabled with settings.FRACTAL_DATABASE_DELTA_PAYLOADS.
+    """
+    return getattr(settings, "FRACTAL_DATABASE_DELTA_PAYLOADS", False)
+
+
+def _to_json(value: Any) -> Any:
+    # serialized values are compared in the form they are stored and pushed in
+    return json.loads(json.dumps(value, cls=DjangoJSONEncoder))
+
+
+def encode_delta(base: Dict[str, Any], obj: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Returns the serialized object with only the fields that differ from a previous serialized
+    version of the same object, along with the base_version the delta applies to.
+
+    Args:
+        base: The serialized object at a previous version.
+        obj: The serialized object at its current version.
+
+    Returns:
+        The delta, or None if it wouldn't be any smaller than the serialized object.
+    """
+    base, obj = _to_json(base), _to_json(obj)
+    fields = {
+        name: value
+        for name, value in obj["fields"].items()
+        if name not in base["fields"] or base["fields"][name] != value
+    }
+    if len(fields) >= len(obj["fields"]):
+        return None
+    fields["object_version"] = obj["fields"]["object_version"]
+    return {
+        "model": obj["model"],
+        "pk": obj["pk"],
+        "base_version": base["fields"]["object_version"],
+        "fields": fields,
+    }
+
+
+def expand_deltas(
+    fixture: List[Dict[str, Any]], using: str = DEFAULT_DB_ALIAS
+) -> Tuple[List[Dict[str, Any]], List[Tuple[str, Any]]]:
+    """
+    Replaces the deltas in the provided fixture (see encode_delta) with the full serialized
+    object, by applying them on top of their local copy. The local copies are fetched with
+    one query per model in the fixture.
+
+    Args:
+        fixture: A deserialized Django fixture.
+        using: The database alias the local copies are read from.
+
+    Returns:
+        A tuple of the expanded fixture and the (model label, pk) of the deltas that couldn't be
+        applied because there is no local copy at their base version.
+    """
+    deltas_by_model: Dict[str, List[Any]] = {}
+    for obj in fixture:
+        if "base_version" in obj:
+            deltas_by_model.setdefault(obj["model"].lower(), []).append(obj["pk"])
+    if not deltas_by_model:
+        return fixture, []
+
+    local: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    for label, pks in deltas_by_model.items():
+        try:
+            model = apps.get_model(label)
+        except LookupError:
+            continue
+        to_pk = model._meta.pk.to_python
+        queryset = model._base_manager.using(using).filter(pk__in=[to_pk(pk) for pk in pks])
+        for local_obj in _to_json(serializers.serialize("python", queryset)):
+            local[(label, str(local_obj["pk"]))] = local_obj
+
+    expanded, missing = [], []
+    for obj in fixture:
+        if "base_version" not in obj:
+            expanded.append(obj)
+            continue
+        label = obj["model"].lower()
+        base = local.get((label, str(obj["pk"])))
+        if base is None or base["fields"].get("object_version") != obj["base_version"]:
+            missing.append((label, obj["pk"]))
+            continue
+        expanded.append(
+            {"model": obj["model"], "pk": obj["pk"], "fields": {**base["fields"], **obj["fields"]}}
+        )
+    return expanded, missing
+
+
+def sort_models(model_list: Iterable[Type[models.Model]]) -> List[Type[models.Model]]:
+    """
+    Orders the provided models so that models come after the models their foreign keys
+    and many to many fields point to. Models that are part of a dependency cycle keep their original order.
+
+    Args:
+        model_list: The models to order.
+    """
+    from fractal_database.replication.graph import model_order
+
+    pending = list(dict.fromkeys(model_list))
+    order = model_order()
+    if all(model in order for model in pending):
+        # replicated models are ordered once when the app is ready
+        return sorted(pending, key=order.__getitem__)
+
+    ordered: List[Type[models.Model]] = []
+    while pending:
+        for model in pending:
+            dependencies = {
+                field.related_model
+                for field in (*model._meta.concrete_fields, *model._meta.local_many_to_many)
+                if field.is_relation and field.related_model is not model
+            }
+            if not dependencies.intersection(pending):
+                break
+        else:
+            # a cycle, foreign key constraints are checked when the transaction commits
+            model = pending[0]
+        pending.remove(model)
+        ordered.append(model)
+    return ordered
+
+
+def _group_by_model(
+    objects: Iterable[DeserializedObject],
+) -> Dict[Type[models.Model], Dict[Any, DeserializedObject]]:
+    grouped: Dict[Type[models.Model], Dict[Any, DeserializedObject]] = {}
+    for obj in objects:
+        # the last serialized copy of an object wins, same as saving them one by one
+        grouped.setdefault(obj.object.__class__, {})[obj.object.pk] = obj
+    return grouped
+
+
+def _can_bulk_apply(model: Type[models.Model], using: str) -> bool:
+    # bulk inserts can't save the parents of multi-table inherited models
+    return (
+        not model._meta.parents
+        and connections[using].features.supports_update_conflicts_with_target
+    )
+
+
+def _upsert(model: Type[models.Model], objs: List[models.Model], using: str) -> None:
+    """
+    Inserts the provided objects, updating the rows that already exist. Like a raw save,
+    field values (ie auto_now timestamps) are written exactly as they were serialized.
+    """
+    opts = model._meta
+    fields = [f for f in opts.local_concrete_fields if not f.generated]
+    update_fields = [f for f in fields if not f.primary_key]
+    batch_size = max(connections[using].ops.bulk_batch_size(fields, objs), 1)
+    for start in range(0, len(objs), batch_size):
+        model._base_manager.using(using)._insert(
+            objs[start : start + batch_size],
+            fields=fields,
+            raw=True,
+            using=using,
+            on_conflict=OnConflict.UPDATE if update_fields else OnConflict.IGNORE,
+            update_fields=update_fields or None,
+            unique_fields=[opts.pk] if update_fields else None,
+        )
+    for obj in objs:
+        obj._state.adding = False
+        obj._state.db = using
+
+
+def _set_m2m(model: Type[models.Model], objs: List[DeserializedObject], using: str) -> None:
+    """
+    Replaces the many to many relations of the provided objects with the serialized ones,
+    diffing against the existing through rows so unchanged relations are left alone.
+    """
+    from fractal_database.models import InstanceTarget, target_registry
+
+    for field in model._meta.local_many_to_many:
+        through = field.remote_field.through
+        if not through._meta.auto_created:
+            # the serializers skip many to many fields with a custom through model
+            continue
+        wanted = {
+            obj.object.pk: set(obj.m2m_data[field.name])
+            for obj in objs
+            if obj.m2m_data and obj.m2m_data.get(field.name, DEFER_FIELD) is not DEFER_FIELD
+        }
+        if not wanted:
+            continue
+
+        source = through._meta.get_field(field.m2m_field_name()).attname
+        target = through._meta.get_field(field.m2m_reverse_field_name()).attname
+        existing: Dict[Tuple[Any, Any], Any] = {
+            (source_id, target_id): pk
+            for pk, source_id, target_id in through._base_manager.using(using)
+            .filter(**{f"{source}__in": wanted})
+            .values_list("pk", source, target)
+        }
+        rows = {
+            (source_id, target_id)
+            for source_id, target_ids in wanted.items()
+            for target_id in target_ids
+        }
+
+        stale = [pk for row, pk in existing.items() if row not in rows]
+        if stale:
+            through._base_manager.using(using).filter(pk__in=stale).delete()
+        through._base_manager.using(using).bulk_create(
+            [
+                through(**{source: source_id, target: target_id})
+                for source_id, target_id in rows
+                if (source_id, target_id) not in existing
+            ]
+        )
+
+        if field.name == "instances" and model in target_registry.target_types:
+            # m2m_changed isn't sent, keep the instance -> target index up to date here
+            InstanceTarget.index_targets(model, list(wanted))
+
+
+def apply_fixture(fixture: Union[str, List[Dict[str, Any]]], using: str = DEFAULT_DB_ALIAS) -> int:
+    """
+    Loads a fixture into the local database with a few bulk queries per model instead of
+    saving every object separately like loaddata does.
+
+    Objects are grouped by model and upserted in dependency order inside of a single
+    transaction, after which their many to many relations are set in bulk. Like loaddata,
+    objects are saved raw: serialized values (including object_version) are written as is
+    and pre_save/post_save are sent with raw=True. m2m_changed is not sent.
+
+    Args:
+        fixture: A Django fixture encoded as a JSON string or its deserialized list of dicts.
+        using: The database alias to load the fixture into.
+
+    Returns:
+        The number of objects loaded.
+    """
+    if isinstance(fixture, str):
+        fixture = json.loads(fixture)
+
+    objects = serializers.deserialize(
+        "python", fixture, using=using, handle_forward_references=True
+    )
+    grouped = _group_by_model(objects)
+    loaded = 0
+
+    with transaction.atomic(using=using):
+        for model in sort_models(grouped):
+            deserialized = list(grouped[model].values())
+            instances = [obj.object for obj in deserialized]
+
+            if not _can_bulk_apply(model, using):
+                for obj in deserialized:
+                    obj.save(using=using)
+                loaded += len(deserialized)
+                continue
+
+            existing = set(
+                model._base_manager.using(using)
+                .filter(pk__in=[instance.pk for instance in instances])
+                .values_list("pk", flat=True)
+            )
+            for instance in instances:
+                pre_save.send(
+                    sender=model, instance=instance, raw=True, using=using, update_fields=None
+                )
+            _upsert(model, instances, using)
+            _set_m2m(model, deserialized, using)
+            for instance in instances:
+                post_save.send(
+                    sender=model,
+                    instance=instance,
+                    created=instance.pk not in existing,
+                    update_fields=None,
+                    raw=True,
+                    using=using,
+                )
+            loaded += len(deserialized)
+
+        # resolve references to objects that came later in the fixture (natural keys only)
+        for model_objects in grouped.values():
+            for obj in model_objects.values():
+                if obj.deferred_fields:
+                    obj.save_deferred_fields(using=using)
+
+    logger.info("Loaded %s objects from fixture" % loaded)
+    return loaded
@@ -0,0 +1,282 @@
+import logging
+from collections import defaultdict
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, List, Tuple, Type
+
+from django.contrib.contenttypes.fields import GenericForeignKey
+from django.contrib.contenttypes.models import ContentType
+from django.db import models
+
+if TYPE_CHECKING:  # pragma:no cover
+    from fractal_database.models import ReplicatedModel
+
+logger = logging.getLogger(__name__)
+
+# identifies an object in the graph. Keyed on the concrete model so that proxies of the
+# same row are only visited once
+NodeKey = Tuple[Type[models.Model], str]
+
+
+def _key(obj: models.Model) -> NodeKey:
+    return (obj._meta.concrete_model, str(obj.pk))
+
+
+def _is_replicated(model: Any) -> bool:
+    from fractal_database.models import ReplicatedModel
+
+    return isinstance(model, type) and issubclass(model, ReplicatedModel)
+
+
+def _load_foreign_key(field: models.ForeignKey, objs: List[models.Model]) -> Dict[NodeKey, list]:
+    """
+    Returns the objects that the provided objects point at through a ForeignKey or
+    OneToOneField, loading the ones that aren't cached on the objects with one query.
+    """
+    related: Dict[NodeKey, list] = {}
+    missing: Dict[Any, List[models.Model]] = defaultdict(list)
+    for obj in objs:
+        if field.is_cached(obj):
+            related_obj = getattr(obj, field.name)
+            if related_obj is not None:
+                related[_key(obj)] = [related_obj]
+            continue
+        value = getattr(obj, field.attname)
+        if value is not None:
+            missing[value].append(obj)
+
+    if missing:
+        target_field = field.target_field.attname
+        queryset = field.related_model._base_manager.filter(**{f"{target_field}__in": missing})
+        for related_obj in queryset:
+            for obj in missing[getattr(related_obj, target_field)]:
+                related[_key(obj)] = [related_obj]
+    return related
+
+
+def _load_generic_foreign_key(
+    field: GenericForeignKey, objs: List[models.Model]
+) -> Dict[NodeKey, list]:
+    """
+    Returns the objects that the provided objects point at through a GenericForeignKey,
+    loading the ones that aren't cached on the objects with one query per content type.
+    """
+    related: Dict[NodeKey, list] = {}
+    missing: Dict[int, Dict[str, List[models.Model]]] = defaultdict(lambda: defaultdict(list))
+    ct_attname = objs[0]._meta.get_field(field.ct_field).attname
+    for obj in objs:
+        if field.is_cached(obj):
+            related_obj = getattr(obj, field.name)
+            if related_obj is not None:
+                related[_key(obj)] = [related_obj]
+            continue
+        ct_id, object_id = getattr(obj, ct_attname), getattr(obj, field.fk_field)
+        if ct_id is not None and object_id is not None:
+            missing[ct_id][str(object_id)].append(obj)
+
+    for ct_id, objs_by_id in missing.items():
+        model = ContentType.objects.get_for_id(ct_id).model_class()
+        if not _is_replicated(model):
+            continue
+        for related_obj in model._base_manager.filter(pk__in=list(objs_by_id)):
+            for obj in objs_by_id[str(related_obj.pk)]:
+                related[_key(obj)] = [related_obj]
+    return related
+
+
+def _load_many_to_many(
+    field: models.ManyToManyField, objs: List[models.Model]
+) -> Dict[NodeKey, list]:
+    """
+    Returns the objects related to the provided objects through a ManyToManyField with
+    one query for the through rows and one for the related objects.
+    """
+    through = field.remote_field.through
+    source = through._meta.get_field(field.m2m_field_name()).attname
+    target = through._meta.get_field(field.m2m_reverse_field_name()).attname
+    objs_by_pk = {obj.pk: obj for obj in objs}
+    rows = list(
+        through._base_manager.filter(**{f"{source}__in": list(objs_by_pk)}).values_list(
+            source, target
+        )
+    )
+    if not rows:
+        return {}
+
+    related_objs = field.related_model._default_manager.in_bulk(
+        {target_id for _, target_id in rows}
+    )
+    related: Dict[NodeKey, list] = defaultdict(list)
+    for source_id, target_id in rows:
+        if target_id in related_objs:
+            related[_key(objs_by_pk[source_id])].append(related_objs[target_id])
+    return related
+
+
+class RelationshipPlan:
+    """
+    The relationship fields of a model, computed once per model (see compile_relationship_plans)
+    so that saving and serializing objects doesn't introspect the model every time.
+
+    Attributes:
+        model: The model the plan is for.
+        fields: Every ForeignKey, OneToOneField, ManyToManyField and GenericForeignKey of the
+            model, in the order of _meta.get_fields().
+        traversal: The fields that can point at replicated objects, in the order they are
+            walked, each paired with the function that loads the related objects in bulk.
+    """
+
+    __slots__ = ("model", "fields", "traversal")
+
+    def __init__(self, model: Type[models.Model]):
+        self.model = model
+        self.fields: List[Any] = []
+        self.traversal: List[Tuple[Callable[[Any, list], Dict[NodeKey, list]], Any]] = []
+        for field in model._meta.get_fields():
+            if not field.is_relation:
+                continue
+            if isinstance(field, models.ForeignKey):  # includes OneToOneField
+                loader = _load_foreign_key
+            elif isinstance(field, models.ManyToManyField):
+                loader = _load_many_to_many
+            elif isinstance(field, GenericForeignKey):
+                loader = _load_generic_foreign_key
+            else:
+                continue
+            self.fields.append(field)
+            # generic foreign keys can point at any model
+            if loader is _load_generic_foreign_key or _is_replicated(field.related_model):
+                self.traversal.append((loader, field))
+
+    def __repr__(self) -> str:
+        return f"<RelationshipPlan {self.model.__name__}: {[f.name for f in self.fields]}>"
+
+
+_plans: Dict[Type[models.Model], RelationshipPlan] = {}
+# position of each concrete replicated model in dependency order
+_model_order: Dict[Type[models.Model], int] = {}
+
+
+def compile_relationship_plans() -> None:
+    """
+    Computes the relationship plan of every replicated model and the order that replicated
+    models have to be loaded in. Called from fractal_database.apps.FractalDatabaseConfig.ready
+    once all models are registered.
+    """
+    from fractal_database.models import ReplicatedModel
+    from fractal_database.replication.fixtures import sort_models
+
+    concrete_models = [
+        model
+        for model in ReplicatedModel.models
+        if not model._meta.abstract and not model._meta.proxy
+    ]
+    _plans.clear()
+    _model_order.clear()
+    for model in concrete_models:
+        _plans[model] = RelationshipPlan(model)
+    order = sort_models(concrete_models)
+    _model_order.update({model: index for index, model in enumerate(order)})
+    logger.debug("Compiled relationship plans for %s replicated models" % len(order))
+
+
+def get_relationship_plan(model: Type[models.Model]) -> RelationshipPlan:
+    """
+    Returns the relationship plan of the provided model, computing it if the model wasn't
+    compiled by compile_relationship_plans.
+
+    Args:
+        model: The model to get the plan for.
+    """
+    plan = _plans.get(model)
+    if plan is None:
+        plan = _plans[model] = RelationshipPlan(model)
+    return plan
+
+
+def model_order() -> Dict[Type[models.Model], int]:
+    """
+    Returns the position of each concrete replicated model in dependency order, so that
+    models come after the models they have relationships to.
+    """
+    return _model_order
+
+
+def replicated_models() -> List[Type[models.Model]]:
+    """
+    Returns the concrete replicated models in dependency order.
+    """
+    return sorted(_model_order, key=_model_order.__getitem__)
+
+
+def _load_related(objs: List["ReplicatedModel"]) -> Dict[NodeKey, List["ReplicatedModel"]]:
+    """
+    Returns the replicated objects that each of the provided objects (all of the same model)
+    has a relationship to, batched per relationship field.
+    """
+    related: Dict[NodeKey, List["ReplicatedModel"]] = defaultdict(list)
+    for loader, field in get_relationship_plan(objs[0].__class__).traversal:
+        for key, related_objs in loader(field, objs).items():
+            related[key].extend(related_objs)
+    return related
+
+
+def replicated_closure(roots: Iterable["ReplicatedModel"]) -> List["ReplicatedModel"]:
+    """
+    Returns the provided objects and every replicated object reachable from them through
+    ForeignKey, OneToOneField, GenericForeignKey and ManyToManyField relationships. Each
+    object is returned once and after the objects it has relationships to (unless they are
+    part of a cycle), so that related objects are replicated first.
+
+    The graph is walked breadth first and the relationships of the objects found at each
+    level are loaded with a few queries per model, rather than a few queries per object.
+
+    Args:
+        roots: The objects to start from.
+    """
+    nodes: Dict[NodeKey, "ReplicatedModel"] = {}
+    edges: Dict[NodeKey, List[NodeKey]] = {}
+    root_keys = []
+    frontier = []
+    for root in roots:
+        key = _key(root)
+        if key not in nodes:
+            nodes[key] = root
+            root_keys.append(key)
+            frontier.append(root)
+
+    while frontier:
+        by_model: Dict[type, List["ReplicatedModel"]] = defaultdict(list)
+        for obj in frontier:
+            by_model[obj.__class__].append(obj)
+
+        frontier = []
+        for objs in by_model.values():
+            related = _load_related(objs)
+            for obj in objs:
+                key = _key(obj)
+                edges[key] = []
+                for related_obj in related.get(key, []):
+                    related_key = _key(related_obj)
+                    edges[key].append(related_key)
+                    if related_key not in nodes:
+                        nodes[related_key] = related_obj
+                        frontier.append(related_obj)
+
+    # iterative post order walk so that related objects come before the objects pointing at them
+    ordered: List["ReplicatedModel"] = []
+    visited = set()
+    for root_key in root_keys:
+        if root_key in visited:
+            continue
+        visited.add(root_key)
+        stack = [(root_key, iter(edges[root_key]))]
+        while stack:
+            key, children = stack[-1]
+            for child in children:
+                if child not in visited:
+                    visited.add(child)
+                    stack.append((child, iter(edges[child])))
+                    break
+            else:
+                stack.pop()
+                ordered.append(nodes[key])
+    return ordered
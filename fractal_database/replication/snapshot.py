@@ -0,0 +1,138 @@
+import gzip
+import json
+import logging
+from collections import defaultdict
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Type
+
+from django.conf import settings
+from django.core import serializers
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DEFAULT_DB_ALIAS, transaction
+from fractal_database.models import ReplicatedModel
+from fractal_database.replication.fixtures import apply_fixture, drop_stale_objects
+from fractal_database.replication.graph import replicated_closure, replicated_models
+from fractal_database.signals import replay_mode
+
+if TYPE_CHECKING:  # pragma:no cover
+    from fractal_database.models import Database
+
+logger = logging.getLogger(__name__)
+
+# room state event that points devices joining a database at its newest snapshot
+SNAPSHOT_STATE_TYPE = "f.database.snapshot"
+DEFAULT_SNAPSHOT_CHUNK_SIZE = 2000
+
+
+def _chunk_size() -> int:
+    return getattr(settings, "FRACTAL_DATABASE_SNAPSHOT_CHUNK_SIZE", DEFAULT_SNAPSHOT_CHUNK_SIZE)
+
+
+def snapshot_models() -> List[Type[ReplicatedModel]]:
+    """
+    Returns the replicated models that are included in a snapshot, ordered so that
+    models come after the models they depend on.
+    """
+    return replicated_models()
+
+
+def _snapshot_pks(database: "Database") -> Dict[Type[ReplicatedModel], List[Any]]:
+    """
+    Returns the primary keys of the objects replicated to the provided database, grouped by
+    concrete model: the database, its replication targets and everything reachable from them,
+    which includes the ReplicatedInstanceConfigs of the targets and their instances.
+    """
+    from fractal_database.models import target_registry
+
+    roots: List[ReplicatedModel] = [database]
+    for target_type in target_registry.target_types:
+        roots.extend(target_type._base_manager.filter(database=database))
+
+    pks: Dict[Type[ReplicatedModel], List[Any]] = defaultdict(list)
+    for obj in replicated_closure(roots):
+        pks[obj._meta.concrete_model].append(obj.pk)
+    return pks
+
+
+def _serialize(
+    model: Type[ReplicatedModel], pks: List[Any], chunk_size: int
+) -> Iterator[Dict[str, Any]]:
+    m2m_fields = [field.name for field in model._meta.many_to_many]
+    pks = sorted(pks, key=str)
+    for i in range(0, len(pks), chunk_size):
+        queryset = (
+            model._base_manager.filter(pk__in=pks[i : i + chunk_size])
+            .order_by("pk")
+            .prefetch_related(*m2m_fields)
+        )
+        yield from serializers.serialize("python", queryset)
+
+
+def dump_snapshot(path: str, database: "Database", chunk_size: Optional[int] = None) -> int:
+    """
+    Dumps the objects replicated to the provided database into a gzip compressed file with one
+    serialized object per line. Objects of other databases are left out. Objects are written
+    in dependency order so that the snapshot can be restored in the order it is read.
+
+    Args:
+        path: The path of the file to write the snapshot to.
+        database: The database to snapshot.
+        chunk_size: Number of objects that are serialized at a time.
+
+    Returns:
+        The number of objects in the snapshot.
+    """
+    chunk_size = chunk_size or _chunk_size()
+    pks = _snapshot_pks(database)
+    dumped = 0
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        for model in snapshot_models():
+            if model not in pks:
+                continue
+            for obj in _serialize(model, pks[model], chunk_size):
+                f.write(json.dumps(obj, cls=DjangoJSONEncoder))
+                f.write("\n")
+                dumped += 1
+
+    logger.info("Dumped %s objects of database %s into snapshot %s" % (dumped, database, path))
+    return dumped
+
+
+def restore_snapshot(
+    path: str, chunk_size: Optional[int] = None, using: str = DEFAULT_DB_ALIAS
+) -> int:
+    """
+    Loads a snapshot written by dump_snapshot into the local database in a single transaction.
+    Objects are decoded and applied chunk_size objects at a time. Objects that are
+    already present with the same or a newer object_version are left alone.
+
+    Args:
+        path: The path of the snapshot file.
+        chunk_size: Number of objects that are applied at a time.
+        using: The database alias to restore the snapshot into.
+
+    Returns:
+        The number of objects restored.
+    """
+    chunk_size = chunk_size or _chunk_size()
+    restored = 0
+
+    def _apply(objects: List[Dict[str, Any]]) -> int:
+        objects, _ = drop_stale_objects(objects, using=using)
+        if not objects:
+            return 0
+        return apply_fixture(objects, using=using)
+
+    with gzip.open(path, "rt", encoding="utf-8") as f, transaction.atomic(using=using):
+        # signal handlers check replay mode so that the restored data isn't replicated again
+        with replay_mode():
+            objects = []
+            for line in f:
+                objects.append(json.loads(line))
+                if len(objects) >= chunk_size:
+                    restored += _apply(objects)
+                    objects = []
+            if objects:
+                restored += _apply(objects)
+
+    logger.info("Restored %s objects from snapshot %s" % (restored, path))
+    return restored
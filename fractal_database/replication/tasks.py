@@ -1,32 +1,49 @@
 import asyncio
+import contextvars
+import json
 import logging
+import random
 import subprocess
 import sys
 from io import StringIO
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple, Union
 
+from asgiref.sync import async_to_sync, sync_to_async
+from django.apps import apps
+from django.core.exceptions import ObjectDoesNotExist
 from django.core.management import call_command
 from django.core.management.commands.loaddata import Command as loaddata_command
-from django.db import DEFAULT_DB_ALIAS
+from django.db import DEFAULT_DB_ALIAS, transaction
+from fractal_database.replication.fixtures import (
+    apply_fixture,
+    bulk_apply_enabled,
+    drop_stale_objects,
+    expand_deltas,
+    skip_stale_fixtures_enabled,
+)
+from fractal_database.signals import replay_mode
 from fractal_database_matrix.broker import broker
 
 if TYPE_CHECKING:
-    from fractal_database.models import AppInstanceConfig
+    from fractal_database.models import AppInstanceConfig, Database
 
 logger = logging.getLogger(__name__)
 
 
-def load_data_from_dicts(fixture: str) -> None:
+def load_data_from_dicts(fixture: Union[str, List[Dict[str, Any]]]) -> None:
     """
     Load data into Django models from a Django fixture string.
 
     Args:
-    - fixture (str): A Django fixture encoded as a string.
+    - fixture (str): A Django fixture encoded as a string (or its deserialized list of dicts).
     - project_dir (str): The path to the project directory.
     """
     from django.conf import settings
 
-    logger.warning(f"Loading {fixture} into local database")
+    if isinstance(fixture, str):
+        logger.warning(f"Loading {fixture} into local database")
+    else:
+        logger.info("Loading %s objects into local database" % len(fixture))
 
     # project_dir = settings.BASE_DIR
     # cmd = [sys.executable, f"{project_dir}/manage.py", "loaddata", "--format=json", "-"]
@@ -40,23 +57,53 @@ def load_data_from_dicts(fixture: str) -> None:
 
     # logger.info(stdout.decode("utf-8"))
 
+    if skip_stale_fixtures_enabled():
+        objects, skipped = drop_stale_objects(
+            json.loads(fixture) if isinstance(fixture, str) else fixture
+        )
+        if skipped:
+            logger.info("Skipped %s objects that are not newer than their local copy" % skipped)
+            if not objects:
+                return None
+            fixture = objects
+
+    fixture, missing = expand_deltas(json.loads(fixture) if isinstance(fixture, str) else fixture)
+    if missing:
+        logger.warning(
+            "Requesting the full fixtures of %s objects that are not at the base version of "
+            "their delta" % len(missing)
+        )
+        request_full_fixtures(missing)
+        if not fixture:
+            return None
+
+    if bulk_apply_enabled():
+        with replay_mode():
+            try:
+                apply_fixture(fixture)
+            except Exception as e:
+                raise Exception(f"ERROR: Failed to load data: {e}")
+        return None
+
     # load the fixture using loaddata
     # NOTE: monkey patching this loaddata command instance to hand it the fixture file
     # in memory. This is a workaround for the fact that call_command() doesn't
     # support passing in a file-like object. This is necessary for using loaddata in tests
-    fixture_file = StringIO(fixture)
+    fixture_file = StringIO(fixture if isinstance(fixture, str) else json.dumps(fixture))
     loaddata = loaddata_command()
     loaddata.compression_formats["stdin"] = (lambda *args: fixture_file, None)  # type: ignore
     try:
-        loaddata.handle(
-            "-",
-            format="json",
-            ignore=False,
-            database=DEFAULT_DB_ALIAS,
-            exclude=[],
-            app_label=None,
-            verbosity=1,
-        )
+        # signal handlers check replay mode so that the loaded data isn't replicated again
+        with replay_mode():
+            loaddata.handle(
+                "-",
+                format="json",
+                ignore=False,
+                database=DEFAULT_DB_ALIAS,
+                exclude=[],
+                app_label=None,
+                verbosity=1,
+            )
     except Exception as e:
         raise Exception(f"ERROR: Failed to load data: {e}")
 
@@ -75,7 +122,126 @@ async def replicate_fixture(fixture: str) -> None:
     - project_dir (str): The path to the project directory.
     """
     loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(None, load_data_from_dicts, fixture)
+    with replay_mode():
+        # run_in_executor doesn't copy the current context on its own
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(None, context.run, load_data_from_dicts, fixture)
+
+
+def request_full_fixtures(objects: List[Tuple[str, Any]]) -> None:
+    """
+    Asks another device of the current database to push the full fixtures of the provided
+    objects. Used when a delta can't be applied to the local copy of an object.
+
+    The request is sent to the room of the database's primary target and names a single
+    device to answer it, so that it isn't answered by every device that reads the room.
+    A device is picked at random on every request so that a request that went to an offline
+    device is answered by another one the next time it is made.
+
+    Args:
+    - objects (list): The (model label, pk) of the objects to request.
+    """
+    from fractal_database.models import Database, Device
+
+    try:
+        database = Database.current_db()
+        device = Device.current_device()
+    except (Database.DoesNotExist, Device.DoesNotExist):
+        logger.error("Unable to request full fixtures: current database is not set")
+        return None
+
+    primary_target = database.primary_target()
+    room_id = primary_target.metadata.get("room_id") if primary_target else None
+    if not room_id:
+        logger.error("Unable to request full fixtures: %s has no room" % database)
+        return None
+
+    devices = database.devices.all()
+    if device is not None:
+        devices = devices.exclude(pk=device.pk)
+    responders = list(devices.values_list("name", flat=True))
+    if not responders:
+        logger.error("Unable to request full fixtures: %s has no other devices" % database)
+        return None
+
+    try:
+        async_to_sync(send_full_fixtures.kicker().with_labels(room_id=room_id).kiq)(
+            [[label, str(pk)] for label, pk in objects], random.choice(responders)
+        )
+    except Exception as e:
+        logger.error("Failed to request full fixtures: %s" % e)
+
+
+def log_full_fixtures(database: "Database", objects: List[List[str]]) -> int:
+    """
+    Creates a ReplicationLog that pushes the full fixture of each of the provided objects to
+    every target that it is replicated to (see ReplicatedModel.get_replication_targets). The
+    targets replicate once the logs are committed, and logs that fail to push are retried like
+    any other log.
+
+    Args:
+    - database (Database): The database the objects are replicated through.
+    - objects (list): The [model label, pk] of the objects to push.
+
+    Returns:
+    - The number of logs created.
+    """
+    from fractal_database.models import ReplicationLog, ReplicationPayload
+    from fractal_database.signals import defer_replication, get_transaction_id
+
+    logged = 0
+    with transaction.atomic():
+        txn_id = get_transaction_id()
+        for label, pk in objects:
+            try:
+                instance = apps.get_model(label)._base_manager.get(pk=pk)
+            except (LookupError, ObjectDoesNotExist):
+                logger.warning(
+                    "Unable to send full fixture of %s %s: object not found" % (label, pk)
+                )
+                continue
+
+            payload = ReplicationPayload.for_instance(instance)
+            for target in instance.get_replication_targets(database):
+                ReplicationLog.objects.create(
+                    payload=payload,
+                    target=target,
+                    instance=instance,
+                    instance_version=instance.object_version,
+                    txn_id=txn_id,
+                    full=True,
+                )
+                defer_replication(target)
+                logged += 1
+    return logged
+
+
+@broker.task(queue="replication")
+async def send_full_fixtures(objects: List[List[str]], responder: Optional[str] = None) -> None:
+    """
+    Pushes the full fixtures of the provided objects (see log_full_fixtures). Devices other
+    than the responder ignore the request.
+
+    Args:
+    - objects (list): The [model label, pk] of the objects to push.
+    - responder (str): The name of the device that answers the request. Any device answers
+        if None.
+    """
+    from fractal_database.models import Database, Device
+
+    try:
+        database = await Database.acurrent_db()
+        device = await Device.acurrent_device()
+    except (Database.DoesNotExist, Device.DoesNotExist):
+        logger.error("Unable to send full fixtures: current database is not set")
+        return None
+
+    if responder is not None and (device is None or device.name != responder):
+        logger.debug("Ignoring full fixtures request for device %s" % responder)
+        return None
+
+    logged = await sync_to_async(log_full_fixtures)(database, objects)
+    logger.info("Logged %s full fixtures" % logged)
 
 
 async def launch_app(app_config: "AppInstanceConfig", *args, **kwargs) -> None:
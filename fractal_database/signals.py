@@ -1,11 +1,13 @@
-import inspect
 import logging
 import os
 import socket
 import tarfile
 import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
 from secrets import token_hex
-from typing import TYPE_CHECKING, Any, Callable, Dict, List
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterator, List, Optional
+from uuid import uuid4
 
 try:
     from functools import wraps
@@ -15,6 +17,7 @@ except ImportError:
 from asgiref.sync import async_to_sync
 from django.apps import AppConfig
 from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
 from django.db import transaction
 from django.db.models import F
 from django.db.models.signals import post_save
@@ -22,6 +25,10 @@ from django.dispatch import receiver
 from fractal.matrix import MatrixClient
 from fractal_database.app.tasks import launch_app, stop_app
 from fractal_database.exceptions import ReplicatedInstanceConfigAlreadyExists
+from fractal_database.replication.dispatcher import (
+    background_replication_enabled,
+    get_dispatcher,
+)
 from fractal_database.utils import get_project_name, init_poetry_project
 from taskiq_matrix.lock import MatrixLock
 
@@ -29,6 +36,10 @@ logger = logging.getLogger(__name__)
 
 _thread_locals = threading.local()
 
+# set while replaying replicated fixtures into the local database. A context variable
+# (rather than a thread local) so that it is also visible to coroutines
+_replay_mode: ContextVar[bool] = ContextVar("fractal_database_replay_mode", default=False)
+
 if TYPE_CHECKING:  # pragma:no cover
     from fractal_database.models import (
         AppInstanceConfig,
@@ -49,6 +60,30 @@ except AttributeError:
     FRACTAL_EXPORT_DIR = settings.BASE_DIR / "export"
 
 
+@contextmanager
+def replay_mode() -> Iterator[None]:
+    """
+    Context manager that marks everything run inside of it as replaying replicated data.
+    Signal handlers check in_replay_mode() so that replayed data isn't replicated again.
+    """
+    token = _replay_mode.set(True)
+    try:
+        yield
+    finally:
+        _replay_mode.reset(token)
+
+
+def in_replay_mode(instance: Optional[Any] = None) -> bool:
+    """
+    Returns True if replicated data is being replayed into the local database.
+
+    Args:
+        instance: Optional instance a signal was sent for. Instances that were saved
+            from a fixture outside of replay_mode (ie `manage.py loaddata`) also count.
+    """
+    return _replay_mode.get() or getattr(instance, "_loaded_from_fixture", False)
+
+
 def disable_for_loaddata(signal_handler: Callable[..., Any]):
     """
     Decorator that will not run the provided signal handler when loading from fixture.
@@ -56,9 +91,8 @@ def disable_for_loaddata(signal_handler: Callable[..., Any]):
 
     @wraps(signal_handler)
     def wrapper(*args, **kwargs):
-        for fr in inspect.stack():
-            if inspect.getmodulename(fr[1]) == "loaddata":
-                return
+        if in_replay_mode(kwargs.get("instance")):
+            return
         signal_handler(*args, **kwargs)
 
     return wrapper
@@ -88,10 +122,18 @@ def commit(target: "ReplicationTarget") -> None:
 
     Intended to be called by the transaction.on_commit handler registered
     by defer_replication.
+
+    When background replication is enabled, the target is handed off to the
+    ReplicationDispatcher so the committing thread doesn't block on the target.
     """
     # this runs its own thread so once this completes, we need to clear the deferred replications
     # for this target
     try:
+        if background_replication_enabled():
+            logger.info("Transaction complete, waking replication dispatcher for %s" % target)
+            get_dispatcher().wake(target)
+            return None
+
         logger.info("Transaction complete, calling %s.replicate()" % target)
         try:
             async_to_sync(target.replicate)()
@@ -116,13 +158,111 @@ def defer_replication(target: "ReplicationTarget") -> None:
     logger.debug("Deferring replication of target %s" % target.name)
     if not hasattr(_thread_locals, "defered_replications"):
         _thread_locals.defered_replications = {}
-    # only register an on_commit replicate once per target
-    if target.name not in _thread_locals.defered_replications:
+    # only register an on_commit replicate once per target and transaction
+    deferred = _get_transaction_state()[3]
+    handler = deferred.get(target.name)
+    # on_commit handlers registered in a savepoint are dropped when it is rolled back
+    if handler is None or not any(
+        registered[1] is handler for registered in transaction.get_connection().run_on_commit
+    ):
         logger.debug("Registering transaction.on_commit for target %s" % target.name)
-        transaction.on_commit(lambda: commit(target))
+        handler = deferred[target.name] = lambda: commit(target)
+        transaction.on_commit(handler)
     _thread_locals.defered_replications.setdefault(target.name, []).append(target)
 
 
+def coalesce_replication_logs_enabled() -> bool:
+    """
+    Returns True if objects that are saved several times in one transaction should get one
+    ReplicationLog per target, with the payload of their final version serialized on commit.
+    Disabled with settings.FRACTAL_DATABASE_COALESCE_REPLICATION_LOGS.
+    """
+    return getattr(settings, "FRACTAL_DATABASE_COALESCE_REPLICATION_LOGS", True)
+
+
+def _on_transaction_commit(func: Callable[[], None]) -> None:
+    """
+    Registers func to run once the current transaction commits, like transaction.on_commit,
+    except that rolling back a savepoint doesn't drop it. It's only dropped when the whole
+    transaction is rolled back.
+    """
+    transaction.get_connection().run_on_commit.append((set(), func, False))
+
+
+def _get_transaction_state() -> tuple:
+    """
+    Returns the (on_commit handler, logs, transaction id, deferred replication handlers) state
+    of the current transaction, creating it on the first call in the transaction.
+
+    The first call in a transaction registers an on_commit handler that materializes the
+    payloads of the logs once the transaction commits and clears the state. Since it is
+    registered before any deferred replication of the transaction, the payloads are stored
+    before targets replicate.
+
+    The handler also identifies the transaction: it stays registered until the transaction
+    commits or is rolled back, so state whose handler is no longer registered belongs to a
+    transaction that was rolled back. Atomic blocks can't identify it since
+    @transaction.atomic reuses its Atomic instance for every call.
+    """
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        raise Exception("Replication logs can only be created inside an atomic block")
+
+    state = getattr(_thread_locals, "transaction_logs", None)
+    if state is None or not any(handler[1] is state[0] for handler in connection.run_on_commit):
+        logs: Dict[tuple, Any] = {}
+        state = _thread_locals.transaction_logs = (
+            lambda: materialize_transaction_logs(logs),
+            logs,
+            uuid4().hex,
+            {},
+        )
+        _on_transaction_commit(state[0])
+    return state
+
+
+def get_transaction_logs() -> Dict[tuple, Any]:
+    """
+    Returns the ReplicationLogs created in the current transaction, keyed by
+    (target type id, target id, content type id, object id). Their payloads are materialized
+    once the transaction commits.
+    """
+    return _get_transaction_state()[1]
+
+
+def get_transaction_id() -> str:
+    """
+    Returns the id of the current transaction, which is generated when it is first requested
+    and stays the same until the outermost atomic block commits. Replication logs created in
+    the same transaction are pushed in one batch (see ReplicationTarget.replicate).
+    """
+    return _get_transaction_state()[2]
+
+
+def materialize_transaction_logs(logs: Dict[tuple, Any]) -> None:
+    """
+    Stores the payloads of the ReplicationLogs of a committed transaction.
+
+    Intended to be called by the transaction.on_commit handler registered by
+    get_transaction_logs. Logs that are left without a payload (ie materializing them
+    failed) are materialized by ReplicationTarget.replicate instead.
+    """
+    from fractal_database.models import ReplicationLog
+
+    state = getattr(_thread_locals, "transaction_logs", None)
+    if state is not None and state[1] is logs:
+        del _thread_locals.transaction_logs
+
+    log_ids = list(logs.values())
+    logs.clear()
+    try:
+        ReplicationLog.materialize_payloads(
+            list(ReplicationLog.objects.filter(pk__in=log_ids, payload__isnull=True))
+        )
+    except Exception as e:
+        logger.exception("Error materializing replication log payloads: %s" % e)
+
+
 def get_deferred_replications() -> Dict[str, List["ReplicationTarget"]]:
     """
     Returns a dict of ReplicationTargets that have been deferred for replication.
@@ -138,7 +278,8 @@ def clear_deferred_replications(target: str) -> None:
         target (str): The target to clear deferred replications for.
     """
     logger.debug("Clearing deferred replications for target %s" % target)
-    del _thread_locals.defered_replications[target]
+    # replicating a target can defer and commit it again before this is called
+    get_deferred_replications().pop(target, None)
 
 
 def register_device_account(
@@ -154,7 +295,7 @@ def register_device_account(
 
     # TODO: when loading from fixture, a device account should be created
     # only if the device account doesn't already exist on the homeserver.
-    if not created or raw:
+    if not created or raw or in_replay_mode():
         return None
 
     logger.info("Registering device account for device %s" % instance.name)
@@ -220,6 +361,12 @@ def object_post_save(
     """
     if raw:
         logger.info("Loading instance from fixture: %s" % instance)
+        # lets the m2m signal handlers know that the many to many fields
+        # about to be set for this instance are coming from the fixture too
+        instance._loaded_from_fixture = True
+        return None
+
+    if in_replay_mode():
         return None
 
     if not transaction.get_connection().in_atomic_block:
@@ -235,7 +382,10 @@ def object_post_save(
     # TODO: Make this a context manager so we dont ever have to worry about forgetting to exit
     enter_signal_handler()
 
-    increment_version(sender, instance)
+    # instances saved with ReplicatedModel.single_statement_save() were already
+    # written with their new version
+    if not getattr(instance, "_version_incremented", False):
+        increment_version(sender, instance)
 
     try:
         if in_nested_signal_handler():
@@ -290,6 +440,8 @@ def schedule_replication_on_m2m_change(
     if action not in {"post_add", "post_remove"}:
         return None
 
+    from fractal_database.models import ReplicatedInstanceConfig
+
     logger.info("Inside schedule_replication_on_m2m_change for %s" % instance)
 
     for id in pk_set:
@@ -299,16 +451,66 @@ def schedule_replication_on_m2m_change(
 
         # Create ReplicatedInstanceConfigs for the related instance on each of the
         # instance's targets. This ensures that the related instance is replicated
-        # to the same targets as the instance.
-        instance_targets = instance.replication_targets()
-        create_related_instance_configs(related_instance, instance_targets)
+        # to the same targets as the instance. Instance configs themselves are skipped,
+        # adding them to a target would create a config for the config and so on.
+        if not isinstance(related_instance, ReplicatedInstanceConfig):
+            instance_targets = instance.replication_targets()
+            create_related_instance_configs(related_instance, instance_targets)
 
         # now that we've ensured that all of the ReplicatedInstanceConfigs for the related instance
         # have been created, we can schedule replication for the instance and related_instance.
         # FIXME: this may be causing a duplicate fixture to be sent into the related_instance's room
         # we may only need to call schedule_replication on instance here.
         related_instance.schedule_replication(created=False)
-        instance.save()
+        instance.save(force_replication=True)
+
+
+def update_instance_target_index(
+    sender: Any,
+    instance: Any,
+    action: str,
+    reverse: bool,
+    model: Any,
+    pk_set: Optional[set],
+    **kwargs,
+) -> None:
+    """
+    Keeps the InstanceTarget index in sync with the `instances` field of the ReplicationTarget
+    models. Not disabled for loaddata since the index is local to each device.
+
+    Connected via fractal_database.apps.FractalDatabaseConfig.ready
+    """
+    from fractal_database.models import InstanceTarget
+
+    if action not in {"post_add", "post_remove", "post_clear"}:
+        return None
+
+    if not reverse:
+        # instance is the target
+        InstanceTarget.index_targets(instance.__class__, [instance.pk])
+    elif action == "post_clear":
+        # instance is a ReplicatedInstanceConfig that was removed from every target of model
+        InstanceTarget.objects.filter(
+            instance_config=instance,
+            target_type=ContentType.objects.get_for_model(model),
+        ).delete()
+    else:
+        InstanceTarget.index_targets(model, list(pk_set or []))
+
+
+def remove_instance_target_index(sender: Any, instance: Any, **kwargs) -> None:
+    """
+    Removes the InstanceTarget rows of a deleted target. Deleting a target doesn't send
+    m2m_changed for its `instances` field.
+
+    Connected via fractal_database.apps.FractalDatabaseConfig.ready
+    """
+    from fractal_database.models import InstanceTarget
+
+    InstanceTarget.objects.filter(
+        target_type=ContentType.objects.get_for_model(instance.__class__),
+        target_id=str(instance.pk),
+    ).delete()
 
 
 def create_database_and_matrix_replication_target(*args, **kwargs) -> None:
@@ -562,7 +764,12 @@ def update_target_state(
     from fractal_database_matrix.models import MatrixReplicationTarget
 
     # dont do anything if loading from fixture or a new object is created
-    if not isinstance(instance, (Database, MatrixReplicationTarget)) or raw or created:
+    if (
+        not isinstance(instance, (Database, MatrixReplicationTarget))
+        or raw
+        or created
+        or in_replay_mode()
+    ):
         return None
 
     # only update the state if the object is the primary target
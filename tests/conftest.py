@@ -0,0 +1,46 @@
+import pytest
+from fractal_database.models import (
+    Database,
+    DatabaseConfig,
+    DummyReplicationTarget,
+    ReplicationLog,
+    target_registry,
+)
+
+
+@pytest.fixture(autouse=True)
+def clear_replication_caches():
+    """
+    Clears the process wide caches of replication targets and of the current database, which
+    would otherwise hand out rows of a database that was flushed by a previous test.
+    """
+    target_registry._cache.clear()
+    DatabaseConfig._config_cache.clear()
+    yield
+    target_registry._cache.clear()
+    DatabaseConfig._config_cache.clear()
+
+
+@pytest.fixture
+def target():
+    """
+    Creates a database that replicates to a dummy target, without any replication logs.
+    The database isn't the current database, so saving objects doesn't create logs.
+    """
+    database = Database.objects.create(name="test-database")
+    target = DummyReplicationTarget.objects.create(name="dummy", database=database)
+    ReplicationLog.objects.all().delete()
+    return target
+
+
+@pytest.fixture
+def database():
+    """
+    Creates the current database that replicates to a dummy target, without any replication
+    logs, freshly loaded from the database.
+    """
+    database = Database.objects.create(name="test-database")
+    DatabaseConfig.objects.create(current_db=database)
+    DummyReplicationTarget.objects.create(name="dummy", database=database)
+    ReplicationLog.objects.all().delete()
+    return Database.objects.get(pk=database.pk)
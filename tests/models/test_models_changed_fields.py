@@ -0,0 +1,115 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from fractal_database.models import (
+    DummyReplicationTarget,
+    ReplicationLog,
+)
+
+pytestmark = pytest.mark.django_db(transaction=True)
+
+
+@pytest.fixture(autouse=True)
+def skip_unchanged_saves(settings):
+    settings.FRACTAL_DATABASE_SKIP_UNCHANGED_SAVES = True
+
+
+def logs_for(database) -> int:
+    return ReplicationLog.objects.filter(object_id=str(database.pk)).count()
+
+
+def test_models_changed_fields_unchanged_save_skipped(database):
+    """
+    Tests that saving an unchanged instance doesn't touch the database or replicate
+    """
+    version = database.object_version
+
+    with CaptureQueriesContext(connection) as ctx:
+        database.save()
+
+    assert len(ctx.captured_queries) == 0
+    database.refresh_from_db()
+    assert database.object_version == version
+    assert logs_for(database) == 0
+
+
+def test_models_changed_fields_changed_save(database):
+    """
+    Tests that changing a field bumps the version and replicates, and that the instance
+    is clean again afterwards
+    """
+    version = database.object_version
+    database.name = "renamed"
+    assert database.get_changed_fields() == {"name"}
+
+    database.save()
+
+    assert database.object_version == version + 1
+    assert logs_for(database) == 1
+    assert database.get_changed_fields() == set()
+
+
+def test_models_changed_fields_update_fields(database):
+    """
+    Tests that only the fields in update_fields are considered
+    """
+    version = database.object_version
+    database.name = "renamed"
+
+    database.save(update_fields=["description"])
+    database.refresh_from_db(fields=["object_version"])
+    assert database.object_version == version
+    assert database.get_changed_fields() == {"name"}
+
+    database.save(update_fields=["name"])
+    database.refresh_from_db()
+    assert database.object_version == version + 1
+    assert database.name == "renamed"
+
+
+def test_models_changed_fields_positional_update_fields(database):
+    """
+    Tests that update_fields passed positionally is compared too
+    """
+    version = database.object_version
+    database.name = "renamed"
+
+    database.save(False, False, None, ["description"])
+    database.refresh_from_db(None, ["object_version"])
+    assert database.object_version == version
+    assert database.get_changed_fields() == {"name"}
+
+
+def test_models_changed_fields_not_skipped_by_default(database, settings):
+    """
+    Tests that unchanged saves bump the version and replicate unless skipping is enabled
+    """
+    del settings.FRACTAL_DATABASE_SKIP_UNCHANGED_SAVES
+    version = database.object_version
+
+    database.save()
+
+    assert database.object_version == version + 1
+    assert logs_for(database) == 1
+
+
+def test_models_changed_fields_mutated_json(database):
+    """
+    Tests that in place changes to mutable field values are detected
+    """
+    target = DummyReplicationTarget.objects.get()
+    target.metadata["room_id"] = "!room:localhost"
+
+    assert target.get_changed_fields() == {"metadata"}
+
+
+def test_models_changed_fields_forced(database, settings):
+    """
+    Tests that unchanged saves still replicate when forced or when skipping is disabled
+    """
+    database.save(force_replication=True)
+    assert logs_for(database) == 1
+
+    settings.FRACTAL_DATABASE_SKIP_UNCHANGED_SAVES = False
+    database.save()
+    assert logs_for(database) == 2
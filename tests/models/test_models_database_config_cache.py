@@ -0,0 +1,165 @@
+import threading
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from fractal_database.models import Database, DatabaseConfig
+
+pytestmark = pytest.mark.django_db(transaction=True)
+
+
+def reset_cache():
+    DatabaseConfig._config_cache.clear()
+    DatabaseConfig._config_cache.hits = 0
+    DatabaseConfig._config_cache.misses = 0
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    reset_cache()
+
+
+@pytest.fixture
+def current_db():
+    database = Database.objects.create(name="test-database")
+    DatabaseConfig.objects.create(current_db=database)
+    # saving the database looks up the current database
+    reset_cache()
+    return database
+
+
+def test_models_database_config_cache_hits(current_db):
+    """
+    Tests that the DatabaseConfig is only queried the first time
+    """
+    assert Database.current_db() == current_db
+
+    with CaptureQueriesContext(connection) as queries:
+        for _ in range(3):
+            assert Database.current_db() == current_db
+        assert async_to_sync(Database.acurrent_db)() == current_db
+
+    assert len(queries) == 0
+    assert DatabaseConfig.cache_stats() == {"hits": 4, "misses": 1}
+
+
+def test_models_database_config_cache_invalidated_on_save(current_db):
+    """
+    Tests that saving a cached model invalidates the cache
+    """
+    Database.current_db()
+
+    current_db.name = "renamed"
+    current_db.save()
+
+    assert Database.current_db().name == "renamed"
+    assert DatabaseConfig.cache_stats()["misses"] == 2
+
+
+def test_models_database_config_cache_invalidated_on_delete(current_db):
+    """
+    Tests that deleting the DatabaseConfig invalidates the cache
+    """
+    Database.current_db()
+
+    DatabaseConfig.objects.all().delete()
+
+    with pytest.raises(Database.DoesNotExist):
+        Database.current_db()
+
+
+def test_models_database_config_cache_returns_copies(current_db):
+    """
+    Tests that modifying the returned database doesn't modify the cached one
+    """
+    Database.current_db().name = "modified"
+
+    assert Database.current_db().name == "test-database"
+
+
+def test_models_database_config_cache_not_populated_by_rolled_back_transaction():
+    """
+    Tests that a DatabaseConfig read inside of a transaction that is rolled back isn't cached
+    """
+    try:
+        with transaction.atomic():
+            database = Database.objects.create(name="rolled-back")
+            DatabaseConfig.objects.create(current_db=database)
+            assert Database.current_db() == database
+            raise ValueError()
+    except ValueError:
+        pass
+
+    with pytest.raises(Database.DoesNotExist):
+        Database.current_db()
+
+
+def test_models_database_config_cache_threads(current_db):
+    """
+    Tests that concurrent lookups from several threads all get the current database
+    """
+    Database.current_db()
+    results = []
+
+    def lookup():
+        for _ in range(50):
+            results.append(Database.current_db().pk)
+
+    threads = [threading.Thread(target=lookup) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == [current_db.pk] * 400
+    assert DatabaseConfig.cache_stats() == {"hits": 400, "misses": 1}
+
+
+def test_models_database_config_cache_inside_transaction(current_db):
+    """
+    Tests that a cold cache is only queried once inside of a transaction, and that the
+    value is shared once the transaction commits
+    """
+    with transaction.atomic():
+        for _ in range(3):
+            assert Database.current_db() == current_db
+        # one on_commit handler stores every value loaded in the transaction
+        assert len(connection.run_on_commit) == 1
+
+    assert DatabaseConfig.cache_stats() == {"hits": 2, "misses": 1}
+    with CaptureQueriesContext(connection) as queries:
+        assert Database.current_db() == current_db
+    assert len(queries) == 0
+
+
+def test_models_database_config_cache_rolled_back_savepoint(current_db):
+    """
+    Tests that values loaded in a savepoint that is rolled back aren't served afterwards
+    """
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                Database.current_db()
+                raise ValueError()
+        except ValueError:
+            pass
+        Database.current_db()
+
+    assert DatabaseConfig.cache_stats() == {"hits": 0, "misses": 2}
+
+
+def test_models_database_config_cache_invalidated_inside_transaction(current_db):
+    """
+    Tests that the rest of a transaction that invalidates the cache reads the database
+    """
+    with transaction.atomic():
+        Database.current_db()
+        Database.objects.filter(pk=current_db.pk).update(name="renamed")
+        DatabaseConfig.invalidate_cache()
+        assert Database.current_db().name == "renamed"
+        misses = DatabaseConfig.cache_stats()["misses"]
+        Database.current_db()
+        assert DatabaseConfig.cache_stats()["misses"] == misses + 1
+
+    assert Database.current_db().name == "renamed"
@@ -0,0 +1,117 @@
+import pytest
+from django.core import serializers
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from fractal_database.models import (
+    Database,
+    DummyReplicationTarget,
+    InstanceTarget,
+)
+from fractal_database.replication.fixtures import apply_fixture
+
+pytestmark = pytest.mark.django_db(transaction=True)
+
+
+@pytest.fixture
+def instance():
+    return Database.objects.create(name="shared-database")
+
+
+@pytest.fixture
+def target():
+    return DummyReplicationTarget.objects.create(name="target")
+
+
+def target_names(instance) -> list:
+    return sorted(target.name for target in instance.replication_targets())
+
+
+def test_models_instance_target_index_add_instance(instance, target):
+    """
+    Tests that add_instance indexes the instance and that its targets are then looked up
+    with a single query
+    """
+    assert instance.replication_targets() == []
+
+    target.add_instance(instance)
+
+    assert target_names(instance) == ["target"]
+    with CaptureQueriesContext(connection) as queries:
+        assert target_names(instance) == ["target"]
+    assert len(queries) == 1
+
+
+def test_models_instance_target_index_remove(instance, target):
+    """
+    Tests that removing or clearing the instances of a target updates the index
+    """
+    other = DummyReplicationTarget.objects.create(name="other")
+    target.add_instance(instance)
+    other.add_instance(instance)
+    assert target_names(instance) == ["other", "target"]
+
+    target.instances.remove(*target.instances.all())
+    assert target_names(instance) == ["other"]
+
+    other.instances.clear()
+    assert target_names(instance) == []
+    assert not InstanceTarget.objects.exists()
+
+
+def test_models_instance_target_index_reverse(instance, target):
+    """
+    Tests that changes made from the ReplicatedInstanceConfig side update the index
+    """
+    target.add_instance(instance)
+    config = target.instances.get()
+    other = DummyReplicationTarget.objects.create(name="other")
+
+    config.dummyreplicationtarget_set.add(other)
+    assert target_names(instance) == ["other", "target"]
+
+    config.dummyreplicationtarget_set.clear()
+    assert target_names(instance) == []
+
+
+def test_models_instance_target_index_delete(instance, target):
+    """
+    Tests that deleting a target or an instance config removes its index rows
+    """
+    other = DummyReplicationTarget.objects.create(name="other")
+    target.add_instance(instance)
+    other.add_instance(instance)
+
+    other.delete()
+    assert target_names(instance) == ["target"]
+
+    target.instances.all().delete()
+    assert target_names(instance) == []
+
+
+def test_models_instance_target_index_rebuild(instance, target):
+    """
+    Tests that rebuild restores the index from the instances of every target
+    """
+    target.add_instance(instance)
+    InstanceTarget.objects.all().delete()
+    assert instance.replication_targets() == []
+
+    InstanceTarget.rebuild()
+
+    assert target_names(instance) == ["target"]
+
+
+def test_models_instance_target_index_apply_fixture(instance, target):
+    """
+    Tests that targets whose instances are loaded by apply_fixture are indexed
+    """
+    target.add_instance(instance)
+    config = target.instances.get()
+    other = DummyReplicationTarget.objects.create(name="other")
+
+    fixture = serializers.serialize("python", [other])
+    fixture[0]["fields"]["instances"] = [config.pk]
+    fixture[0]["fields"]["object_version"] += 1
+    apply_fixture(fixture)
+
+    assert target_names(instance) == ["other", "target"]
@@ -0,0 +1,147 @@
+import json
+import os
+import time
+import zlib
+from unittest.mock import patch
+
+import pytest
+from django.core.serializers import serialize
+from fractal_database.compression import LZMA, ZLIB_V1, compress, decompress
+from fractal_database.fields import CompressedJSONField
+from fractal_database.models import (
+    Database,
+    Device,
+    DummyReplicationTarget,
+    ReplicationPayload,
+    RepresentationLog,
+)
+
+pytestmark = pytest.mark.django_db(transaction=True)
+
+# set to 10000 to benchmark compressing 10k payloads
+BENCHMARK_PAYLOADS = int(os.environ.get("FRACTAL_COMPRESSION_BENCHMARK_PAYLOADS", 1000))
+
+
+def stored_data(payload: ReplicationPayload) -> bytes:
+    # values_list returns the stored bytes, see CompressedJSONField
+    return bytes(ReplicationPayload.objects.values_list("data", flat=True).get(pk=payload.pk))
+
+
+@pytest.mark.parametrize("method,header", [("zlib", ZLIB_V1), ("lzma", LZMA)])
+def test_models_payload_compression_round_trip(settings, method, header):
+    """
+    Tests that payloads are stored compressed and read back unchanged
+    """
+    settings.FRACTAL_DATABASE_PAYLOAD_COMPRESSION = method
+    database = Database.objects.create(name="compressed")
+    payload = ReplicationPayload.for_instance(database)
+
+    stored = stored_data(payload)
+    assert stored.startswith(header)
+    assert bytes(ReplicationPayload.objects.get(pk=payload.pk).encoded).startswith(header)
+
+    payload = ReplicationPayload.objects.get(pk=payload.pk)
+    assert payload.data == json.loads(decompress(stored))
+    assert payload.data[0]["fields"]["name"] == "compressed"
+    assert json.loads(payload.get_encoded()) == payload.get_fixture()
+
+
+def test_models_payload_compression_mixed_storage(settings):
+    """
+    Tests that values stored with any compression are readable no matter how it is set
+    """
+    plain = ReplicationPayload.for_instance(Database.objects.create(name="plain"))
+    settings.FRACTAL_DATABASE_PAYLOAD_COMPRESSION = "zlib"
+    zlibbed = ReplicationPayload.for_instance(Database.objects.create(name="zlib"))
+    settings.FRACTAL_DATABASE_PAYLOAD_COMPRESSION = "lzma"
+    lzmaed = ReplicationPayload.for_instance(Database.objects.create(name="lzma"))
+
+    settings.FRACTAL_DATABASE_PAYLOAD_COMPRESSION = None
+    # the column stores bytes even without compression, decoded by the field
+    assert stored_data(plain).startswith(b"[")
+    field = ReplicationPayload._meta.get_field("data")
+    for payload in (plain, lzmaed):
+        payload.refresh_from_db()
+        assert field.decode(stored_data(payload)) == payload.data
+    names = {
+        payload.data[0]["fields"]["name"]
+        for payload in ReplicationPayload.objects.filter(pk__in=[plain.pk, zlibbed.pk, lzmaed.pk])
+    }
+    assert names == {"plain", "zlib", "lzma"}
+
+
+def test_models_payload_compression_lazy(settings):
+    """
+    Tests that stored values are only decompressed when they are read
+    """
+    settings.FRACTAL_DATABASE_PAYLOAD_COMPRESSION = "zlib"
+    payload = ReplicationPayload.for_instance(Database.objects.create(name="lazy"))
+
+    with patch.object(
+        CompressedJSONField, "decode", autospec=True, side_effect=CompressedJSONField.decode
+    ) as mock_decode:
+        payload = ReplicationPayload.objects.get(pk=payload.pk)
+        mock_decode.assert_not_called()
+
+        assert payload.data[0]["fields"]["name"] == "lazy"
+        assert payload.data[0]["fields"]["name"] == "lazy"
+        assert payload.delta is None
+
+    mock_decode.assert_called_once()
+
+
+def test_models_payload_compression_representation_metadata(settings):
+    """
+    Tests that representation log metadata is compressed too
+    """
+    settings.FRACTAL_DATABASE_PAYLOAD_COMPRESSION = "zlib"
+    target = DummyReplicationTarget.objects.create(
+        name="dummy", database=Database.objects.create(name="db")
+    )
+    repr_log = RepresentationLog.objects.create(
+        target=target, instance=target, method="test", metadata={"room_id": "!room:localhost"}
+    )
+
+    assert RepresentationLog.objects.get(pk=repr_log.pk).metadata == {"room_id": "!room:localhost"}
+    assert bytes(
+        RepresentationLog.objects.filter(pk=repr_log.pk).values_list("metadata", flat=True)[0]
+    ).startswith(ZLIB_V1)
+
+
+def test_models_payload_compression_benchmark():
+    """
+    Benchmarks the stored size of typical payloads and the cost of compressing and
+    decompressing them with each compression.
+    """
+    devices = [
+        Device(name=f"device-{i}", display_name=f"Device {i}", owner_matrix_id="@admin:localhost")
+        for i in range(BENCHMARK_PAYLOADS)
+    ]
+    payloads = [
+        json.dumps(serialize("python", [device]), default=str, separators=(",", ":")).encode()
+        for device in devices
+    ]
+    plain_size = sum(len(payload) for payload in payloads)
+    unprimed_size = sum(len(zlib.compress(payload)) for payload in payloads)
+
+    report = {}
+    for method in ("zlib", "lzma"):
+        start = time.perf_counter()
+        compressed = [compress(payload, method) for payload in payloads]
+        write = (time.perf_counter() - start) / len(payloads)
+
+        start = time.perf_counter()
+        assert [decompress(payload) for payload in compressed] == payloads
+        read = (time.perf_counter() - start) / len(payloads)
+
+        size = sum(len(payload) for payload in compressed)
+        report[method] = size
+        print(
+            f"{method}: {size / plain_size:.0%} of {plain_size} bytes, "
+            f"{write * 1e6:.1f}us per write, {read * 1e6:.1f}us per read"
+        )
+    print(f"zlib without a dictionary: {unprimed_size / plain_size:.0%} of {plain_size} bytes")
+
+    # the primed dictionary pays off on small rows
+    assert report["zlib"] < unprimed_size < plain_size
+    assert report["zlib"] < plain_size / 2
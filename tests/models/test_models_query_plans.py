@@ -0,0 +1,161 @@
+import re
+from typing import Callable, List
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.db import connection
+from django.utils import timezone
+from fractal_database.models import (
+    Database,
+    DummyReplicationTarget,
+    ReplicationLog,
+    ReplicationTarget,
+    RepresentationLog,
+)
+from fractal_database.replication.compaction import compact_replication_logs
+from fractal_database.replication.dispatcher import ReplicationDispatcher
+
+pytestmark = [
+    pytest.mark.django_db(transaction=True),
+    pytest.mark.skipif(connection.vendor != "sqlite", reason="asserts SQLite query plans"),
+]
+
+HOT_TABLES = [
+    "fractal_database_replicationlog",
+    "fractal_database_representationlog",
+    "fractal_database_replicatedinstanceconfig",
+]
+# a scan of a partial index only visits the rows that match its condition
+PARTIAL_INDEXES = ["replication_log_pending", "replication_log_delivered"]
+
+
+@pytest.fixture
+def target(database):
+    target = DummyReplicationTarget.objects.get(database=database)
+    RepresentationLog.objects.create(target=target, instance=database, method="test")
+    return target
+
+
+def query_plans(func: Callable[[], None]) -> List[str]:
+    """
+    Runs func and returns the query plans of the queries it ran against the hot tables,
+    one string of plan steps per query.
+    """
+    queries = []
+
+    def capture(execute, sql, params, many, context):
+        queries.append((sql, params))
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(capture):
+        func()
+
+    plans = []
+    with connection.cursor() as cursor:
+        for sql, params in queries:
+            if not sql.startswith("SELECT") or not any(table in sql for table in HOT_TABLES):
+                continue
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+            plans.append("\n".join(row[-1] for row in cursor.fetchall()))
+    return plans
+
+
+def assert_no_table_scans(plans: List[str]) -> None:
+    for plan in plans:
+        for step in plan.splitlines():
+            match = re.match(r"SCAN (\w+)", step)
+            if match and match.group(1) in HOT_TABLES:
+                assert any(index in step for index in PARTIAL_INDEXES), plan
+
+
+def assert_uses_index(plans: List[str], step: str) -> None:
+    assert any(step in plan for plan in plans), "\n\n".join(plans)
+
+
+def test_models_query_plans_create_replication_logs(target):
+    """
+    Tests that the versions already logged for an object are read from a covering index
+    """
+    database = target.database
+    plans = query_plans(lambda: Database.objects.create(name="new", description="x"))
+    database.name = "renamed"
+    plans += query_plans(database.save)
+
+    assert_no_table_scans(plans)
+    assert_uses_index(
+        plans,
+        "SEARCH fractal_database_replicationlog USING COVERING INDEX",
+    )
+    assert_uses_index(plans, "(content_type_id=? AND object_id=? AND target_id=?)")
+
+
+def test_models_query_plans_replicate(target, settings):
+    """
+    Tests that the pending logs of a target are read from the partial pending index
+    """
+    target.database.name = "renamed"
+    target.database.save()
+
+    def replicate():
+        with patch.object(DummyReplicationTarget, "push_replication_log", new_callable=AsyncMock):
+            async_to_sync(ReplicationTarget.replicate)(target)
+
+    settings.FRACTAL_DATABASE_REPLICATION_DEBOUNCE = 60
+    debounced = query_plans(replicate)
+    settings.FRACTAL_DATABASE_REPLICATION_DEBOUNCE = None
+    plans = debounced + query_plans(replicate)
+
+    assert_no_table_scans(plans)
+    assert_uses_index(
+        debounced, "SEARCH fractal_database_replicationlog USING INDEX replication_log_pending"
+    )
+    assert_uses_index(
+        plans,
+        "SEARCH fractal_database_replicationlog USING INDEX replication_log_pending "
+        "(target_type_id=? AND target_id=?)",
+    )
+    assert not ReplicationLog.objects.filter(deleted=False).exists()
+
+
+def test_models_query_plans_queue_depths(target):
+    """
+    Tests that the dispatcher only visits pending logs to find the targets to replicate
+    """
+    plans = query_plans(ReplicationDispatcher().queue_depths)
+
+    assert_no_table_scans(plans)
+    assert_uses_index(plans, "replication_log_pending")
+
+
+def test_models_query_plans_generic_relations(target):
+    """
+    Tests that the representation logs and instance configs of an instance are looked up by
+    their generic foreign key index
+    """
+    database = target.database
+    plans = query_plans(lambda: list(database.reprlog_set.all()))
+    plans += query_plans(lambda: list(database.replication_configs.all()))
+
+    assert_no_table_scans(plans)
+    for table in HOT_TABLES[1:]:
+        assert_uses_index(plans, f"SEARCH {table} USING INDEX")
+    assert sum("(content_type_id=? AND object_id=?)" in plan for plan in plans) == 2
+
+
+def test_models_query_plans_compaction(target):
+    """
+    Tests that compaction finds the delivered logs with the partial indexes
+    """
+    ReplicationLog.objects.update(deleted=True, delivered_at=timezone.now())
+    RepresentationLog.objects.update(deleted=True)
+
+    plans = query_plans(lambda: compact_replication_logs(retention=0, vacuum=False))
+
+    assert_no_table_scans(plans)
+    assert_uses_index(
+        plans, "SEARCH fractal_database_replicationlog USING INDEX replication_log_delivered"
+    )
+    assert_uses_index(
+        plans, "SEARCH fractal_database_representationlog USING INDEX representation_log_applied"
+    )
@@ -0,0 +1,76 @@
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from fractal_database.models import (
+    Database,
+    DummyReplicationTarget,
+    ReplicationLog,
+    ReplicationPayload,
+    ReplicationTarget,
+    RepresentationLog,
+)
+
+pytestmark = pytest.mark.django_db(transaction=True)
+
+
+async def apply_repr_log(repr_log: RepresentationLog) -> None:
+    await repr_log.aupdate(deleted=True)
+
+
+def create_pending_repr_logs(count: int) -> DummyReplicationTarget:
+    """
+    Creates a target with count pending replication logs, each with a pending
+    representation log.
+    """
+    database = Database.objects.create(name=f"test-database-{count}")
+    target = DummyReplicationTarget.objects.create(name=f"dummy-{count}", database=database)
+    ReplicationLog.objects.filter(deleted=False).update(deleted=True)
+
+    payload = ReplicationPayload.for_instance(database)
+    for i in range(count):
+        repl_log = ReplicationLog.objects.create(
+            payload=payload, target=target, instance=database, txn_id=f"txn-{i}"
+        )
+        repr_log = RepresentationLog.objects.create(
+            instance=database, target=target, method="test.Representation"
+        )
+        repl_log.repr_logs.add(repr_log)
+    return target
+
+
+def replicate_query_count(count: int) -> int:
+    """
+    Replicates a target with count pending representation logs and returns the number
+    of queries it took.
+    """
+    target = create_pending_repr_logs(count)
+
+    with patch.object(RepresentationLog, "apply", autospec=True, side_effect=apply_repr_log):
+        with patch.object(DummyReplicationTarget, "push_replication_log", new=AsyncMock()):
+            with patch.object(
+                DummyReplicationTarget, "arefresh_from_db", new=AsyncMock()
+            ) as mock_refresh:
+                with CaptureQueriesContext(connection) as ctx:
+                    async_to_sync(ReplicationTarget.replicate)(target)
+
+    # the target is refreshed once no matter how many representations were applied
+    mock_refresh.assert_awaited_once()
+    assert not RepresentationLog.objects.filter(deleted=False).exists()
+    assert not ReplicationLog.objects.filter(deleted=False).exists()
+    return len(ctx.captured_queries)
+
+
+def test_models_replicate_representation_logs_linear():
+    """
+    Benchmarks replicate over N pending representation logs. Applying them in a single
+    phase keeps the number of queries linear in N instead of quadratic.
+    """
+    queries = {count: replicate_query_count(count) for count in (5, 10, 20)}
+    print(f"replicate queries per pending representation logs: {queries}")
+
+    per_log_small = (queries[10] - queries[5]) / 5
+    per_log_large = (queries[20] - queries[10]) / 10
+    assert per_log_large == per_log_small
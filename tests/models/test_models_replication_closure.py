@@ -0,0 +1,118 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from fractal_database.models import (
+    App,
+    AppCatalog,
+    Database,
+    Device,
+    DummyReplicationTarget,
+    ReplicatedInstanceConfig,
+    ReplicationLog,
+)
+from fractal_database.replication.graph import replicated_closure
+
+pytestmark = pytest.mark.django_db(transaction=True)
+
+
+@pytest.fixture
+def target(database):
+    return DummyReplicationTarget.objects.get(database=database)
+
+
+def make_app(database, num_devices: int) -> App:
+    """
+    Creates an app that shares its devices with its database, so the devices are
+    reachable from the app both directly and through the database.
+    """
+    devices = Device.objects.bulk_create(
+        [Device(name=f"device-{i}-{num_devices}") for i in range(num_devices)]
+    )
+    # add the devices without sending m2m_changed, joining devices needs a homeserver
+    Database.devices.through.objects.bulk_create(
+        [Database.devices.through(database=database, device=device) for device in devices]
+    )
+    catalog = AppCatalog.objects.create(name="catalog", git_url="https://example.com")
+    app = App.objects.create(
+        name="app", app_instance_id=f"app-{num_devices}", metadata=catalog, database=database
+    )
+    App.devices.through.objects.bulk_create(
+        [App.devices.through(app=app, device=device) for device in devices]
+    )
+    return App.objects.get(pk=app.pk)
+
+
+def logs_for(obj) -> int:
+    return ReplicationLog.objects.filter(
+        object_id=str(obj.pk), instance_version=obj.object_version
+    ).count()
+
+
+def test_models_replication_closure_order(target):
+    """
+    Tests that every reachable object is returned once, after the objects it depends on
+    """
+    app = make_app(target.database, num_devices=3)
+
+    closure = replicated_closure([app])
+
+    keys = [(type(obj), obj.pk) for obj in closure]
+    assert len(keys) == len(set(keys)) == 6
+    assert closure[-1] == app
+    database_index = keys.index((Database, app.database_id))
+    for device in app.devices.all():
+        assert keys.index((Device, device.pk)) < database_index
+
+
+def test_models_replication_closure_cycle(target):
+    """
+    Tests that objects with cyclic relationships are only visited once
+    """
+    # target -> instances -> instance config -> instance (the target itself)
+    target.add_instance(target)
+    target = DummyReplicationTarget.objects.get(pk=target.pk)
+    config = ReplicatedInstanceConfig.objects.get()
+
+    closure = replicated_closure([target])
+    assert {(type(obj), obj.pk) for obj in closure} == {
+        (DummyReplicationTarget, target.pk),
+        (ReplicatedInstanceConfig, config.pk),
+        (Database, target.database_id),
+    }
+
+    target.save()
+    target.refresh_from_db()
+    assert logs_for(target) == 1
+
+
+def test_models_replication_closure_logs_not_duplicated(target):
+    """
+    Tests that objects that already have a log at their current version aren't logged again
+    """
+    app = make_app(target.database, num_devices=2)
+    app.schedule_replication()
+    logs = ReplicationLog.objects.count()
+
+    app.schedule_replication()
+
+    assert ReplicationLog.objects.count() == logs
+    for device in app.devices.all():
+        assert logs_for(device) == 1
+
+
+def test_models_replication_closure_query_count(target):
+    """
+    Tests that the number of queries needed to schedule replication doesn't grow with the
+    number of related objects
+    """
+    counts = []
+    for num_devices in [2, 20]:
+        database = Database.objects.create(name=f"database-{num_devices}")
+        DummyReplicationTarget.objects.create(name=f"dummy-{num_devices}", database=database)
+        app = make_app(database, num_devices)
+        with CaptureQueriesContext(connection) as queries:
+            app.schedule_replication(database=database)
+        counts.append(len(queries))
+        assert logs_for(app) == 1
+
+    assert counts[0] == counts[1]
@@ -0,0 +1,158 @@
+import time
+from datetime import timedelta
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.utils import timezone
+from fractal_database.models import (
+    Database,
+    DummyReplicationTarget,
+    ReplicationLog,
+    ReplicationPayload,
+    ReplicationTarget,
+)
+
+pytestmark = pytest.mark.django_db(transaction=True)
+
+
+def create_logs(target, num_logs: int, age: float = 0) -> list[ReplicationLog]:
+    """
+    Creates num_logs pending logs of successive versions of the target's database, the oldest
+    created age seconds ago.
+    """
+    database = target.database
+    logs = []
+    for i in range(num_logs):
+        database.name = f"name-{i}"
+        database.object_version += 1
+        log = ReplicationLog.objects.create(
+            payload=ReplicationPayload.for_instance(database),
+            target=target,
+            instance=database,
+            instance_version=database.object_version,
+            txn_id=f"txn-{i}",
+        )
+        logs.append(log)
+    ReplicationLog.objects.filter(pk__in=[log.pk for log in logs]).update(
+        date_created=timezone.now() - timedelta(seconds=age)
+    )
+    return logs
+
+
+def replicate(target) -> tuple[AsyncMock, AsyncMock]:
+    with patch.object(DummyReplicationTarget, "push_replication_log", new=AsyncMock()) as push:
+        with patch.object(ReplicationTarget, "replicate_later") as wake_later:
+            async_to_sync(ReplicationTarget.replicate)(target)
+    return push, wake_later
+
+
+def test_models_replication_debounce_holds_logs_within_window(target, settings):
+    """
+    Tests that logs younger than the debounce window are held back and replication is retried
+    once the window closes
+    """
+    settings.FRACTAL_DATABASE_REPLICATION_DEBOUNCE = 5
+    create_logs(target, 3)
+
+    push, wake_later = replicate(target)
+
+    push.assert_not_awaited()
+    assert ReplicationLog.objects.filter(deleted=False).count() == 3
+    wake_later.assert_called_once()
+    assert 0 < wake_later.call_args.args[0] <= 5
+
+
+def test_models_replication_debounce_pushes_newest_version(target, settings):
+    """
+    Tests that once the debounce window closes only the newest log of an object is pushed
+    """
+    settings.FRACTAL_DATABASE_REPLICATION_DEBOUNCE = 5
+    logs = create_logs(target, 3, age=10)
+
+    push, wake_later = replicate(target)
+
+    push.assert_awaited_once()
+    assert push.await_args.args[0][0]["fields"]["name"] == "name-2"
+    assert not ReplicationLog.objects.filter(deleted=False).exists()
+    assert ReplicationLog.objects.get(pk=logs[-1].pk).deleted
+    wake_later.assert_not_called()
+
+
+def test_models_replication_debounce_max_latency(target, settings):
+    """
+    Tests that an object that keeps changing is pushed once its oldest log reaches the max latency
+    """
+    settings.FRACTAL_DATABASE_REPLICATION_DEBOUNCE = 5
+    settings.FRACTAL_DATABASE_REPLICATION_MAX_LATENCY = 10
+    create_logs(target, 2, age=20)
+    # a fresh log keeps the debounce window open
+    create_logs(target, 1)
+
+    push, wake_later = replicate(target)
+
+    push.assert_awaited_once()
+    assert not ReplicationLog.objects.filter(deleted=False).exists()
+    wake_later.assert_not_called()
+
+
+def test_models_replication_debounce_per_model(target):
+    """
+    Tests that a debounce window set on a model only holds back logs of that model
+    """
+    create_logs(target, 2)
+    ReplicationLog.objects.create(
+        payload=ReplicationPayload.for_instance(target),
+        target=target,
+        instance=target,
+        instance_version=target.object_version,
+    )
+
+    with patch.object(Database, "replication_debounce", 60):
+        push, wake_later = replicate(target)
+
+    push.assert_awaited_once()
+    assert push.await_args.args[0][0]["model"] == target._meta.label_lower
+    assert ReplicationLog.objects.filter(deleted=False).count() == 2
+    wake_later.assert_called_once()
+
+
+def test_models_replication_debounce_disabled_by_default(target):
+    """
+    Tests that every pending log is pushed when no debounce window is configured
+    """
+    create_logs(target, 3)
+
+    push, wake_later = replicate(target)
+
+    assert push.await_count == 3
+    wake_later.assert_not_called()
+
+
+def test_models_replication_debounce_retry_without_dispatcher(target):
+    """
+    Tests that held logs are retried without starting the dispatcher unless background
+    replication is enabled
+    """
+    with patch("fractal_database.models.get_dispatcher") as mock_get_dispatcher, patch.object(
+        DummyReplicationTarget, "replicate", new=AsyncMock()
+    ) as mock_replicate:
+        target.replicate_later(0.01)
+        for _ in range(500):
+            if mock_replicate.await_count:
+                break
+            time.sleep(0.01)
+
+    mock_get_dispatcher.assert_not_called()
+    mock_replicate.assert_awaited_once()
+
+
+def test_models_replication_debounce_retry_with_dispatcher(target, settings):
+    """
+    Tests that held logs are retried by the dispatcher when background replication is enabled
+    """
+    settings.FRACTAL_DATABASE_BACKGROUND_REPLICATION = True
+    with patch("fractal_database.models.get_dispatcher") as mock_get_dispatcher:
+        target.replicate_later(5)
+
+    mock_get_dispatcher.return_value.wake_later.assert_called_once_with(target, 5)
@@ -0,0 +1,174 @@
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from django.db import transaction
+from fractal_database.models import (
+    Database,
+    DummyReplicationTarget,
+    ReplicationLog,
+)
+from fractal_database.signals import get_transaction_id
+
+pytestmark = pytest.mark.django_db(transaction=True)
+
+
+@pytest.fixture
+def database(database):
+    """
+    Adds a second dummy target to the current database.
+    """
+    DummyReplicationTarget.objects.create(name="dummy-1", database=database)
+    database.refresh_from_db()
+    ReplicationLog.objects.all().delete()
+    return database
+
+
+def logs_for(database):
+    return ReplicationLog.objects.filter(object_id=str(database.pk), deleted=False)
+
+
+def test_models_replication_log_coalescing_same_transaction(database):
+    """
+    Tests that saving an object several times in one transaction leaves one log per target
+    with the payload of the final version, serialized once
+    """
+    with patch.object(
+        Database, "to_fixture", autospec=True, side_effect=Database.to_fixture
+    ) as mock_to_fixture:
+        with transaction.atomic():
+            for i in range(5):
+                database.name = f"name-{i}"
+                database.save()
+            assert all(log.payload_id is None for log in logs_for(database))
+
+    mock_to_fixture.assert_called_once()
+    logs = list(logs_for(database))
+    assert len(logs) == 2
+    for log in logs:
+        assert log.instance_version == database.object_version
+        assert log.payload.data[0]["fields"]["name"] == "name-4"
+
+
+def test_models_replication_log_coalescing_separate_transactions(database):
+    """
+    Tests that logs of separate transactions are not coalesced
+    """
+    for i in range(3):
+        database.name = f"name-{i}"
+        database.save()
+
+    assert logs_for(database).count() == 6
+    assert not logs_for(database).filter(payload__isnull=True).exists()
+
+
+def test_models_replication_log_coalescing_rolled_back_savepoint(database):
+    """
+    Tests that a log created in a savepoint that was rolled back isn't coalesced into
+    """
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                database.name = "rolled-back"
+                database.save()
+                raise ValueError()
+        except ValueError:
+            pass
+        database.refresh_from_db()
+        database.name = "committed"
+        database.save()
+
+    logs = list(logs_for(database))
+    assert len(logs) == 2
+    assert all(log.payload.object_version == database.object_version for log in logs)
+
+
+def test_models_replication_log_coalescing_transaction_ids(database, settings):
+    """
+    Tests that the logs of a transaction share an id that no other transaction of the thread
+    gets, and that rolling back a savepoint doesn't change it
+    """
+    settings.FRACTAL_DATABASE_COALESCE_REPLICATION_LOGS = False
+    for i in range(2):
+        database.name = f"name-{i}"
+        database.save()
+
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                database.name = "rolled-back"
+                database.save()
+                raise ValueError()
+        except ValueError:
+            pass
+        database.refresh_from_db()
+        for i in range(2):
+            database.name = f"txn-{i}"
+            database.save()
+
+    txn_ids = list(logs_for(database).order_by("date_created").values_list("txn_id", flat=True))
+    assert len(txn_ids) == 8
+    assert txn_ids[0] == txn_ids[1] and txn_ids[2] == txn_ids[3]
+    assert len(set(txn_ids[4:])) == 1
+    assert len(set(txn_ids)) == 3
+
+
+def test_models_replication_log_coalescing_after_rollback(database):
+    """
+    Tests that a transaction that reuses the atomic block of a rolled back transaction gets
+    its own id and logs, and still replicates
+    """
+    txn_ids = []
+
+    @transaction.atomic
+    def save(name: str, fail: bool = False) -> None:
+        database.name = name
+        database.save()
+        txn_ids.append(get_transaction_id())
+        if fail:
+            raise ValueError()
+
+    with patch.object(DummyReplicationTarget, "replicate", new=AsyncMock()) as mock_replicate:
+        with pytest.raises(ValueError):
+            save("rolled-back", fail=True)
+        mock_replicate.assert_not_awaited()
+
+        database.refresh_from_db()
+        save("committed")
+
+    assert txn_ids[0] != txn_ids[1]
+    assert mock_replicate.await_count == 2
+    logs = list(logs_for(database))
+    assert len(logs) == 2
+    assert all(log.txn_id == txn_ids[1] for log in logs)
+    assert all(log.payload.data[0]["fields"]["name"] == "committed" for log in logs)
+
+
+def test_models_replication_log_coalescing_disabled(database, settings):
+    """
+    Tests that every save gets its own logs and payloads when coalescing is disabled
+    """
+    settings.FRACTAL_DATABASE_COALESCE_REPLICATION_LOGS = False
+
+    with transaction.atomic():
+        for i in range(3):
+            database.name = f"name-{i}"
+            database.save()
+            assert not logs_for(database).filter(payload__isnull=True).exists()
+
+    assert logs_for(database).count() == 6
+
+
+def test_models_replication_log_materialize_superseded(database):
+    """
+    Tests that a log without a payload whose object has moved past its version is dropped
+    """
+    target = DummyReplicationTarget.objects.first()
+    log = ReplicationLog.objects.create(
+        target=target, instance=database, instance_version=database.object_version
+    )
+    Database.objects.filter(pk=database.pk).update(object_version=database.object_version + 1)
+
+    assert ReplicationLog.materialize_payloads([log]) == []
+    log.refresh_from_db()
+    assert log.deleted
+    assert log.payload is None
@@ -0,0 +1,111 @@
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from fractal_database.models import (
+    DummyReplicationTarget,
+    ReplicationLog,
+    ReplicationPayload,
+    ReplicationTarget,
+)
+
+pytestmark = pytest.mark.django_db(transaction=True)
+
+
+@pytest.fixture
+def target_with_pending_logs(target):
+    """
+    Creates 10 pending replication logs spread over 5 transactions on the dummy target.
+    """
+    payload = ReplicationPayload.for_instance(target.database)
+    for i in range(10):
+        ReplicationLog.objects.create(
+            payload=payload,
+            target=target,
+            instance=target.database,
+            txn_id=f"txn-{i // 2}",
+        )
+    return target
+
+
+async def _collect_pages(target: ReplicationTarget, page_size: int) -> list[list[ReplicationLog]]:
+    return [page async for page in target.get_repl_log_pages(page_size=page_size)]
+
+
+async def test_models_replication_log_pages_order_and_size(target_with_pending_logs):
+    """
+    Tests that pending logs are yielded in the order they were created in pages of page_size.
+    """
+    pages = await _collect_pages(target_with_pending_logs, page_size=4)
+
+    assert [len(page) for page in pages] == [4, 4, 2]
+    logs = [log for page in pages for log in page]
+    keys = [(log.date_created, log.pk) for log in logs]
+    assert keys == sorted(keys)
+    assert len({log.pk for log in logs}) == 10
+
+
+def test_models_replication_log_pages_query_count(target_with_pending_logs):
+    """
+    Tests that each page costs a constant number of queries, independent of how many
+    transactions it spans.
+    """
+    with CaptureQueriesContext(connection) as ctx:
+        pages = async_to_sync(_collect_pages)(target_with_pending_logs, page_size=5)
+        for page in pages:
+            for log in page:
+                list(log.repr_logs.all())
+
+    # content type lookup is cached, then one query for the logs and one for
+    # their representation logs per page
+    assert len(pages) == 2
+    assert len(ctx.captured_queries) <= 2 * len(pages) + 1
+
+
+async def test_models_replication_log_pages_replicate_pushes_per_txn(target_with_pending_logs):
+    """
+    Tests that replicate pushes one batch per transaction and marks pushed logs deleted.
+    """
+    with patch.object(DummyReplicationTarget, "push_replication_log", new=AsyncMock()) as mock_push:
+        await ReplicationTarget.replicate(target_with_pending_logs)
+
+    assert mock_push.await_count == 5
+    assert all(len(call.args[0]) == 2 for call in mock_push.await_args_list)
+    assert not await ReplicationLog.objects.filter(deleted=False).aexists()
+
+
+async def test_models_replication_log_pages_replicate_keeps_creation_order(
+    target_with_pending_logs,
+):
+    """
+    Tests that logs of interleaved transactions are pushed in the order they were created
+    """
+    logs = [log async for log in ReplicationLog.objects.order_by("date_created", "pk")]
+    for log, txn_id in zip(logs, ["a", "a", "b", "a", "b", "b", "c", "c", "c", "c"]):
+        log.txn_id = txn_id
+        await log.asave(update_fields=["txn_id"])
+
+    with patch.object(DummyReplicationTarget, "push_replication_log", new=AsyncMock()) as mock_push:
+        await ReplicationTarget.replicate(target_with_pending_logs)
+
+    assert [len(call.args[0]) for call in mock_push.await_args_list] == [2, 1, 1, 2, 4]
+
+
+async def test_models_replication_log_pages_failed_push_is_not_retried(
+    target_with_pending_logs,
+):
+    """
+    Tests that logs that fail to push are left pending and are not yielded again
+    during the same replicate call.
+    """
+    with patch.object(
+        DummyReplicationTarget,
+        "push_replication_log",
+        new=AsyncMock(side_effect=Exception("homeserver unavailable")),
+    ) as mock_push:
+        await ReplicationTarget.replicate(target_with_pending_logs)
+
+    assert mock_push.await_count == 5
+    assert await ReplicationLog.objects.filter(deleted=False).acount() == 10
@@ -0,0 +1,65 @@
+from unittest.mock import patch
+
+import pytest
+from fractal_database.models import (
+    Database,
+    DatabaseConfig,
+    DummyReplicationTarget,
+    ReplicationLog,
+    ReplicationPayload,
+)
+
+pytestmark = pytest.mark.django_db(transaction=True)
+
+
+@pytest.fixture
+def database_with_targets():
+    """
+    Creates a current database that replicates to three dummy targets.
+    """
+    database = Database.objects.create(name="test-database")
+    DatabaseConfig.objects.create(current_db=database)
+    for i in range(3):
+        DummyReplicationTarget.objects.create(name=f"dummy-{i}", database=database)
+    return database
+
+
+def test_models_replication_payload_serialized_once_per_version(database_with_targets):
+    """
+    Tests that saving an instance replicated to several targets serializes and stores
+    its payload once, with every target's ReplicationLog referencing it.
+    """
+    with patch.object(
+        Database, "to_fixture", autospec=True, side_effect=Database.to_fixture
+    ) as mock_to_fixture:
+        database_with_targets.name = "renamed"
+        database_with_targets.save()
+
+    mock_to_fixture.assert_called_once()
+
+    payloads = ReplicationPayload.objects.filter(
+        object_id=str(database_with_targets.pk),
+        object_version=database_with_targets.object_version,
+    )
+    assert payloads.count() == 1
+
+    logs = ReplicationLog.objects.filter(
+        object_id=str(database_with_targets.pk),
+        instance_version=database_with_targets.object_version,
+    )
+    assert logs.count() == 3
+    assert {log.payload_id for log in logs} == {payloads.get().pk}
+    assert payloads.get().data[0]["pk"] == str(database_with_targets.pk)
+
+
+def test_models_replication_payload_for_instance_reuses_existing(database_with_targets):
+    """
+    Tests that for_instance returns the stored payload for a version that was already
+    serialized instead of creating a new one.
+    """
+    payload = ReplicationPayload.for_instance(database_with_targets)
+
+    with patch.object(Database, "to_fixture") as mock_to_fixture:
+        assert ReplicationPayload.for_instance(database_with_targets) == payload
+
+    mock_to_fixture.assert_not_called()
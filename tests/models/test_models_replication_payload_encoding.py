@@ -0,0 +1,143 @@
+import json
+import os
+import time
+import tracemalloc
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from asgiref.sync import async_to_sync
+from fractal_database.compression import decompress
+from fractal_database.models import (
+    Database,
+    DummyReplicationTarget,
+    ReplicationLog,
+    ReplicationPayload,
+    ReplicationTarget,
+)
+
+pytestmark = pytest.mark.django_db(transaction=True)
+
+# set to 10000 to benchmark pushing 10k payloads
+BENCHMARK_PAYLOADS = int(os.environ.get("FRACTAL_PAYLOAD_BENCHMARK_PAYLOADS", 500))
+
+
+def create_logs(target, num_logs: int, description: str = "") -> None:
+    """
+    Creates num_logs pending logs in a single transaction, each pushing its own database.
+    """
+    databases = Database.objects.bulk_create(
+        [
+            Database(name=f"database-{i}", description=description, object_version=1)
+            for i in range(num_logs)
+        ]
+    )
+    payloads = ReplicationPayload.for_instances(databases)
+    ReplicationLog.objects.bulk_create(
+        [
+            ReplicationLog(
+                payload=payload,
+                target=target,
+                instance=database,
+                instance_version=database.object_version,
+                txn_id="txn",
+            )
+            for database, payload in zip(databases, payloads)
+        ]
+    )
+
+
+def test_models_replication_payload_encoding_stored(target):
+    """
+    Tests that payloads are stored with the JSON encoding of the fixture they push
+    """
+    database = Database.objects.create(name="encoded")
+    payload = ReplicationPayload.for_instance(database)
+    bulk_payload = ReplicationPayload.for_instances([target])[0]
+
+    for payload in (payload, bulk_payload):
+        payload = ReplicationPayload.objects.get(pk=payload.pk)
+        assert json.loads(decompress(payload.encoded)) == payload.get_fixture()
+
+    ReplicationPayload.objects.filter(pk=payload.pk).update(encoded=None)
+    payload.refresh_from_db()
+    assert json.loads(payload.get_encoded()) == payload.get_fixture()
+
+
+def test_models_replication_payload_encoding_pushed_as_bytes(target):
+    """
+    Tests that replicate splices the encoded payloads of a transaction into a single push
+    """
+    create_logs(target, 3)
+
+    with patch.object(
+        DummyReplicationTarget, "push_encoded_replication_log", new=AsyncMock()
+    ) as mock_push:
+        async_to_sync(ReplicationTarget.replicate)(target)
+
+    mock_push.assert_awaited_once()
+    fixture = mock_push.await_args.args[0]
+    assert isinstance(fixture, bytes)
+    assert sorted(obj["fields"]["name"] for obj in json.loads(fixture)) == [
+        "database-0",
+        "database-1",
+        "database-2",
+    ]
+    assert not ReplicationLog.objects.filter(deleted=False).exists()
+
+
+def test_models_replication_payload_encoding_decoded_by_default(target):
+    """
+    Tests that targets that don't push bytes get the decoded fixture
+    """
+    create_logs(target, 2)
+
+    with patch.object(DummyReplicationTarget, "push_replication_log", new=AsyncMock()) as mock_push:
+        async_to_sync(ReplicationTarget.replicate)(target)
+
+    mock_push.assert_awaited_once()
+    fixture = mock_push.await_args.args[0]
+    assert sorted(obj["fields"]["name"] for obj in fixture) == ["database-0", "database-1"]
+
+
+def _measure(push) -> tuple[float, int]:
+    """
+    Returns the best of 3 seconds and the peak bytes allocated to load every pending log
+    and build its push.
+    """
+    elapsed = []
+    for _ in range(3):
+        start = time.perf_counter()
+        push()
+        elapsed.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    push()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(elapsed), peak
+
+
+def test_models_replication_payload_encoding_benchmark(target):
+    """
+    Benchmarks building a push of a large batch from pre-encoded payloads against decoding
+    the payloads and encoding the batch again.
+    """
+    create_logs(target, BENCHMARK_PAYLOADS, description="x" * 2000)
+    logs = ReplicationLog.objects.filter(target_id=target.pk).select_related("payload")
+
+    def reencode():
+        payloads = [log.payload.get_fixture() for log in logs.defer("payload__encoded")]
+        return json.dumps(payloads).encode()
+
+    def splice():
+        encoded = logs.defer("payload__data", "payload__delta")
+        return b"[" + b",".join(log.payload.get_encoded() for log in encoded) + b"]"
+
+    assert json.loads(splice()) == json.loads(reencode())
+    reencode_elapsed, reencode_peak = _measure(reencode)
+    splice_elapsed, splice_peak = _measure(splice)
+
+    print(
+        f"{BENCHMARK_PAYLOADS} payloads: re-encode {reencode_elapsed:.3f}s "
+        f"peak {reencode_peak} bytes, splice {splice_elapsed:.3f}s peak {splice_peak} bytes"
+    )
@@ -0,0 +1,94 @@
+import pytest
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from fractal_database.exceptions import StaleObjectException
+from fractal_database.models import Database
+
+pytestmark = pytest.mark.django_db(transaction=True)
+
+
+def _save_queries(database: Database) -> list[str]:
+    """
+    Saves the provided database and returns the SQL for every query that touched its table.
+    """
+    database.name = f"{database.name}-renamed"
+    with CaptureQueriesContext(connection) as ctx:
+        database.save()
+
+    table = Database._meta.db_table
+    return [
+        q["sql"]
+        for q in ctx.captured_queries
+        if f'FROM "{table}"' in q["sql"] or f'UPDATE "{table}"' in q["sql"]
+    ]
+
+
+def test_models_single_statement_save_query_count():
+    """
+    Tests that the single statement save path writes a versioned save to the
+    database table with a single query instead of four.
+    """
+    database = Database.objects.create(name="test-database")
+
+    default_queries = _save_queries(database)
+    expected_version = database.object_version
+
+    with override_settings(FRACTAL_DATABASE_SINGLE_STATEMENT_SAVE=True):
+        single_statement_queries = _save_queries(database)
+
+    # select_for_update().get(), save, increment_version's update and refresh_from_db
+    assert len(default_queries) == 4
+    assert len(single_statement_queries) == 1
+    assert single_statement_queries[0].startswith("UPDATE")
+    assert f'"object_version" = {expected_version} AND' in single_statement_queries[0]
+
+
+@override_settings(FRACTAL_DATABASE_SINGLE_STATEMENT_SAVE=True)
+def test_models_single_statement_save_increments_version():
+    """
+    Tests that the object version is incremented on create and on every update.
+    """
+    database = Database.objects.create(name="test-database")
+    assert database.object_version == 1
+
+    database.name = "renamed"
+    database.save()
+    assert database.object_version == 2
+
+    database.refresh_from_db()
+    assert database.object_version == 2
+    assert database.name == "renamed"
+
+
+@override_settings(FRACTAL_DATABASE_SINGLE_STATEMENT_SAVE=True)
+def test_models_single_statement_save_update_fields_includes_version():
+    """
+    Tests that saving with update_fields still persists the new object version.
+    """
+    database = Database.objects.create(name="test-database")
+
+    database.name = "renamed"
+    database.save(update_fields=["name"])
+
+    database.refresh_from_db()
+    assert database.object_version == 2
+
+
+@override_settings(FRACTAL_DATABASE_SINGLE_STATEMENT_SAVE=True)
+def test_models_single_statement_save_stale_object():
+    """
+    Tests that StaleObjectException is raised when the row was updated by someone
+    else and that the in memory version of the stale copy is left untouched.
+    """
+    database = Database.objects.create(name="test-database")
+    stale_copy = Database.objects.get(pk=database.pk)
+
+    database.name = "renamed"
+    database.save()
+
+    stale_copy.name = "stale"
+    with pytest.raises(StaleObjectException):
+        stale_copy.save()
+
+    assert stale_copy.object_version == 1
@@ -0,0 +1,160 @@
+from unittest.mock import patch
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from fractal_database.models import (
+    Database,
+    DummyReplicationTarget,
+    ReplicationTarget,
+    target_registry,
+)
+
+pytestmark = pytest.mark.django_db(transaction=True)
+
+
+def reset_cache():
+    target_registry._cache.clear()
+    target_registry._cache.hits = 0
+    target_registry._cache.misses = 0
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    reset_cache()
+
+
+@pytest.fixture
+def database():
+    database = Database.objects.create(name="test-database")
+    DummyReplicationTarget.objects.create(name="primary", database=database, primary=True)
+    DummyReplicationTarget.objects.create(name="secondary", database=database)
+    reset_cache()
+    return database
+
+
+def test_models_target_registry_target_types():
+    """
+    Tests that the registry only knows about concrete ReplicationTarget models
+    """
+    assert DummyReplicationTarget in target_registry.target_types
+    assert ReplicationTarget not in target_registry.target_types
+
+
+def test_models_target_registry_query_count(database):
+    """
+    Tests that a database's targets are loaded with one query per target type
+    and served from the cache afterwards
+    """
+    with CaptureQueriesContext(connection) as queries:
+        targets = database.get_all_replication_targets()
+    assert sorted(target.name for target in targets) == ["primary", "secondary"]
+    assert len(queries) <= len(target_registry.target_types) * 2
+
+    with CaptureQueriesContext(connection) as queries:
+        database.get_all_replication_targets()
+        assert database.primary_target().name == "primary"
+    assert len(queries) == 0
+    assert target_registry.stats() == {"hits": 2, "misses": 1}
+
+
+def test_models_target_registry_async(database):
+    """
+    Tests the async lookups
+    """
+    assert async_to_sync(database.aprimary_target)().name == "primary"
+
+    with CaptureQueriesContext(connection) as queries:
+        targets = async_to_sync(database.aget_all_replication_targets)()
+    assert len(targets) == 2
+    assert len(queries) == 0
+
+
+def test_models_target_registry_invalidated_on_save_and_delete(database):
+    """
+    Tests that saving or deleting a target invalidates the cache
+    """
+    primary = database.primary_target()
+    primary.name = "renamed"
+    primary.save()
+    assert database.primary_target().name == "renamed"
+
+    DummyReplicationTarget.objects.filter(name="secondary").delete()
+    assert [target.name for target in database.get_all_replication_targets()] == ["renamed"]
+
+
+def test_models_target_registry_invalidated_on_update(database):
+    """
+    Tests that updating a target with update() invalidates the cache
+    """
+    database.primary_target().update(primary=False)
+
+    assert database.primary_target() is None
+
+
+def test_models_target_registry_returns_copies(database):
+    """
+    Tests that modifying a returned target doesn't modify the cached one
+    """
+    database.primary_target().name = "modified"
+
+    assert database.primary_target().name == "primary"
+
+
+def test_models_target_registry_not_populated_by_rolled_back_transaction(database):
+    """
+    Tests that targets read inside of a transaction that is rolled back aren't cached
+    """
+    try:
+        with transaction.atomic():
+            DummyReplicationTarget.objects.create(name="rolled-back", database=database)
+            assert len(database.get_all_replication_targets()) == 3
+            raise ValueError()
+    except ValueError:
+        pass
+
+    assert len(database.get_all_replication_targets()) == 2
+
+
+def test_models_target_registry_copies_are_isolated(database):
+    """
+    Tests that changes to the returned targets don't leak into the cache
+    """
+    target = database.get_all_replication_targets()[0]
+    target.metadata["room_id"] = "!leaked:localhost"
+    target.database.name = "leaked"
+
+    for cached in database.get_all_replication_targets():
+        assert "room_id" not in cached.metadata
+        assert cached.database.name == "test-database"
+
+    target = target_registry.get_target(target.get_content_type().pk, target.pk)
+    target.metadata["room_id"] = "!leaked:localhost"
+    assert (
+        "room_id"
+        not in target_registry.get_target(target.get_content_type().pk, target.pk).metadata
+    )
+
+
+def test_models_target_registry_expires(database, settings):
+    """
+    Tests that targets changed by another process are loaded again once the cached targets
+    expire
+    """
+    settings.FRACTAL_DATABASE_TARGET_CACHE_TTL = 60
+    with patch("fractal_database.cache.time.monotonic", return_value=1000.0) as mock_monotonic:
+        assert database.primary_target().name == "primary"
+        # another process doesn't invalidate this process's cache
+        DummyReplicationTarget.objects.filter(name="primary").update(name="renamed")
+
+        mock_monotonic.return_value = 1059.0
+        assert database.primary_target().name == "primary"
+
+        mock_monotonic.return_value = 1060.0
+        assert database.primary_target().name == "renamed"
+
+    settings.FRACTAL_DATABASE_TARGET_CACHE_TTL = None
+    DummyReplicationTarget.objects.filter(name="renamed").update(name="primary")
+    with patch("fractal_database.cache.time.monotonic", return_value=10**9):
+        assert database.primary_target().name == "renamed"
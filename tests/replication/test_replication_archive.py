@@ -0,0 +1,186 @@
+import os
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
+
+import pytest
+from django.core.management import call_command
+from django.utils import timezone
+from fractal_database.models import (
+    Database,
+    ReplicationLog,
+    ReplicationPayload,
+)
+from fractal_database.replication.archive import LogArchive
+from fractal_database.replication.compaction import compact_replication_logs
+
+pytestmark = pytest.mark.django_db(transaction=True)
+
+
+def create_versions(target, database: Database, names) -> None:
+    """
+    Saves the provided database once per name, creating a delivered log of every version.
+    """
+    for name in names:
+        database.name = name
+        database.save()
+        ReplicationLog.objects.create(
+            payload=ReplicationPayload.for_instance(database),
+            target=target,
+            instance=database,
+            instance_version=database.object_version,
+            deleted=True,
+            delivered_at=timezone.now(),
+        )
+    ReplicationLog.objects.update(date_created=timezone.now() - timedelta(days=30))
+
+
+def test_replication_archive_time_travel(target, tmp_path, settings):
+    """
+    Tests that compaction archives delivered logs, and that every archived version can be read
+    """
+    settings.FRACTAL_DATABASE_LOG_ARCHIVE_DIR = str(tmp_path)
+    database = Database.objects.create(name="v0")
+    create_versions(target, database, ["v1", "v2", "v3", "v4"])
+    versions = list(
+        ReplicationLog.objects.filter(object_id=database.pk)
+        .order_by("instance_version")
+        .values_list("instance_version", flat=True)
+    )[:-1]
+
+    report = compact_replication_logs(retention=60)
+
+    # the newest delivered version is kept
+    assert report["replication_logs"] == 3
+    assert ReplicationLog.objects.get().instance_version == database.object_version
+
+    archive = LogArchive(str(tmp_path))
+    assert archive.versions("fractal_database.Database", database.pk) == versions
+    newest = archive.get("fractal_database.database", database.pk)
+    assert newest["fixture"][0]["fields"]["name"] == "v3"
+    record = archive.get("fractal_database.database", database.pk, versions[1])
+    assert record["fixture"][0]["fields"]["name"] == "v2"
+    assert record["target"] == f"fractal_database.dummyreplicationtarget:{target.pk}"
+    # versions that aren't archived resolve to the newest archived version before them
+    record = archive.get("fractal_database.database", database.pk, versions[-1] + 10)
+    assert record["version"] == versions[-1]
+    assert archive.get("fractal_database.database", database.pk, versions[0] - 1) is None
+    assert archive.get("fractal_database.database", "missing") is None
+    archive.close()
+
+
+def test_replication_archive_segments(target, tmp_path):
+    """
+    Tests that the archive rolls over to new segments and reads them back after a restart
+    """
+    databases = [Database.objects.create(name=f"db-{i}") for i in range(6)]
+    for i, database in enumerate(databases):
+        create_versions(target, database, [f"db-{i}-saved", f"db-{i}-newer"])
+    archive = LogArchive(str(tmp_path), segment_size=1)
+
+    compact_replication_logs(retention=60, batch_size=2, archive=archive.append)
+
+    assert archive.segments() == [1, 2, 3]
+    for name in os.listdir(tmp_path):
+        assert name.endswith((".seg", ".idx"))
+
+    reopened = LogArchive(str(tmp_path))
+    for i, database in enumerate(databases):
+        record = reopened.get("fractal_database.database", database.pk)
+        assert record["fixture"][0]["fields"]["name"] == f"db-{i}-saved"
+    reopened.close()
+    archive.close()
+
+
+def test_replication_archive_loads_index_lazily(target, tmp_path):
+    """
+    Tests that appending doesn't load the index, and that records appended after it was
+    loaded can be read
+    """
+    database = Database.objects.create(name="lazy")
+    create_versions(target, database, ["lazy-1", "lazy-2"])
+    logs = list(ReplicationLog.objects.select_related("payload").order_by("instance_version"))
+    archive = LogArchive(str(tmp_path))
+
+    with patch.object(LogArchive, "_load_index", autospec=True) as mock_load_index:
+        archive.append(logs[:1])
+    mock_load_index.assert_not_called()
+
+    assert len(archive.versions("fractal_database.database", database.pk)) == 1
+    archive.append(logs[1:])
+    assert len(archive.versions("fractal_database.database", database.pk)) == 2
+    archive.close()
+
+
+def test_replication_archive_ignores_unindexed_records(target, tmp_path):
+    """
+    Tests that records left without an index entry by a crash are never read
+    """
+    database = Database.objects.create(name="indexed")
+    create_versions(target, database, ["indexed-saved"])
+    archive = LogArchive(str(tmp_path))
+    archive.append(list(ReplicationLog.objects.select_related("payload")))
+
+    # a crash while appending: the record was written, its index line was cut short
+    with open(tmp_path / "segment-000001.seg", "ab") as f:
+        f.write(b"\x01garbage")
+    with open(tmp_path / "segment-000001.idx", "a") as f:
+        f.write('["fractal_database.database", "')
+
+    reopened = LogArchive(str(tmp_path))
+    assert len(reopened.versions("fractal_database.database", database.pk)) == 1
+    assert (
+        reopened.get("fractal_database.database", database.pk)["fixture"][0]["fields"]["name"]
+        == "indexed-saved"
+    )
+
+    # appending after the crash still indexes the new records
+    create_versions(target, database, ["indexed-saved-again"])
+    reopened.append(list(ReplicationLog.objects.select_related("payload")))
+    restarted = LogArchive(str(tmp_path))
+    assert len(restarted.versions("fractal_database.database", database.pk)) == 2
+    reopened.close()
+    restarted.close()
+    archive.close()
+
+
+def test_replication_archive_only_delivered_logs(target, tmp_path):
+    """
+    Tests that logs that weren't delivered or have no payload aren't archived
+    """
+    database = Database.objects.create(name="delivered")
+    create_versions(target, database, ["delivered-1", "dropped", "no-payload"])
+    delivered, dropped, no_payload = ReplicationLog.objects.order_by("instance_version")
+    ReplicationLog.objects.filter(pk=dropped.pk).update(delivered_at=None)
+    ReplicationLog.objects.filter(pk=no_payload.pk).update(payload=None)
+    archive = LogArchive(str(tmp_path))
+
+    archive.append(list(ReplicationLog.objects.select_related("payload")))
+
+    assert archive.versions("fractal_database.database", database.pk) == [
+        delivered.instance_version
+    ]
+    archive.close()
+
+
+def test_replication_archive_command(target, tmp_path):
+    """
+    Tests that the compaction command archives to the provided directory
+    """
+    database = Database.objects.create(name="command")
+    create_versions(target, database, ["command-saved", "command-newer"])
+
+    call_command(
+        "compact_replication_logs",
+        "--retention",
+        "60",
+        "--archive-dir",
+        str(tmp_path),
+        stdout=StringIO(),
+    )
+
+    assert ReplicationLog.objects.count() == 1
+    archive = LogArchive(str(tmp_path))
+    record = archive.get("fractal_database.database", database.pk)
+    assert record["fixture"][0]["fields"]["name"] == "command-saved"
+    archive.close()
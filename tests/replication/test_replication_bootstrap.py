@@ -0,0 +1,166 @@
+import json
+from types import SimpleNamespace
+from typing import List, Optional
+from unittest.mock import patch
+
+import pytest
+from fractal_database.models import Device, SyncCheckpoint
+from fractal_database.replication import bootstrap
+from fractal_database.replication.bootstrap import RoomSync
+from fractal_database.replication.tasks import replicate_fixture, send_full_fixtures
+
+pytestmark = pytest.mark.django_db(transaction=True)
+
+ROOM_ID = "!room:localhost"
+
+
+class FakeQueue:
+    """
+    Serves pages of replication tasks like MatrixQueue.get_tasks_from_room.
+    """
+
+    task_types = SimpleNamespace(task="taskiq.replication.task")
+
+    def __init__(self, pages: List[list]):
+        self.pages = pages
+
+    async def get_tasks_from_room(self, room_id, task_filter=None, start="", end=""):
+        page = int(start) if start else 0
+        if page >= len(self.pages):
+            return [], None
+        return list(self.pages[page]), str(page + 1)
+
+
+def make_task(name: str) -> SimpleNamespace:
+    fixture = [
+        {
+            "model": "fractal_database.device",
+            "pk": name,
+            "fields": {
+                "date_created": "2024-01-01T00:00:00Z",
+                "date_modified": "2024-01-01T00:00:00Z",
+                "deleted": False,
+                "object_version": 1,
+                "name": name,
+                "display_name": None,
+                "owner_matrix_id": None,
+            },
+        }
+    ]
+    return SimpleNamespace(
+        id=name, data={"task_name": replicate_fixture.task_name, "args": [json.dumps(fixture)]}
+    )
+
+
+def make_pages(num_pages: int, page_size: int) -> List[list]:
+    return [
+        [make_task(f"00000000-0000-0000-0000-{page:06d}{i:06d}") for i in range(page_size)]
+        for page in range(num_pages)
+    ]
+
+
+async def test_replication_bootstrap_syncs_room():
+    """
+    Tests that every page of tasks is applied and the checkpoint points at the last task
+    """
+    pages = make_pages(num_pages=3, page_size=4)
+
+    synced = await RoomSync(ROOM_ID, FakeQueue(pages)).run()
+
+    assert synced == 12
+    assert await Device.objects.acount() == 12
+    checkpoint = await SyncCheckpoint.objects.aget(room_id=ROOM_ID)
+    assert checkpoint.since_token == "3"
+    assert checkpoint.last_task_id is None
+
+
+async def test_replication_bootstrap_bounded_transactions():
+    """
+    Tests that objects are applied in transactions of at most batch_size objects,
+    or less once the memory limit is reached
+    """
+    pages = make_pages(num_pages=2, page_size=5)
+    batches = []
+
+    def load(objects: list):
+        batches.append(len(objects))
+
+    with patch.object(bootstrap, "load_data_from_dicts", side_effect=load):
+        await RoomSync(ROOM_ID, FakeQueue(pages), batch_size=2).run()
+    assert batches == [2, 2, 1, 2, 2, 1]
+
+    batches.clear()
+    fixture_size = len(pages[0][0].data["args"][0])
+    with patch.object(bootstrap, "load_data_from_dicts", side_effect=load):
+        await RoomSync(ROOM_ID, FakeQueue(pages), memory_limit=fixture_size).run(restart=True)
+    assert batches == [1] * 10
+
+
+async def test_replication_bootstrap_memory_limit_counts_page():
+    """
+    Tests that the raw tasks of the page being synced count towards the memory limit
+    """
+    pages = make_pages(num_pages=2, page_size=4)
+    fixture_size = len(pages[0][0].data["args"][0])
+    batches = []
+
+    def load(objects: list):
+        batches.append(len(objects))
+
+    # a page takes 4 fixtures, leaving room for 2 decoded fixtures per transaction
+    with patch.object(bootstrap, "load_data_from_dicts", side_effect=load):
+        await RoomSync(ROOM_ID, FakeQueue(pages), memory_limit=fixture_size * 6).run()
+    assert batches == [2, 2, 2, 2]
+
+
+async def test_replication_bootstrap_resumes_after_interruption():
+    """
+    Tests that a sync that was interrupted resumes after the last applied task
+    """
+    pages = make_pages(num_pages=2, page_size=4)
+    loaded: List[Optional[str]] = []
+
+    def fail_on_second_batch(objects: list):
+        if loaded:
+            raise Exception("interrupted")
+        loaded.extend(obj["pk"] for obj in objects)
+
+    with patch.object(bootstrap, "load_data_from_dicts", side_effect=fail_on_second_batch):
+        with pytest.raises(Exception, match="interrupted"):
+            await RoomSync(ROOM_ID, FakeQueue(pages), batch_size=3).run()
+
+    checkpoint = await SyncCheckpoint.objects.aget(room_id=ROOM_ID)
+    assert checkpoint.since_token is None
+    assert checkpoint.last_task_id == pages[0][2].id
+
+    loaded.clear()
+    with patch.object(
+        bootstrap,
+        "load_data_from_dicts",
+        side_effect=lambda objects: loaded.extend(obj["pk"] for obj in objects),
+    ):
+        await RoomSync(ROOM_ID, FakeQueue(pages), batch_size=3).run()
+
+    assert loaded == [task.id for task in pages[0][3:] + pages[1]]
+
+
+async def test_replication_bootstrap_skips_other_tasks():
+    """
+    Tests that tasks of the replication queue that don't replicate a fixture are skipped
+    """
+    pages = make_pages(num_pages=1, page_size=2)
+    pages[0].insert(
+        1,
+        SimpleNamespace(
+            id="full-fixtures",
+            data={
+                "task_name": send_full_fixtures.task_name,
+                "args": [[["fractal_database.device", "00000000-0000-0000-0000-000000000000"]]],
+            },
+        ),
+    )
+
+    synced = await RoomSync(ROOM_ID, FakeQueue(pages)).run()
+
+    assert synced == 2
+    assert await Device.objects.acount() == 2
@@ -0,0 +1,253 @@
+import time
+from datetime import timedelta
+from io import StringIO
+from typing import List
+from unittest.mock import patch
+
+import pytest
+from django.core.management import call_command
+from django.db import connection
+from django.utils import timezone
+from fractal_database.models import (
+    Database,
+    ReplicationLog,
+    ReplicationPayload,
+    RepresentationLog,
+)
+from fractal_database.replication.compaction import compact_replication_logs
+from fractal_database.replication.dispatcher import ReplicationDispatcher
+
+pytestmark = pytest.mark.django_db(transaction=True)
+
+
+@pytest.fixture
+def target(target):
+    RepresentationLog.objects.all().delete()
+    ReplicationPayload.objects.all().delete()
+    return target
+
+
+def age(queryset, days: int = 30) -> None:
+    """
+    Moves the creation date of the provided rows days into the past.
+    """
+    queryset.update(date_created=timezone.now() - timedelta(days=days))
+
+
+def create_log(target, instance, delivered: bool) -> ReplicationLog:
+    return ReplicationLog.objects.create(
+        payload=ReplicationPayload.for_instance(instance),
+        target=target,
+        instance=instance,
+        instance_version=instance.object_version,
+        deleted=delivered,
+        delivered_at=timezone.now() if delivered else None,
+    )
+
+
+def create_versions(target, name: str, delivered: List[bool]) -> List[ReplicationLog]:
+    """
+    Creates a database with one log per provided version, delivered or not.
+    """
+    database = Database.objects.create(name=name)
+    logs = []
+    for version, is_delivered in enumerate(delivered, start=1):
+        database.object_version = version
+        logs.append(create_log(target, database, is_delivered))
+    return logs
+
+
+def test_replication_compaction_deletes_old_delivered_logs(target):
+    """
+    Tests that only delivered logs older than the retention window are deleted, in batches,
+    keeping the newest delivered version of every instance
+    """
+    logs = create_versions(target, "versions", [True] * 6)
+    pending = create_versions(target, "pending", [True, False])
+    recent = create_versions(target, "recent", [True, True])
+    age(ReplicationLog.objects.exclude(pk=recent[0].pk))
+
+    archived = []
+    report = compact_replication_logs(
+        retention=60, batch_size=2, archive=lambda logs: archived.append(logs)
+    )
+
+    assert report["replication_logs"] == 5
+    assert set(ReplicationLog.objects.values_list("pk", flat=True)) == {
+        logs[-1].pk,
+        *(log.pk for log in pending),
+        *(log.pk for log in recent),
+    }
+    # each batch is archived and deleted in its own transaction
+    assert [len(batch) for batch in archived] == [2, 2, 1]
+    assert {log.pk for batch in archived for log in batch} == {log.pk for log in logs[:-1]}
+
+
+def test_replication_compaction_dropped_logs(target):
+    """
+    Tests that logs that were dropped without being delivered are only deleted once a newer
+    version was delivered, without being archived
+    """
+    superseded = create_versions(target, "superseded", [False, True])
+    undelivered = create_versions(target, "undelivered", [True, False, False])
+    ReplicationLog.objects.filter(delivered_at__isnull=True).update(deleted=True)
+    age(ReplicationLog.objects.all())
+
+    archived = []
+    report = compact_replication_logs(retention=60, archive=archived.extend)
+
+    assert report["replication_logs"] == 1
+    assert archived == []
+    assert set(ReplicationLog.objects.values_list("pk", flat=True)) == {
+        superseded[1].pk,
+        *(log.pk for log in undelivered),
+    }
+
+
+def test_replication_compaction_archive_failure_keeps_batch(target):
+    """
+    Tests that a batch whose archiving fails isn't deleted
+    """
+    create_versions(target, "delivered", [True, True])
+    age(ReplicationLog.objects.all())
+
+    def archive(logs):
+        raise OSError("disk full")
+
+    with pytest.raises(OSError):
+        compact_replication_logs(retention=60, archive=archive)
+
+    assert ReplicationLog.objects.count() == 2
+
+
+def test_replication_compaction_representation_logs(target):
+    """
+    Tests that applied representation logs are deleted unless a pending log references them
+    """
+    applied = RepresentationLog.objects.create(
+        target=target, instance=target, method="applied", deleted=True
+    )
+    referenced = RepresentationLog.objects.create(
+        target=target, instance=target, method="referenced", deleted=True
+    )
+    unapplied = RepresentationLog.objects.create(target=target, instance=target, method="new")
+    pending = create_log(target, Database.objects.create(name="pending"), False)
+    pending.repr_logs.add(referenced)
+    age(RepresentationLog.objects.all())
+
+    report = compact_replication_logs(retention=60)
+
+    assert report["representation_logs"] == 1
+    assert not RepresentationLog.objects.filter(pk=applied.pk).exists()
+    assert set(RepresentationLog.objects.values_list("pk", flat=True)) == {
+        referenced.pk,
+        unapplied.pk,
+    }
+
+
+def test_replication_compaction_payloads(target):
+    """
+    Tests that unused payloads are deleted, except the newest payload of every instance
+    """
+    database = Database.objects.create(name="versions")
+    old = ReplicationPayload.for_instance(database)
+    database.name = "versions-2"
+    database.save()
+    newest = ReplicationPayload.for_instance(database)
+    other = Database.objects.create(name="other")
+    used = create_log(target, other, False).payload
+    age(ReplicationPayload.objects.all())
+
+    report = compact_replication_logs(retention=60)
+
+    assert report["replication_payloads"] == 1
+    assert not ReplicationPayload.objects.filter(pk=old.pk).exists()
+    assert ReplicationPayload.objects.filter(pk__in=[newest.pk, used.pk]).count() == 2
+
+
+def test_replication_compaction_command_reports(target):
+    """
+    Tests that the command reports the deleted rows and the reclaimed bytes
+    """
+    databases = Database.objects.bulk_create(
+        [Database(name=f"db-{i}", description="x" * 1000) for i in range(200)]
+    )
+    payloads = ReplicationPayload.for_instances(databases)
+    ReplicationLog.objects.bulk_create(
+        [
+            ReplicationLog(
+                payload=payload,
+                target=target,
+                instance=database,
+                instance_version=version,
+                deleted=True,
+                delivered_at=timezone.now(),
+            )
+            for database, payload in zip(databases, payloads)
+            for version in (1, 2)
+        ]
+    )
+    age(ReplicationLog.objects.all())
+    # the payloads are the newest of their instances, so they are kept
+    size_before = ReplicationPayload.objects.count()
+
+    out = StringIO()
+    call_command("compact_replication_logs", "--retention", "60", "--vacuum", stdout=out)
+
+    output = out.getvalue()
+    assert "Deleted 200 replication logs" in output
+    assert "Deleted 0 replication payloads" in output
+    assert "Reclaimed" in output
+    assert ReplicationLog.objects.count() == 200
+    assert ReplicationPayload.objects.count() == size_before
+
+
+def vacuumed(func) -> bool:
+    """
+    Runs func and returns whether it vacuumed the database.
+    """
+    statements = []
+
+    def capture(execute, sql, params, many, context):
+        statements.append(sql)
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(capture):
+        func()
+    return "VACUUM" in statements
+
+
+@pytest.mark.skipif(connection.vendor != "sqlite", reason="only SQLite is vacuumed")
+def test_replication_compaction_vacuum_threshold(target, settings):
+    """
+    Tests that compaction only vacuums once the free pages pass the threshold, unless asked to
+    """
+    settings.FRACTAL_DATABASE_LOG_COMPACTION_VACUUM_THRESHOLD = 1024 * 1024 * 1024
+    assert not vacuumed(lambda: compact_replication_logs(retention=0))
+    assert vacuumed(lambda: compact_replication_logs(retention=0, vacuum=True))
+    assert vacuumed(lambda: call_command("compact_replication_logs", "--vacuum", stdout=StringIO()))
+
+    settings.FRACTAL_DATABASE_LOG_COMPACTION_VACUUM_THRESHOLD = 0
+    assert vacuumed(lambda: compact_replication_logs(retention=0))
+    assert not vacuumed(lambda: compact_replication_logs(retention=0, vacuum=False))
+    assert not vacuumed(
+        lambda: call_command("compact_replication_logs", "--no-vacuum", stdout=StringIO())
+    )
+
+    settings.FRACTAL_DATABASE_LOG_COMPACTION_VACUUM_THRESHOLD = None
+    assert not vacuumed(lambda: compact_replication_logs(retention=0))
+
+
+def test_replication_compaction_periodic():
+    """
+    Tests that the dispatcher compacts the logs periodically once compaction is scheduled
+    """
+    dispatcher = ReplicationDispatcher()
+    with patch("fractal_database.replication.compaction.compact_replication_logs") as mock_compact:
+        dispatcher.schedule_compaction(0.05)
+        deadline = time.monotonic() + 5
+        while mock_compact.call_count < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        dispatcher.stop(timeout=5)
+
+    assert mock_compact.call_count >= 2
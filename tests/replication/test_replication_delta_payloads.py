@@ -0,0 +1,289 @@
+import json
+from datetime import timedelta
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.core.serializers import serialize
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from fractal_database.models import (
+    Database,
+    DatabaseConfig,
+    Device,
+    DummyReplicationTarget,
+    ReplicationLog,
+    ReplicationTarget,
+    target_registry,
+)
+from fractal_database.replication.fixtures import apply_fixture, encode_delta
+from fractal_database.replication.tasks import (
+    load_data_from_dicts,
+    request_full_fixtures,
+    send_full_fixtures,
+)
+
+pytestmark = pytest.mark.django_db(transaction=True)
+
+
+@pytest.fixture
+def database(settings):
+    """
+    Creates a current database with a large description that replicates to a dummy target.
+    """
+    settings.FRACTAL_DATABASE_DELTA_PAYLOADS = True
+    database = Database.objects.create(name="test-database", description="x" * 10_000)
+    DatabaseConfig.objects.create(current_db=database)
+    DummyReplicationTarget.objects.create(name="dummy", database=database)
+    return Database.objects.get(pk=database.pk)
+
+
+def make_fixture(version: int) -> list:
+    """
+    Returns a fixture of a database with two devices at the provided version.
+    """
+    now = timezone.now()
+    devices = [
+        Device(name=f"device-{i}", object_version=version, date_created=now, date_modified=now)
+        for i in range(2)
+    ]
+    database = Database(name="test-db", object_version=version, date_created=now, date_modified=now)
+    fixture = json.loads(serialize("json", [database, *devices]))
+    fixture[0]["fields"]["devices"] = [str(device.pk) for device in devices]
+    return fixture
+
+
+def latest_payload(database):
+    log = ReplicationLog.objects.get(
+        object_id=str(database.pk), instance_version=database.object_version
+    )
+    return log.payload
+
+
+def test_replication_delta_payloads_changed_fields_only(database):
+    """
+    Tests that the pushed payload only carries the fields that changed since the previous version
+    """
+    base_version = database.object_version
+    database.name = "renamed"
+    database.save()
+
+    payload = latest_payload(database)
+    fixture = payload.get_fixture()
+    assert fixture["base_version"] == base_version
+    assert set(fixture["fields"]) == {"name", "object_version", "date_modified"}
+    assert fixture["fields"]["object_version"] == database.object_version
+    # the full fixture is kept for targets that need it
+    assert payload.data[0]["fields"]["description"] == database.description
+    assert len(json.dumps(fixture)) * 50 < len(json.dumps(payload.data))
+
+
+def test_replication_delta_payloads_disabled(database, settings):
+    """
+    Tests that full fixtures are pushed when delta payloads are disabled
+    """
+    settings.FRACTAL_DATABASE_DELTA_PAYLOADS = False
+    database.name = "renamed"
+    database.save()
+
+    payload = latest_payload(database)
+    assert payload.delta is None
+    assert payload.get_fixture() == payload.data[0]
+
+
+def test_replication_delta_payloads_applied():
+    """
+    Tests that a delta is applied on top of the local copy when it is at the base version
+    """
+    fixture = make_fixture(version=3)
+    apply_fixture(fixture)
+    updated = json.loads(json.dumps(fixture[0]))
+    updated["fields"].update(name="renamed", object_version=4)
+
+    load_data_from_dicts([encode_delta(fixture[0], updated)])
+
+    database = Database.objects.get(pk=fixture[0]["pk"])
+    assert database.name == "renamed"
+    assert database.object_version == 4
+    assert database.devices.count() == 2
+
+
+def test_replication_delta_payloads_base_version_mismatch():
+    """
+    Tests that a delta whose base version doesn't match the local copy isn't applied and
+    that the full fixture is requested instead
+    """
+    fixture = make_fixture(version=3)
+    apply_fixture(fixture)
+    base = json.loads(json.dumps(fixture[0]))
+    base["fields"]["object_version"] = 2
+    updated = json.loads(json.dumps(fixture[0]))
+    updated["fields"].update(name="renamed", object_version=4)
+
+    with patch("fractal_database.replication.tasks.request_full_fixtures") as mock_request:
+        load_data_from_dicts([encode_delta(base, updated)])
+
+    mock_request.assert_called_once_with([("fractal_database.database", fixture[0]["pk"])])
+    database = Database.objects.get(pk=fixture[0]["pk"])
+    assert database.name == "test-db"
+    assert database.object_version == 3
+
+
+def test_replication_delta_payloads_send_full_fixtures(database):
+    """
+    Tests that requested full fixtures are logged and pushed to the targets of the object's
+    database
+    """
+    set_current_device("responder")
+    database.name = "renamed"
+    database.save()
+    ReplicationLog.objects.update(deleted=True, delivered_at=timezone.now())
+
+    with patch.object(
+        DummyReplicationTarget, "replicate", ReplicationTarget.replicate
+    ), patch.object(DummyReplicationTarget, "push_replication_log", new=AsyncMock()) as mock_push:
+        async_to_sync(send_full_fixtures.original_func)(
+            [["fractal_database.database", str(database.pk)]], "responder"
+        )
+
+    mock_push.assert_awaited_once()
+    fixture = mock_push.await_args.args[0]
+    assert "base_version" not in fixture[0]
+    assert fixture[0]["fields"]["description"] == database.description
+    log = ReplicationLog.objects.get(full=True)
+    assert log.delivered_at is not None
+
+
+def test_replication_delta_payloads_send_full_fixtures_other_responder(database):
+    """
+    Tests that only the device named in a full fixtures request answers it
+    """
+    set_current_device("other")
+
+    with patch.object(DummyReplicationTarget, "push_replication_log", new=AsyncMock()) as mock_push:
+        async_to_sync(send_full_fixtures.original_func)(
+            [["fractal_database.database", str(database.pk)]], "responder"
+        )
+
+    mock_push.assert_not_awaited()
+    assert not ReplicationLog.objects.filter(full=True).exists()
+
+
+def test_replication_delta_payloads_request_full_fixtures(database):
+    """
+    Tests that full fixtures are requested in the database's room from another device
+    """
+    device = set_current_device("requester")
+    other = Device.objects.bulk_create([Device(name="other")])[0]
+    Database.devices.through.objects.bulk_create(
+        [Database.devices.through(database_id=database.pk, device_id=d.pk) for d in (device, other)]
+    )
+    target = DummyReplicationTarget.objects.get()
+    DummyReplicationTarget.objects.filter(pk=target.pk).update(
+        primary=True, metadata={"room_id": "!room:localhost"}
+    )
+    target_registry._cache.clear()
+
+    with patch.object(send_full_fixtures, "kicker") as mock_kicker:
+        kiq = mock_kicker.return_value.with_labels.return_value.kiq = AsyncMock()
+        request_full_fixtures([("fractal_database.database", database.pk)])
+
+    mock_kicker.return_value.with_labels.assert_called_once_with(room_id="!room:localhost")
+    kiq.assert_awaited_once_with([["fractal_database.database", str(database.pk)]], "other")
+
+
+def set_current_device(name: str) -> Device:
+    # created without signals, registering devices needs a homeserver
+    device = Device.objects.bulk_create([Device(name=name)])[0]
+    config = DatabaseConfig.objects.get()
+    config.current_device = device
+    config.save()
+    return device
+
+
+def pushed_fixtures(target) -> list:
+    """
+    Replicates the provided target and returns the fixtures that it pushed.
+    """
+    with patch.object(DummyReplicationTarget, "push_replication_log", new=AsyncMock()) as mock_push:
+        async_to_sync(ReplicationTarget.replicate)(target)
+    return [obj for call in mock_push.await_args_list for obj in call.args[0]]
+
+
+def test_replication_delta_payloads_full_fixture_for_new_targets(database):
+    """
+    Tests that targets that never received the base version of a delta get the full fixture
+    """
+    target = DummyReplicationTarget.objects.get()
+    pushed_fixtures(target)
+    late_target = DummyReplicationTarget.objects.create(name="late", database=database)
+    ReplicationLog.objects.filter(target_id=str(late_target.pk)).delete()
+    pushed_fixtures(target)
+
+    database.name = "renamed"
+    database.save()
+
+    delta = [obj for obj in pushed_fixtures(target) if obj["pk"] == str(database.pk)]
+    full = [obj for obj in pushed_fixtures(late_target) if obj["pk"] == str(database.pk)]
+    assert delta[0]["base_version"] == database.object_version - 1
+    assert "description" not in delta[0]["fields"]
+    assert "base_version" not in full[0]
+    assert full[0]["fields"]["description"] == database.description
+    assert full[0]["fields"]["name"] == "renamed"
+
+
+def test_replication_delta_payloads_full_fixture_after_debounce(database):
+    """
+    Tests that a delta whose base version was collapsed by debouncing, and so never pushed,
+    is pushed as a full fixture
+    """
+    target = DummyReplicationTarget.objects.get()
+    for i in range(3):
+        database.name = f"name-{i}"
+        database.save()
+    ReplicationLog.objects.update(date_created=timezone.now() - timedelta(seconds=120))
+
+    with patch.object(Database, "replication_debounce", 60):
+        fixtures = [obj for obj in pushed_fixtures(target) if obj["pk"] == str(database.pk)]
+
+    assert len(fixtures) == 1
+    assert "base_version" not in fixtures[0]
+    assert fixtures[0]["fields"]["name"] == "name-2"
+
+
+async def pending_pages(target) -> list:
+    return [page async for page in target.get_repl_log_pages()]
+
+
+def test_replication_delta_payloads_full_fixtures_loaded_together(database):
+    """
+    Tests that the data of the payloads pushed as full fixtures is loaded in a single query
+    """
+    target = DummyReplicationTarget.objects.get()
+    databases = [database, *(Database.objects.create(name=f"db-{i}") for i in range(4))]
+    pushed_fixtures(target)
+    late_target = DummyReplicationTarget.objects.create(name="late", database=database)
+    ReplicationLog.objects.filter(target_id=str(late_target.pk)).delete()
+    for instance in databases:
+        instance.name = f"{instance.name}-renamed"
+        instance.save()
+    logs = [
+        log
+        for page in async_to_sync(pending_pages)(late_target)
+        for log in page
+        if log.object_id in {str(instance.pk) for instance in databases}
+    ]
+
+    with CaptureQueriesContext(connection) as queries:
+        encoded = late_target.encode_replication_logs(logs)
+
+    payload_queries = [
+        query for query in queries if "fractal_database_replicationpayload" in query["sql"]
+    ]
+    assert len(payload_queries) == 1
+    fixtures = [json.loads(data) for data in encoded]
+    assert all("base_version" not in fixture for fixture in fixtures)
+    assert {fixture["fields"]["name"] for fixture in fixtures} == {
+        instance.name for instance in databases
+    }
@@ -0,0 +1,230 @@
+import asyncio
+import concurrent.futures.thread
+import threading
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from asgiref.sync import sync_to_async
+from django.test import override_settings
+from fractal_database.models import (
+    Database,
+    DummyReplicationTarget,
+    ReplicationLog,
+    ReplicationPayload,
+)
+from fractal_database.replication import dispatcher as dispatcher_module
+from fractal_database.replication.dispatcher import ReplicationDispatcher
+from fractal_database.signals import commit
+
+FILE_PATH = "fractal_database.signals"
+
+
+def make_target(name: str) -> MagicMock:
+    """
+    Returns a mock target whose replicate records the thread it was called from.
+    """
+    target = MagicMock(spec=DummyReplicationTarget)
+    target.name = name
+    target.pk = name
+    target.replicated_in = []
+
+    async def replicate():
+        target.replicated_in.append(threading.current_thread())
+
+    target.replicate = AsyncMock(side_effect=replicate)
+    return target
+
+
+@pytest.fixture
+def dispatcher():
+    dispatcher = ReplicationDispatcher(max_queue_size=2, max_concurrency=2)
+    yield dispatcher
+    dispatcher.stop(timeout=5)
+
+
+def test_replication_dispatcher_replicates_in_background_thread(dispatcher):
+    """
+    Tests that a woken up target is replicated on the dispatcher's thread.
+    """
+    target = make_target("test_target")
+
+    dispatcher.wake(target)
+    dispatcher.stop(timeout=5)
+
+    target.replicate.assert_awaited_once()
+    assert target.replicated_in[0] is not threading.current_thread()
+    assert target.replicated_in[0].name == "fractal-replication-dispatcher"
+
+
+def test_replication_dispatcher_wake_is_deduplicated(dispatcher):
+    """
+    Tests that waking a target that is already queued doesn't queue it again.
+    """
+    blocker = make_target("blocker")
+    release = threading.Event()
+    blocker.replicate = AsyncMock(side_effect=lambda: release.wait(5))
+    target = make_target("test_target")
+
+    # keep the worker busy so that the target stays queued
+    dispatcher.wake(blocker)
+    for _ in range(3):
+        dispatcher.wake(target)
+    release.set()
+    dispatcher.stop(timeout=5)
+
+    target.replicate.assert_awaited_once()
+
+
+def test_replication_dispatcher_queue_is_bounded(dispatcher):
+    """
+    Tests that wake ups beyond max_queue_size are dropped instead of growing the queue.
+    """
+    release = threading.Event()
+    targets = [make_target(f"target_{i}") for i in range(4)]
+    targets[0].replicate = AsyncMock(side_effect=lambda: release.wait(5))
+
+    with patch("fractal_database.replication.dispatcher.logger") as mock_logger:
+        for target in targets:
+            dispatcher.wake(target)
+    release.set()
+    dispatcher.stop(timeout=5)
+
+    mock_logger.warning.assert_called()
+    replicated = [target for target in targets if target.replicate.await_count]
+    assert len(replicated) <= 1 + dispatcher.max_queue_size
+    assert len(replicated) < len(targets)
+
+
+def test_replication_dispatcher_targets_replicate_concurrently(dispatcher):
+    """
+    Tests that a slow target doesn't hold up replication of other targets.
+    """
+    fast_done = threading.Event()
+    slow = make_target("slow")
+    fast = make_target("fast")
+
+    async def slow_replicate():
+        for _ in range(500):
+            if fast_done.is_set():
+                return
+            await asyncio.sleep(0.01)
+        raise Exception("fast target never replicated")
+
+    slow.replicate = AsyncMock(side_effect=slow_replicate)
+    fast.replicate = AsyncMock(side_effect=lambda: fast_done.set())
+
+    with patch("fractal_database.replication.dispatcher.logger") as mock_logger:
+        dispatcher.wake(slow)
+        dispatcher.wake(fast)
+        dispatcher.stop(timeout=10)
+
+    fast.replicate.assert_awaited_once()
+    slow.replicate.assert_awaited_once()
+    mock_logger.exception.assert_not_called()
+
+
+def test_replication_dispatcher_target_never_replicates_concurrently(dispatcher):
+    """
+    Tests that waking a target while it is replicating runs it again after the current
+    run finishes instead of concurrently.
+    """
+    target = make_target("test_target")
+    started = threading.Event()
+    running = []
+    max_running = []
+
+    async def replicate():
+        running.append(True)
+        max_running.append(len(running))
+        started.set()
+        await asyncio.sleep(0.05)
+        running.pop()
+
+    target.replicate = AsyncMock(side_effect=replicate)
+
+    dispatcher.wake(target)
+    assert started.wait(5)
+    assert dispatcher.status()[f"fractal_database.dummyreplicationtarget:{target.pk}"] == {
+        "queued": False,
+        "replicating": True,
+    }
+    dispatcher.wake(target)
+    dispatcher.wake(target)
+    dispatcher.stop(timeout=5)
+
+    assert target.replicate.await_count == 2
+    assert max(max_running) == 1
+
+
+@pytest.mark.django_db(transaction=True)
+def test_replication_dispatcher_queue_depths(dispatcher):
+    """
+    Tests that queue_depths reports the number of pending logs per target.
+    """
+    database = Database.objects.create(name="test-database")
+    target = DummyReplicationTarget.objects.create(name="dummy", database=database)
+    ReplicationLog.objects.all().delete()
+
+    payload = ReplicationPayload.for_instance(database)
+    for deleted in (False, False, True):
+        ReplicationLog.objects.create(
+            payload=payload, target=target, instance=database, deleted=deleted
+        )
+
+    assert dispatcher.queue_depths() == {f"fractal_database.dummyreplicationtarget:{target.pk}": 2}
+
+
+def test_replication_dispatcher_drains_after_executor_shutdown(dispatcher):
+    """
+    Tests that queued replication that makes sync calls still finishes once concurrent.futures
+    stops accepting work, which happens before atexit hooks run.
+    """
+    target = make_target("test_target")
+    release = threading.Event()
+    sync_threads = []
+
+    async def replicate():
+        await sync_to_async(release.wait)(5)
+        await sync_to_async(lambda: sync_threads.append(threading.current_thread()))()
+
+    target.replicate = AsyncMock(side_effect=replicate)
+
+    dispatcher.wake(target)
+    with patch.object(concurrent.futures.thread, "_shutdown", True):
+        release.set()
+        with patch("fractal_database.replication.dispatcher.logger") as mock_logger:
+            dispatcher.stop(timeout=5)
+
+    target.replicate.assert_awaited_once()
+    mock_logger.exception.assert_not_called()
+    assert sync_threads[0].name == "fractal-replication-dispatcher-sync"
+
+
+def test_replication_dispatcher_stopped_at_exit():
+    """
+    Tests that the process wide dispatcher is stopped by an atexit hook.
+    """
+    with patch.object(dispatcher_module, "_dispatcher", None), patch.object(
+        ReplicationDispatcher, "wake_pending"
+    ), patch("fractal_database.replication.dispatcher.atexit.register") as mock_register:
+        dispatcher = dispatcher_module.get_dispatcher()
+
+    mock_register.assert_called_once_with(dispatcher.stop)
+    dispatcher.stop(timeout=5)
+
+
+@override_settings(FRACTAL_DATABASE_BACKGROUND_REPLICATION=True)
+def test_replication_dispatcher_commit_wakes_dispatcher():
+    """
+    Tests that commit hands the target off to the dispatcher instead of replicating
+    in the committing thread when background replication is enabled.
+    """
+    target = make_target("test_target")
+
+    with patch(f"{FILE_PATH}.get_dispatcher") as mock_get_dispatcher:
+        with patch(f"{FILE_PATH}.clear_deferred_replications") as mock_clear:
+            commit(target)
+
+    mock_get_dispatcher.return_value.wake.assert_called_once_with(target)
+    target.replicate.assert_not_called()
+    mock_clear.assert_called_once_with(target.name)
@@ -0,0 +1,197 @@
+import json
+import time
+from datetime import timedelta
+from unittest.mock import MagicMock, patch
+
+import pytest
+from django.core.serializers import serialize
+from django.db import connection
+from django.db.models.signals import post_save
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from fractal_database.models import Database, Device, DummyReplicationTarget
+from fractal_database.replication.fixtures import (
+    apply_fixture,
+    drop_stale_objects,
+    sort_models,
+)
+from fractal_database.replication.tasks import load_data_from_dicts
+
+pytestmark = pytest.mark.django_db(transaction=True)
+
+LAST_WEEK = (timezone.now() - timedelta(days=7)).replace(microsecond=0)
+
+
+def make_fixture(num_devices: int = 2, version: int = 3) -> list:
+    """
+    Returns a fixture of a database with num_devices devices and a replication target.
+    The target is serialized first so that it comes before the database it depends on.
+    """
+    devices = [
+        Device(
+            name=f"device-{i}",
+            object_version=version,
+            date_created=LAST_WEEK,
+            date_modified=LAST_WEEK,
+        )
+        for i in range(num_devices)
+    ]
+    database = Database(
+        name="test-db", object_version=version, date_created=LAST_WEEK, date_modified=LAST_WEEK
+    )
+    target = DummyReplicationTarget(
+        name="dummy",
+        database=database,
+        object_version=version,
+        date_created=LAST_WEEK,
+        date_modified=LAST_WEEK,
+    )
+    fixture = json.loads(serialize("json", [target, database, *devices]))
+    fixture[1]["fields"]["devices"] = [str(device.pk) for device in devices]
+    return fixture
+
+
+def test_replication_fixtures_sort_models():
+    """
+    Tests that models are sorted after the models they depend on
+    """
+    assert sort_models([DummyReplicationTarget, Database, Device]) == [
+        Device,
+        Database,
+        DummyReplicationTarget,
+    ]
+
+
+def test_replication_fixtures_apply_fixture_creates_objects():
+    """
+    Tests that apply_fixture saves objects raw: serialized values are written as is
+    """
+    fixture = make_fixture()
+
+    assert apply_fixture(fixture) == 4
+
+    database = Database.objects.get(pk=fixture[1]["pk"])
+    target = DummyReplicationTarget.objects.get(pk=fixture[0]["pk"])
+    assert target.database == database
+    assert database.object_version == 3
+    assert database.date_modified == LAST_WEEK
+    assert sorted(str(d.pk) for d in database.devices.all()) == sorted(
+        fixture[1]["fields"]["devices"]
+    )
+
+
+def test_replication_fixtures_apply_fixture_updates_objects():
+    """
+    Tests that applying a fixture again updates rows and many to many relations in place
+    """
+    fixture = make_fixture(num_devices=3)
+    apply_fixture(json.dumps(fixture))
+
+    fixture[1]["fields"]["name"] = "renamed"
+    fixture[1]["fields"]["object_version"] = 4
+    fixture[1]["fields"]["devices"] = fixture[1]["fields"]["devices"][:1]
+    apply_fixture(json.dumps(fixture))
+
+    database = Database.objects.get(pk=fixture[1]["pk"])
+    assert database.name == "renamed"
+    assert database.object_version == 4
+    assert [str(d.pk) for d in database.devices.all()] == fixture[1]["fields"]["devices"]
+    assert Device.objects.count() == 3
+    assert Database.objects.count() == 1
+
+
+def test_replication_fixtures_apply_fixture_sends_raw_signals():
+    """
+    Tests that post_save is sent with raw=True and the right created flag
+    """
+    fixture = make_fixture(num_devices=1)
+    receiver = MagicMock()
+    post_save.connect(receiver, sender=Database, weak=False)
+    try:
+        apply_fixture(fixture)
+        apply_fixture(fixture)
+    finally:
+        post_save.disconnect(receiver, sender=Database)
+
+    assert receiver.call_count == 2
+    first, second = receiver.call_args_list
+    assert first.kwargs["raw"] and first.kwargs["created"]
+    assert second.kwargs["raw"] and not second.kwargs["created"]
+
+
+def test_replication_fixtures_load_data_from_dicts_bulk(settings):
+    """
+    Tests that load_data_from_dicts uses apply_fixture when it is enabled
+    """
+    settings.FRACTAL_DATABASE_BULK_APPLY_FIXTURES = True
+    fixture = make_fixture()
+
+    load_data_from_dicts(json.dumps(fixture))
+
+    assert Database.objects.get(pk=fixture[1]["pk"]).devices.count() == 2
+
+
+def test_replication_fixtures_apply_fixture_throughput():
+    """
+    Benchmarks the objects per second loaded by apply_fixture against loaddata.
+    apply_fixture's number of queries doesn't grow with the number of objects.
+    """
+    num_devices = 500
+    fixture = make_fixture(num_devices=num_devices)
+
+    start = time.perf_counter()
+    with CaptureQueriesContext(connection) as queries:
+        apply_fixture(fixture)
+    bulk_elapsed = time.perf_counter() - start
+    bulk_queries = len(queries)
+
+    Database.objects.all().delete()
+    Device.objects.all().delete()
+
+    start = time.perf_counter()
+    load_data_from_dicts(json.dumps(fixture))
+    loaddata_elapsed = time.perf_counter() - start
+
+    num_objects = len(fixture)
+    print(
+        f"apply_fixture: {num_objects / bulk_elapsed:.0f} objects/s ({bulk_queries} queries), "
+        f"loaddata: {num_objects / loaddata_elapsed:.0f} objects/s"
+    )
+    assert bulk_queries < 20
+    assert bulk_elapsed < loaddata_elapsed
+
+
+def test_replication_fixtures_drop_stale_objects():
+    """
+    Tests that objects that aren't newer than their local copy are dropped with one
+    query per model
+    """
+    fixture = make_fixture(num_devices=2, version=3)
+    apply_fixture(fixture)
+
+    new_device = make_fixture(num_devices=1)[2]
+    fixture[0]["fields"]["object_version"] = 4  # newer target
+    fixture[1]["fields"]["object_version"] = 2  # older database
+    fixture.append(new_device)
+
+    with CaptureQueriesContext(connection) as queries:
+        fresh, skipped = drop_stale_objects(fixture)
+
+    assert len(queries) == 3
+    assert skipped == 3
+    assert [obj["pk"] for obj in fresh] == [fixture[0]["pk"], new_device["pk"]]
+
+
+def test_replication_fixtures_replay_caught_up_fixture():
+    """
+    Tests that replaying a fixture that is already loaded doesn't load anything
+    """
+    fixture = make_fixture(num_devices=50)
+    apply_fixture(fixture)
+
+    with patch("django.core.management.commands.loaddata.Command.handle") as mock_handle:
+        with CaptureQueriesContext(connection) as queries:
+            load_data_from_dicts(json.dumps(fixture))
+
+    mock_handle.assert_not_called()
+    assert len(queries) == 3
@@ -0,0 +1,75 @@
+from unittest.mock import patch
+
+from fractal_database.models import (
+    App,
+    AppCatalog,
+    AppInstanceConfig,
+    Database,
+    Device,
+    DummyReplicationTarget,
+    ReplicatedInstanceConfig,
+    ReplicationTarget,
+)
+from fractal_database.replication import graph
+from fractal_database.replication.fixtures import sort_models
+from fractal_database.replication.graph import (
+    get_relationship_plan,
+    model_order,
+    replicated_models,
+)
+
+
+def test_replication_graph_plans_compiled_at_ready():
+    """
+    Tests that the relationship plans of the replicated models are computed when the app is ready
+    """
+    assert App in graph._plans
+    plan = get_relationship_plan(App)
+
+    assert [field.name for field in plan.fields] == ["metadata", "database", "devices"]
+    assert [field.name for _, field in plan.traversal] == ["metadata", "database", "devices"]
+    assert get_relationship_plan(App) is plan
+
+
+def test_replication_graph_plan_skips_non_replicated_relations():
+    """
+    Tests that relations to models that aren't replicated are not traversed
+    """
+    plan = get_relationship_plan(ReplicatedInstanceConfig)
+
+    assert {field.name for field in plan.fields} == {"instance", "content_type"}
+    assert [field.name for _, field in plan.traversal] == ["instance"]
+
+
+def test_replication_graph_relationship_fields_not_introspected():
+    """
+    Tests that looking up the relationship fields of an instance doesn't introspect its model
+    """
+    app = App(name="app")
+    with patch.object(App._meta, "get_fields") as get_fields:
+        fields = app._get_relationship_fields()
+
+    get_fields.assert_not_called()
+    assert [field.name for field in fields] == ["metadata", "database", "devices"]
+
+
+def test_replication_graph_model_order():
+    """
+    Tests that the concrete replicated models are ordered after the models they depend on
+    """
+    models = replicated_models()
+
+    assert ReplicationTarget not in models
+    for dependency, model in [
+        (Device, Database),
+        (Database, App),
+        (AppCatalog, App),
+        (App, AppInstanceConfig),
+        (ReplicatedInstanceConfig, DummyReplicationTarget),
+    ]:
+        assert models.index(dependency) < models.index(model)
+    assert set(model_order()) == set(models)
+
+    assert sort_models([App, Database, Device, AppCatalog]) == [
+        model for model in models if model in {App, Database, Device, AppCatalog}
+    ]
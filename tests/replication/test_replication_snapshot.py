@@ -0,0 +1,212 @@
+import gzip
+import json
+import os
+import time
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+from uuid import uuid4
+
+import pytest
+from asgiref.sync import async_to_sync
+from fractal_database.controllers.fractal_database_controller import (
+    FractalDatabaseController,
+)
+from fractal_database.models import (
+    Database,
+    Device,
+    DummyReplicationTarget,
+    ReplicatedInstanceConfig,
+    ReplicationTarget,
+    Snapshot,
+    SyncCheckpoint,
+)
+from fractal_database.replication.bootstrap import RoomSync
+from fractal_database.replication.fixtures import apply_fixture
+from fractal_database.replication.snapshot import (
+    dump_snapshot,
+    restore_snapshot,
+    snapshot_models,
+)
+from fractal_database.replication.tasks import replicate_fixture
+
+pytestmark = pytest.mark.django_db(transaction=True)
+
+# set to 100000 to benchmark against a database of 100k objects
+BENCHMARK_OBJECTS = int(os.environ.get("FRACTAL_SNAPSHOT_BENCHMARK_OBJECTS", 2000))
+
+
+def make_fixture(num_devices: int) -> list:
+    """
+    Returns a fixture of a database with num_devices devices.
+    """
+    fields = {
+        "date_created": "2024-01-01T00:00:00Z",
+        "date_modified": "2024-01-01T00:00:00Z",
+        "deleted": False,
+        "object_version": 2,
+    }
+    devices = [
+        {
+            "model": "fractal_database.device",
+            "pk": str(uuid4()),
+            "fields": {**fields, "name": f"device-{i}", "display_name": None},
+        }
+        for i in range(num_devices)
+    ]
+    database = {
+        "model": "fractal_database.database",
+        "pk": str(uuid4()),
+        "fields": {
+            **fields,
+            "name": "test-db",
+            "devices": [device["pk"] for device in devices],
+        },
+    }
+    return [*devices, database]
+
+
+def clear_database():
+    Database.objects.all().delete()
+    Device.objects.all().delete()
+
+
+def test_replication_snapshot_models():
+    """
+    Tests that snapshots include concrete replicated models in dependency order
+    """
+    models = snapshot_models()
+
+    assert ReplicationTarget not in models
+    assert Snapshot in models
+    assert models.index(Device) < models.index(Database)
+
+
+def test_replication_snapshot_dump_and_restore(tmp_path):
+    """
+    Tests that a restored snapshot matches the database it was dumped from
+    """
+    fixture = make_fixture(num_devices=3)
+    apply_fixture(fixture)
+    path = str(tmp_path / "snapshot.jsonl.gz")
+
+    database = Database.objects.get(pk=fixture[-1]["pk"])
+    assert dump_snapshot(path, database, chunk_size=2) == 4
+
+    clear_database()
+    assert restore_snapshot(path, chunk_size=2) == 4
+
+    database = Database.objects.get(pk=fixture[-1]["pk"])
+    assert database.object_version == 2
+    assert sorted(str(d.pk) for d in database.devices.all()) == sorted(
+        fixture[-1]["fields"]["devices"]
+    )
+
+
+def test_replication_snapshot_restore_keeps_newer_objects(tmp_path):
+    """
+    Tests that restoring a snapshot doesn't overwrite objects that are newer locally
+    """
+    fixture = make_fixture(num_devices=1)
+    apply_fixture(fixture)
+    path = str(tmp_path / "snapshot.jsonl.gz")
+    dump_snapshot(path, Database.objects.get(pk=fixture[-1]["pk"]))
+
+    Database.objects.filter(pk=fixture[-1]["pk"]).update(name="renamed", object_version=3)
+
+    assert restore_snapshot(path) == 0
+    assert Database.objects.get(pk=fixture[-1]["pk"]).name == "renamed"
+
+
+def test_replication_snapshot_only_includes_database(tmp_path):
+    """
+    Tests that a snapshot only includes the objects replicated to its database
+    """
+    fixture = make_fixture(num_devices=1)
+    other_fixture = make_fixture(num_devices=1)
+    other_fixture[0]["fields"]["name"] = "other-device"
+    apply_fixture(fixture + other_fixture)
+    database = Database.objects.get(pk=fixture[-1]["pk"])
+    other_database = Database.objects.get(pk=other_fixture[-1]["pk"])
+    target = DummyReplicationTarget.objects.create(name="dummy", database=database)
+    other_target = DummyReplicationTarget.objects.create(name="other", database=other_database)
+    snapshot = Snapshot.objects.create(url="https://localhost/snapshot", sync_token="token")
+    config = ReplicatedInstanceConfig.objects.create(instance=snapshot)
+    target.instances.add(config)
+    other_config = ReplicatedInstanceConfig.objects.create(instance=other_database)
+    other_target.instances.add(other_config)
+    path = str(tmp_path / "snapshot.jsonl.gz")
+
+    dump_snapshot(path, database)
+
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        dumped = {json.loads(line)["pk"] for line in f}
+    assert {str(database.pk), str(target.pk), str(snapshot.pk), str(config.pk)} <= dumped
+    assert fixture[0]["pk"] in dumped
+    for obj in [other_database, other_target, other_config]:
+        assert str(obj.pk) not in dumped
+    assert other_fixture[0]["pk"] not in dumped
+
+
+def test_replication_snapshot_sync_token():
+    """
+    Tests that snapshots are taken at the room's sync checkpoint, and that taking one without
+    a checkpoint fails instead of creating one
+    """
+    get_sync_token = async_to_sync(FractalDatabaseController._get_sync_token)
+
+    with pytest.raises(Exception, match="No sync checkpoint found for !room:localhost"):
+        get_sync_token(MagicMock(), "!room:localhost")
+    assert not SyncCheckpoint.objects.exists()
+
+    SyncCheckpoint.objects.create(room_id="!room:localhost", since_token="token")
+    assert get_sync_token(MagicMock(), "!room:localhost") == "token"
+
+
+class FakeQueue:
+    """
+    Serves the tasks of a room 100 at a time like MatrixQueue.get_tasks_from_room.
+    """
+
+    task_types = SimpleNamespace(task="taskiq.replication.task")
+
+    def __init__(self, tasks: list):
+        self.tasks = tasks
+
+    async def get_tasks_from_room(self, room_id, task_filter=None, start="", end=""):
+        page = int(start) if start else 0
+        tasks = self.tasks[page * 100 : (page + 1) * 100]
+        return tasks, str(page + 1) if tasks else None
+
+
+def test_replication_snapshot_restore_benchmark(tmp_path):
+    """
+    Benchmarks restoring a snapshot against replaying every replication task of a room.
+    """
+    fixture = make_fixture(num_devices=BENCHMARK_OBJECTS - 1)
+    # replicated one object per task. The database comes last since it depends on the devices
+    tasks = [
+        SimpleNamespace(
+            id=str(i),
+            data={"task_name": replicate_fixture.task_name, "args": [json.dumps([obj])]},
+        )
+        for i, obj in enumerate(fixture)
+    ]
+
+    start = time.perf_counter()
+    async_to_sync(RoomSync("!room:localhost", FakeQueue(tasks)).run)()
+    replay_elapsed = time.perf_counter() - start
+
+    path = str(tmp_path / "snapshot.jsonl.gz")
+    dump_snapshot(path, Database.objects.get(pk=fixture[-1]["pk"]))
+    clear_database()
+
+    start = time.perf_counter()
+    restored = restore_snapshot(path)
+    restore_elapsed = time.perf_counter() - start
+
+    print(
+        f"{BENCHMARK_OBJECTS} objects: replay {replay_elapsed:.2f}s, "
+        f"snapshot restore {restore_elapsed:.2f}s ({os.path.getsize(path)} bytes)"
+    )
+    assert restored == BENCHMARK_OBJECTS
+    assert restore_elapsed < replay_elapsed
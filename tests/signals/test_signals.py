@@ -191,8 +191,7 @@ def test_signals_defer_replication_no_defered_replications():
 
 def test_signals_defer_replication_target_in_defered_replications():
     """
-    Tests the case where the target is in the defered replication dictionary of
-    _thread_local
+    Tests the case where the target was already deferred in the current transaction
     """
 
     # make a mock target object and generate a name for it
@@ -201,18 +200,22 @@ def test_signals_defer_replication_target_in_defered_replications():
 
     # patch the transaction and have it evaluate to True
     with patch(f"{FILE_PATH}.transaction", new=MagicMock()) as mock_transaction:
-        mock_transaction.get_connection = MagicMock()
-        mock_transaction.get_connection.return_value = MagicMock()
-        mock_transaction.get_connection.return_value.in_atomic_block = True
+        mock_connection = mock_transaction.get_connection.return_value
+        mock_connection.in_atomic_block = True
+        mock_connection.run_on_commit = []
+        mock_transaction.on_commit.side_effect = lambda func: mock_connection.run_on_commit.append(
+            (set(), func, False)
+        )
 
         # patch the _thread_locals and the logger
         with patch(f"{FILE_PATH}._thread_locals") as mock_thread_locals:
-            # set the defered_replications dictionary to include the target
-            mock_thread_locals.defered_replications = {mock_target.name: [mock_target]}
+            mock_thread_locals.defered_replications = {}
+            mock_thread_locals.transaction_logs = None
+            defer_replication(mock_target)
             defer_replication(mock_target)
 
-    # verify that on_commit was not called
-    mock_transaction.on_commit.assert_not_called()
+    # verify that on_commit was only called for the first deferral
+    mock_transaction.on_commit.assert_called_once()
 
     # verify that the target is in defered_replications
     assert mock_target.name in mock_thread_locals.defered_replications
@@ -0,0 +1,90 @@
+import asyncio
+from unittest.mock import MagicMock, patch
+
+from asgiref.sync import async_to_sync
+from fractal_database.replication.tasks import load_data_from_dicts, replicate_fixture
+from fractal_database.signals import disable_for_loaddata, in_replay_mode, replay_mode
+
+
+def test_signals_replay_mode_disables_handler():
+    """
+    Tests that handlers decorated with disable_for_loaddata are not called in replay mode
+    """
+    handler = MagicMock()
+    wrapped = disable_for_loaddata(handler)
+
+    with replay_mode():
+        wrapped(sender=None, instance=None)
+    handler.assert_not_called()
+
+    wrapped(sender=None, instance=None)
+    handler.assert_called_once()
+
+
+def test_signals_replay_mode_instance_loaded_from_fixture():
+    """
+    Tests that handlers are not called for instances that were saved from a fixture
+    """
+    handler = MagicMock()
+    wrapped = disable_for_loaddata(handler)
+    instance = MagicMock(_loaded_from_fixture=True)
+
+    wrapped(sender=None, instance=instance)
+
+    handler.assert_not_called()
+
+
+def test_signals_replay_mode_is_reset():
+    """
+    Tests that replay mode is reset when leaving the context manager, even on error
+    """
+    try:
+        with replay_mode():
+            assert in_replay_mode()
+            raise ValueError()
+    except ValueError:
+        pass
+
+    assert not in_replay_mode()
+
+
+def test_signals_replay_mode_visible_to_coroutines():
+    """
+    Tests that replay mode is visible to coroutines and doesn't leak to other threads
+    """
+
+    async def check():
+        return in_replay_mode()
+
+    with replay_mode():
+        assert asyncio.run(check())
+        # sync_to_async/async_to_sync run in other threads
+        assert async_to_sync(check)()
+
+    assert not asyncio.run(check())
+
+
+def test_signals_load_data_from_dicts_sets_replay_mode():
+    """
+    Tests that fixtures are loaded in replay mode
+    """
+    replaying = []
+    with patch("django.core.management.commands.loaddata.Command.handle") as mock_handle:
+        mock_handle.side_effect = lambda *args, **kwargs: replaying.append(in_replay_mode())
+        load_data_from_dicts("[]")
+
+    assert replaying == [True]
+    assert not in_replay_mode()
+
+
+async def test_signals_replicate_fixture_sets_replay_mode():
+    """
+    Tests that replay mode is set in the executor thread that replicate_fixture loads data in
+    """
+    replaying = []
+    with patch("fractal_database.replication.tasks.load_data_from_dicts") as mock_load:
+        mock_load.side_effect = lambda fixture: replaying.append(in_replay_mode())
+        await replicate_fixture("[]")
+
+    assert replaying == [True]
+    assert not in_replay_mode()